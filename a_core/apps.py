@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class ACoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'a_core'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from a_core.runtime_config import invalidate_on_commit
+
+        # Staff-controlled runtime config: drop every process's snapshot on change.
+        for model in ('a_home.SiteSetting', 'a_rtchat.GlobalAnnouncement', 'a_users.BetaFeature'):
+            post_save.connect(invalidate_on_commit, sender=model, dispatch_uid=f"runtime_config_save:{model}")
+            post_delete.connect(invalidate_on_commit, sender=model, dispatch_uid=f"runtime_config_delete:{model}")
@@ -2,43 +2,20 @@ from __future__ import annotations
 
 import json
 
-from django.core.cache import cache
 from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.views.decorators.http import require_GET, require_POST
 
-
-MAINTENANCE_CACHE_KEY = "vixo:maintenance_enabled"
-MAINTENANCE_DB_KEY = "maintenance_enabled"
-
-# Short TTL so multi-instance setups without shared cache still converge quickly.
-MAINTENANCE_CACHE_TTL_SECONDS = 3
+from a_core import runtime_config
+from a_core.runtime_config import MAINTENANCE_DB_KEY
 
 
 def is_maintenance_enabled() -> bool:
-    # Cache first (fast path)
-    try:
-        cached = cache.get(MAINTENANCE_CACHE_KEY, None)
-        if cached is not None:
-            return bool(cached)
-    except Exception:
-        cached = None
-
-    # DB fallback (canonical)
-    enabled = False
-    try:
-        from a_home.models import SiteSetting
-
-        enabled = bool(SiteSetting.get_bool(MAINTENANCE_DB_KEY, default=False))
-    except Exception:
-        enabled = False
-
-    # Best-effort cache fill
+    # Process-local snapshot (a_core.runtime_config); no cache or DB hit per call.
     try:
-        cache.set(MAINTENANCE_CACHE_KEY, bool(enabled), timeout=MAINTENANCE_CACHE_TTL_SECONDS)
+        return runtime_config.maintenance_enabled()
     except Exception:
-        pass
-    return bool(enabled)
+        return False
 
 
 def set_maintenance_enabled(enabled: bool) -> None:
@@ -49,14 +26,12 @@ def set_maintenance_enabled(enabled: bool) -> None:
         SiteSetting.set_bool(MAINTENANCE_DB_KEY, bool(enabled))
     except Exception:
         # Best-effort; DB might be migrating or unavailable.
-        pass
-
-    # Also cache locally for speed.
-    try:
-        cache.set(MAINTENANCE_CACHE_KEY, bool(enabled), timeout=MAINTENANCE_CACHE_TTL_SECONDS)
-    except Exception:
         return
 
+    # The SiteSetting save already schedules an invalidation on commit; do it now
+    # too so this request's process sees the new value immediately.
+    runtime_config.invalidate()
+
 
 @require_GET
 def maintenance_page_view(request: HttpRequest) -> HttpResponse:
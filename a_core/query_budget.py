@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import functools
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+
+# Query budgets for hot views.
+#
+# QueryRecorder wraps a connection with an execute wrapper (the same hook ws_metrics
+# uses) and keeps every statement plus its "shape": the SQL with literals, parameter
+# placeholders and IN (...) lists collapsed, so "the same query for each row" shows up
+# as one shape repeated many times. query_budget() is the assertion form, usable as a
+# context manager or decorator: it fails when a block issues more than `max_queries`
+# statements or repeats one shape more than QUERY_BUDGET_REPEAT_LIMIT times (an N+1).
+#
+# VIEW_BUDGETS is the per-view table the regression tests and the query_budget_report
+# command check against: a few statements above each view's steady-state count. The
+# tests also require the count to stay the same as messages and members grow.
+
+DEFAULT_REPEAT_LIMIT = 3
+
+# url name -> max queries for one request
+VIEW_BUDGETS = {
+    'chatroom': 25,
+    'chat-poll': 15,
+    'chat-older': 15,
+    'chat-config': 10,
+    'profile-user': 15,
+    'notifications-dropdown': 10,
+    'admin-analytics': 25,
+}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def repeat_limit() -> int:
+    try:
+        return max(1, int(getattr(settings, 'QUERY_BUDGET_REPEAT_LIMIT', DEFAULT_REPEAT_LIMIT)))
+    except Exception:
+        return DEFAULT_REPEAT_LIMIT
+
+
+def sql_shape(sql: str) -> str:
+    """The statement with every literal replaced, so per-row repeats compare equal."""
+    shape = _STRING_RE.sub('?', sql)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _PLACEHOLDER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """Record the statements a block sends to one database alias."""
+
+    def __init__(self, using: str = 'default'):
+        self.using = using
+        self.queries: list[str] = []
+        self._cm = None
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.queries = []
+        self._cm = connections[self.using].execute_wrapper(self._record)
+        self._cm.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        cm, self._cm = self._cm, None
+        return cm.__exit__(*exc)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    def shapes(self) -> Counter:
+        return Counter(sql_shape(sql) for sql in self.queries)
+
+    def repeated(self, limit: int | None = None) -> list[tuple[str, int]]:
+        """Shapes issued more than `limit` times, most repeated first."""
+        limit = repeat_limit() if limit is None else limit
+        return [(shape, n) for shape, n in self.shapes().most_common() if n > limit]
+
+    def problems(self, max_queries: int | None, limit: int | None = None) -> list[str]:
+        out = []
+        if max_queries is not None and self.count > max_queries:
+            out.append(f"{self.count} queries, budget is {max_queries}")
+        for shape, n in self.repeated(limit):
+            out.append(f"N+1: {n}x {shape[:200]}")
+        return out
+
+
+class query_budget(QueryRecorder):
+    """Fail the block (or decorated function) when it breaks its query budget.
+
+        with query_budget(10):
+            client.get(url)
+
+        @query_budget(5, repeat_limit=1)
+        def test_something(self): ...
+    """
+
+    def __init__(self, max_queries: int | None = None, *, repeat_limit: int | None = None, using: str = 'default', label: str = ''):
+        super().__init__(using=using)
+        self.max_queries = max_queries
+        self.limit = repeat_limit
+        self.label = label
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if exc_type is not None:
+            return False
+        problems = self.problems(self.max_queries, self.limit)
+        if problems:
+            head = f"Query budget exceeded{f' for {self.label}' if self.label else ''}:"
+            raise QueryBudgetExceeded("\n  ".join([head, *problems]))
+        return False
+
+    def __call__(self, func):
+        # A fresh recorder per call, so a decorated function is re-entrant.
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with query_budget(self.max_queries, repeat_limit=self.limit, using=self.using, label=self.label or func.__qualname__):
+                return func(*args, **kwargs)
+        return inner
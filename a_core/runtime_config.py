@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Process-local snapshot of staff-controlled runtime config:
+# - SiteSetting flags (maintenance mode),
+# - the active GlobalAnnouncement message,
+# - BetaFeature rows.
+#
+# Hot-path reads (every request, every WebSocket frame) are dict lookups on the
+# snapshot. Staff changes bump a version stamp in the shared cache (see the model
+# signals wired in a_core.apps); each process compares its snapshot's version against
+# it at most every RUNTIME_CONFIG_VERSION_CHECK_SECONDS, and reloads regardless after
+# RUNTIME_CONFIG_TTL_SECONDS so a lost bump (cache flush, no shared cache) still
+# converges. The process that made the change reloads immediately.
+
+VERSION_KEY = 'runtime_config:version'
+MAINTENANCE_DB_KEY = 'maintenance_enabled'
+
+_lock = threading.Lock()
+_snapshot: dict | None = None
+
+
+def _check_interval() -> float:
+    try:
+        return max(0.0, float(getattr(settings, 'RUNTIME_CONFIG_VERSION_CHECK_SECONDS', 1.0)))
+    except Exception:
+        return 1.0
+
+
+def _ttl() -> float:
+    try:
+        return max(1.0, float(getattr(settings, 'RUNTIME_CONFIG_TTL_SECONDS', 60)))
+    except Exception:
+        return 60.0
+
+
+def _shared_version():
+    try:
+        return cache.get(VERSION_KEY)
+    except Exception:
+        return None
+
+
+def _load(version) -> dict:
+    from a_home.models import SiteSetting
+    from a_rtchat.models import GlobalAnnouncement
+    from a_users.models import BetaFeature
+
+    try:
+        flags = dict(SiteSetting.objects.values_list('key', 'bool_value'))
+    except Exception:
+        flags = {}
+    try:
+        ann = GlobalAnnouncement.objects.filter(is_active=True).order_by('-updated_at').values_list('message', flat=True).first()
+    except Exception:
+        ann = None
+    try:
+        beta = {
+            row['slug']: row
+            for row in BetaFeature.objects.values('slug', 'title', 'is_enabled', 'requires_founder_club')
+        }
+    except Exception:
+        beta = {}
+
+    now = time.monotonic()
+    return {
+        'version': version,
+        'flags': {k: bool(v) for k, v in flags.items()},
+        'announcement': (ann or '').strip(),
+        'beta': beta,
+        'check_at': now + _check_interval(),
+        'expires_at': now + _ttl(),
+    }
+
+
+def snapshot() -> dict:
+    """The current config snapshot (reloaded when stale or when the shared version moved)."""
+    global _snapshot
+    snap = _snapshot
+    now = time.monotonic()
+    if snap is not None and now < snap['check_at']:
+        return snap
+
+    version = _shared_version()
+    if snap is not None and now < snap['expires_at'] and version == snap['version']:
+        snap['check_at'] = now + _check_interval()
+        return snap
+
+    with _lock:
+        # Another thread may have reloaded while we waited.
+        if _snapshot is not None and _snapshot is not snap and time.monotonic() < _snapshot['check_at']:
+            return _snapshot
+        _snapshot = _load(version)
+        return _snapshot
+
+
+def invalidate() -> None:
+    """Bump the shared version and drop this process's snapshot. Call after committing a change."""
+    global _snapshot
+    try:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+    except Exception:
+        pass
+    with _lock:
+        _snapshot = None
+
+
+def invalidate_on_commit(*args, **kwargs) -> None:
+    """Signal receiver: invalidate once the surrounding transaction commits."""
+    transaction.on_commit(invalidate)
+
+
+# Readers -----------------------------------------------------------------------
+
+def flag(key: str, default: bool = False) -> bool:
+    return bool(snapshot()['flags'].get(key, default))
+
+
+def maintenance_enabled() -> bool:
+    return flag(MAINTENANCE_DB_KEY, False)
+
+
+def announcement_message() -> str:
+    return snapshot()['announcement']
+
+
+def beta_feature(slug: str) -> dict | None:
+    return snapshot()['beta'].get(slug)
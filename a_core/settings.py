@@ -641,8 +641,23 @@ CALL_EVENT_RATE_PERIOD = int(os.environ.get('CALL_EVENT_RATE_PERIOD', '60'))
 AGORA_TOKEN_RATE_LIMIT = int(os.environ.get('AGORA_TOKEN_RATE_LIMIT', '30'))
 AGORA_TOKEN_RATE_PERIOD = int(os.environ.get('AGORA_TOKEN_RATE_PERIOD', '300'))
 
+GIF_SEARCH_RATE_LIMIT = int(os.environ.get('GIF_SEARCH_RATE_LIMIT', '40'))
+GIF_SEARCH_RATE_PERIOD = int(os.environ.get('GIF_SEARCH_RATE_PERIOD', '60'))
+
 ADMIN_BLOCK_TOGGLE_RATE_LIMIT = int(os.environ.get('ADMIN_BLOCK_TOGGLE_RATE_LIMIT', '60'))
 ADMIN_BLOCK_TOGGLE_RATE_PERIOD = int(os.environ.get('ADMIN_BLOCK_TOGGLE_RATE_PERIOD', '60'))
+
+# GIF picker: Giphy is queried server-side (a_rtchat.gifs) and pages are cached per
+# (query, offset), so the key never reaches the browser. Unset disables the picker's
+# search (the endpoint answers 502).
+GIPHY_API_KEY = os.environ.get('GIPHY_API_KEY', '')
+GIF_SEARCH_LIMIT = int(os.environ.get('GIF_SEARCH_LIMIT', '30'))
+GIF_SEARCH_CACHE_SECONDS = int(os.environ.get('GIF_SEARCH_CACHE_SECONDS', '600'))
+GIF_TRENDING_CACHE_SECONDS = int(os.environ.get('GIF_TRENDING_CACHE_SECONDS', '300'))
+
+# Staff analytics: the live metrics snapshot is recomputed at most once per interval
+# (shared by all staff tabs/sockets). See a_rtchat.live_metrics.
+ADMIN_LIVE_METRICS_INTERVAL_SECONDS = int(os.environ.get('ADMIN_LIVE_METRICS_INTERVAL_SECONDS', '5'))
 STATIC_ROOT = BASE_DIR / 'staticfiles' 
 
 MEDIA_URL = '/media/'
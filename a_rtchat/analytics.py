@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models_analytics import ChatStatsDaily, ChatStatsHourly
+
+
+# Counter columns shared by both rollup tables.
+COUNTER_FIELDS = (
+    'messages',
+    'blocked',
+    'blocked_ai_scope',
+    'auto_actions',
+    'mod_allow',
+    'mod_flag',
+    'mod_block',
+)
+
+
+def hour_bucket(dt: datetime.datetime) -> datetime.datetime:
+    """Truncate an aware datetime to the start of its local hour (matches TruncHour)."""
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def bump_counters(model, lookup: dict, deltas: dict) -> None:
+    """Atomically add `deltas` to the row matching `lookup`, creating it if missing."""
+    updates = {k: F(k) + int(v) for k, v in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Lost a race with a concurrent insert; the row exists now.
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_activity(*, when, room_id: int | None, user_id: int | None, **deltas) -> None:
+    """Add counter deltas for one event to the hourly and daily rollups (best-effort)."""
+    deltas = {k: int(v) for k, v in deltas.items() if k in COUNTER_FIELDS and int(v or 0) > 0}
+    if not deltas or not user_id:
+        return
+
+    when = when or timezone.now()
+    try:
+        bump_counters(ChatStatsHourly, {'bucket': hour_bucket(when), 'room_id': room_id}, deltas)
+        bump_counters(
+            ChatStatsDaily,
+            {'date': timezone.localdate(when), 'room_id': room_id, 'user_id': user_id},
+            deltas,
+        )
+    except Exception:
+        return
+
+
+def fold_room_rollups(room_id: int) -> None:
+    """Move a room's rollup rows into the site-wide (room=NULL) rows before it is deleted.
+
+    SET_NULL would otherwise turn them into duplicates of the site-wide rows, which the
+    partial unique constraints reject; folding keeps the dashboard totals unchanged.
+    """
+    for model, keys in ((ChatStatsHourly, ('bucket',)), (ChatStatsDaily, ('date', 'user_id'))):
+        rows = model.objects.filter(room_id=room_id)
+        for row in rows.values(*keys, *COUNTER_FIELDS).order_by():
+            deltas = {k: row[k] for k in COUNTER_FIELDS if row[k]}
+            if deltas:
+                bump_counters(model, {**{k: row[k] for k in keys}, 'room_id': None}, deltas)
+        rows.delete()
+
+
+def blocked_event_deltas(event) -> dict:
+    return {
+        'blocked': 1,
+        'blocked_ai_scope': int((getattr(event, 'scope', '') or '') == 'ai_block'),
+        'auto_actions': int(int(getattr(event, 'auto_muted_seconds', 0) or 0) > 0),
+    }
+
+
+def moderation_event_deltas(event) -> dict:
+    action = (getattr(event, 'action', '') or '').strip().lower()
+    has_message = bool(getattr(event, 'message_id', None))
+    return {
+        'mod_allow': int(action == 'allow' and has_message),
+        'mod_flag': int(action == 'flag' and has_message),
+        'mod_block': int(action == 'block'),
+    }
+
+
+def rebuild_rollups(*, since_date: datetime.date | None = None, batch_size: int = 1000) -> dict:
+    """Rebuild rollup rows from the raw event tables.
+
+    Only rows that still exist can be counted: retention-trimmed messages are gone,
+    so a rebuild is a floor, not a replacement for write-time maintenance.
+    Returns the number of hourly/daily rows written.
+    """
+    from .models import BlockedMessageEvent, GroupMessage, ModerationEvent
+
+    since_dt = None
+    if since_date is not None:
+        since_dt = timezone.make_aware(datetime.datetime.combine(since_date, datetime.time.min))
+
+    def _since(qs):
+        return qs.filter(created__gte=since_dt) if since_dt is not None else qs
+
+    sources = (
+        (
+            _since(GroupMessage.objects.all()),
+            'group_id',
+            'author_id',
+            {'messages': Count('id')},
+        ),
+        (
+            _since(BlockedMessageEvent.objects.all()),
+            'room_id',
+            'user_id',
+            {
+                'blocked': Count('id'),
+                'blocked_ai_scope': Count('id', filter=Q(scope='ai_block')),
+                'auto_actions': Count('id', filter=Q(auto_muted_seconds__gt=0)),
+            },
+        ),
+        (
+            _since(ModerationEvent.objects.all()),
+            'room_id',
+            'user_id',
+            {
+                'mod_allow': Count('id', filter=Q(action='allow', message__isnull=False)),
+                'mod_flag': Count('id', filter=Q(action='flag', message__isnull=False)),
+                'mod_block': Count('id', filter=Q(action='block')),
+            },
+        ),
+    )
+
+    hourly: dict[tuple, dict] = {}
+    daily: dict[tuple, dict] = {}
+    for qs, room_field, user_field, aggregates in sources:
+        for row in (
+            qs.annotate(bucket=TruncHour('created'))
+            .values('bucket', room_field)
+            .annotate(**aggregates)
+            .order_by()
+        ):
+            acc = hourly.setdefault((row['bucket'], row[room_field]), {})
+            for k in aggregates:
+                acc[k] = acc.get(k, 0) + int(row[k] or 0)
+
+        for row in (
+            qs.annotate(day=TruncDate('created'))
+            .values('day', room_field, user_field)
+            .annotate(**aggregates)
+            .order_by()
+        ):
+            acc = daily.setdefault((row['day'], row[room_field], row[user_field]), {})
+            for k in aggregates:
+                acc[k] = acc.get(k, 0) + int(row[k] or 0)
+
+    with transaction.atomic():
+        hourly_qs = ChatStatsHourly.objects.all()
+        daily_qs = ChatStatsDaily.objects.all()
+        if since_date is not None:
+            hourly_qs = hourly_qs.filter(bucket__gte=since_dt)
+            daily_qs = daily_qs.filter(date__gte=since_date)
+        hourly_qs.delete()
+        daily_qs.delete()
+
+        ChatStatsHourly.objects.bulk_create(
+            [ChatStatsHourly(bucket=b, room_id=r, **c) for (b, r), c in hourly.items()],
+            batch_size=batch_size,
+        )
+        ChatStatsDaily.objects.bulk_create(
+            [ChatStatsDaily(date=d, room_id=r, user_id=u, **c) for (d, r, u), c in daily.items()],
+            batch_size=batch_size,
+        )
+
+    return {'hourly': len(hourly), 'daily': len(daily)}
+
+
+def window_totals(*, since: datetime.datetime) -> dict:
+    """Sum all counters over a rolling window using the hourly table."""
+    row = ChatStatsHourly.objects.filter(bucket__gte=hour_bucket(since)).aggregate(
+        **{f'sum_{k}': Sum(k) for k in COUNTER_FIELDS}
+    )
+    return {k: int(row.get(f'sum_{k}') or 0) for k in COUNTER_FIELDS}
+
+
+def daily_totals(*, start: datetime.date) -> dict[datetime.date, dict]:
+    """Per-day counter sums from `start` (inclusive), keyed by date."""
+    out: dict[datetime.date, dict] = {}
+    for row in (
+        ChatStatsDaily.objects.filter(date__gte=start)
+        .values('date')
+        .annotate(**{f'sum_{k}': Sum(k) for k in COUNTER_FIELDS})
+        .order_by('date')
+    ):
+        out[row['date']] = {k: int(row.get(f'sum_{k}') or 0) for k in COUNTER_FIELDS}
+    return out
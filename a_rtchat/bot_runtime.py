@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from django.db import close_old_connections
+
+
+class BotRuntime:
+    """Fixed-size worker pool with a bounded queue and delayed jobs.
+
+    Bot work (LLM calls, sending replies) runs here instead of on a fresh thread per
+    chat message. Jobs beyond `max_pending` are dropped, which is the right call for
+    chatter replies: a late reply is worse than none. Delayed jobs wait on a single
+    dispatcher thread and only take a worker once they are due, so "typing..." pauses
+    don't hold a worker.
+    """
+
+    def __init__(self, *, name: str, workers: int = 2, max_pending: int = 50):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending = 0
+        self._executor: ThreadPoolExecutor | None = None
+        self._timers: list[tuple[float, int, Callable, tuple]] = []
+        self._seq = itertools.count()
+        self._dispatcher: threading.Thread | None = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _ensure_started(self) -> None:
+        # Called with the lock held.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name=f"{self.name}-timer", daemon=True)
+            self._dispatcher.start()
+
+    def _run(self, fn: Callable, args: tuple) -> None:
+        try:
+            close_old_connections()
+            fn(*args)
+        except Exception:
+            pass
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._pending -= 1
+
+    def submit(self, fn: Callable, *args) -> bool:
+        """Queue `fn(*args)` on the pool. Returns False when the queue is full."""
+        return self.submit_later(0, fn, *args)
+
+    def submit_later(self, delay: float, fn: Callable, *args) -> bool:
+        """Queue `fn(*args)` to run after `delay` seconds without blocking a worker meanwhile."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending += 1
+            self._ensure_started()
+            if delay and delay > 0:
+                heapq.heappush(self._timers, (time.monotonic() + float(delay), next(self._seq), fn, args))
+                self._cond.notify()
+                return True
+            executor = self._executor
+        executor.submit(self._run, fn, args)
+        return True
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._timers:
+                    self._cond.wait()
+                due_at, _seq, fn, args = self._timers[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._timers)
+                executor = self._executor
+            executor.submit(self._run, fn, args)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from a_core.query_budget import VIEW_BUDGETS, QueryRecorder
+
+from .models import ChatGroup, ChatStatsDaily, GroupMessage, MessageReaction
+from .models_notifications import Notification
+from .reactions import reaction_emojis
+
+
+# Data sets for the hot-view query budgets (see a_core.query_budget).
+#
+# seed() builds one world of a given size: public chat with `members` members and
+# `messages` messages (with reactions), a private room, followers, notifications and a
+# day of analytics rollups. measure_views() requests every budgeted view once as the
+# right user and records its statements. The regression tests seed a small and a large
+# world and require identical counts; the query_budget_report command prints the same
+# rows for a throwaway database.
+
+PUBLIC_ROOM = 'public-chat'
+
+
+def _verified_user(username: str, **extra):
+    from allauth.account.models import EmailAddress
+
+    user = get_user_model().objects.create(username=username, email=f"{username}@example.com", **extra)
+    EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+    return user
+
+
+def seed(*, members: int, messages: int, prefix: str = 'qb') -> dict:
+    viewer = _verified_user(f"{prefix}_viewer")
+    staff = _verified_user(f"{prefix}_staff", is_staff=True)
+    others = [_verified_user(f"{prefix}_m{i}") for i in range(members)]
+
+    room, _ = ChatGroup.objects.get_or_create(group_name=PUBLIC_ROOM)
+    room.members.add(viewer, staff, *others)
+
+    private = ChatGroup.objects.create(group_name=f"{prefix}-private", is_private=True)
+    private.members.add(viewer, others[0])
+
+    authors = [viewer, *others]
+    first = GroupMessage.objects.bulk_create(
+        [GroupMessage(group=room, author=authors[i % len(authors)], body=f"budget message {i}") for i in range(messages)],
+        batch_size=500,
+    )
+    GroupMessage.objects.bulk_create(
+        [GroupMessage(group=private, author=authors[i % 2], body=f"private {i}") for i in range(messages)],
+        batch_size=500,
+    )
+
+    # Every other message gets one reaction per member (capped), so reaction rendering
+    # has real rows to read.
+    emoji = reaction_emojis()[0]
+    reactions = []
+    for message in first[::2]:
+        for user in others[:5]:
+            reactions.append(MessageReaction(message=message, user=user, emoji=emoji))
+        message.reaction_counts = {emoji: min(5, len(others))}
+    MessageReaction.objects.bulk_create(reactions, batch_size=500)
+    GroupMessage.objects.bulk_update(first[::2], ['reaction_counts'], batch_size=500)
+
+    from a_users.models import Follow
+
+    Follow.objects.bulk_create([Follow(follower=u, following=viewer) for u in others], ignore_conflicts=True)
+
+    Notification.objects.bulk_create(
+        [
+            Notification(user=viewer, from_user=others[i % len(others)], type='mention', chatroom_name=PUBLIC_ROOM, preview=f"ping {i}")
+            for i in range(messages)
+        ],
+        batch_size=500,
+    )
+
+    today = timezone.localdate()
+    ChatStatsDaily.objects.bulk_create(
+        [ChatStatsDaily(date=today, room=room, user=u, messages=i + 1, blocked=i % 3, mod_allow=i) for i, u in enumerate(others)],
+        batch_size=500,
+    )
+
+    cache.clear()
+    return {
+        'viewer': viewer,
+        'staff': staff,
+        'room': room,
+        'private': private,
+        'oldest_id': first[0].id if first else 0,
+        'newest_id': first[-1].id if first else 0,
+    }
+
+
+def view_requests(world: dict) -> list[tuple[str, str, dict, object]]:
+    """(url name, path, GET params, user) for every budgeted view."""
+    viewer = world['viewer']
+    newest = world['newest_id']
+    return [
+        ('chatroom', reverse('chatroom', args=[PUBLIC_ROOM]), {}, viewer),
+        ('chat-poll', reverse('chat-poll', args=[PUBLIC_ROOM]), {'after': max(0, newest - 20)}, viewer),
+        ('chat-older', reverse('chat-older', args=[PUBLIC_ROOM]), {'before': newest}, viewer),
+        ('chat-config', reverse('chat-config', args=[world['private'].group_name]), {}, viewer),
+        ('profile-user', reverse('profile-user', args=[viewer.username]), {}, viewer),
+        ('notifications-dropdown', reverse('notifications-dropdown'), {}, viewer),
+        ('admin-analytics', reverse('admin-analytics'), {}, world['staff']),
+    ]
+
+
+def measure_views(world: dict) -> dict[str, dict]:
+    """{url name: {status, queries, budget, repeated, recorder}} for one request each."""
+    out = {}
+    for name, path, params, user in view_requests(world):
+        client = Client()
+        client.force_login(user)
+        # Warm per-process caches (runtime config, rate-limit keys) so the recorded
+        # request is a steady-state one.
+        client.get(path, params)
+        with QueryRecorder() as recorder:
+            resp = client.get(path, params)
+        out[name] = {
+            'status': resp.status_code,
+            'queries': recorder.count,
+            'budget': VIEW_BUDGETS.get(name),
+            'repeated': recorder.repeated(),
+            'recorder': recorder,
+        }
+    return out
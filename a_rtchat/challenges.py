@@ -1,13 +1,22 @@
+import os
 import random
 import re
+import threading
 import unicodedata
 from dataclasses import dataclass
 from datetime import timedelta
 
-from django.db import transaction
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.template.loader import render_to_string
 from django.utils import timezone
 
-from .models import ChatChallenge, ChatGroup
+from .analytics import bump_counters
+from .models import ChallengeStats, ChatChallenge, ChatGroup
 
 
 VOWELS_RE = re.compile(r"[aeiou]", re.IGNORECASE)
@@ -361,14 +370,164 @@ class ChallengeCheckResult:
     ended: bool = False
 
 
-def get_active_challenge(group: ChatGroup) -> ChatChallenge | None:
+# Live challenge state.
+#
+# While a challenge runs, per-user progress (lost / completed / message count) lives in
+# the cache as one key per (challenge, user), so concurrent senders never overwrite each
+# other's updates and no message does a DB read-modify-write on ChatChallenge.meta.
+# end_challenge() folds the live state into meta and persists it once.
+#
+# The room's active challenge is cached too (0 = "no active challenge"), so heartbeat
+# pings and messages in private rooms don't query ChatChallenge at all.
+
+_NO_ACTIVE = 0
+_NO_ACTIVE_TTL = 10 * 60
+_LIVE_GRACE_SECONDS = 10 * 60
+
+
+def _active_key(group_id: int) -> str:
+    return f"challenge:room:{int(group_id or 0)}:active"
+
+
+def _live_key(ch: ChatChallenge, field: str, user_id: int | None = None) -> str:
+    if user_id is None:
+        return f"challenge:{ch.pk}:{field}"
+    return f"challenge:{ch.pk}:{field}:{int(user_id)}"
+
+
+def _live_ttl(ch: ChatChallenge) -> int:
+    remaining = 0
+    if ch.ends_at:
+        remaining = int((ch.ends_at - timezone.now()).total_seconds())
+    return max(60, remaining + _LIVE_GRACE_SECONDS)
+
+
+def _active_from_db(group: ChatGroup) -> ChatChallenge | None:
     return (
-        ChatChallenge.objects.filter(group=group, status=ChatChallenge.STATUS_ACTIVE)
+        ChatChallenge.objects.select_related("group")
+        .filter(group=group, status=ChatChallenge.STATUS_ACTIVE)
         .order_by("-started_at")
         .first()
     )
 
 
+def _cache_active(group_id: int, ch: ChatChallenge | None) -> None:
+    try:
+        if ch is not None and ch.status == ChatChallenge.STATUS_ACTIVE:
+            cache.set(_active_key(group_id), ch, timeout=_live_ttl(ch))
+        else:
+            cache.set(_active_key(group_id), _NO_ACTIVE, timeout=_NO_ACTIVE_TTL)
+    except Exception:
+        pass
+
+
+def get_active_challenge(group: ChatGroup) -> ChatChallenge | None:
+    """Return the room's active challenge, from cache when possible.
+
+    The returned instance carries the meta captured at start; use live_meta()
+    for current per-user progress.
+    """
+    group_id = getattr(group, "pk", None)
+    try:
+        cached = cache.get(_active_key(group_id))
+    except Exception:
+        cached = None
+
+    if cached == _NO_ACTIVE and cached is not None:
+        return None
+    if isinstance(cached, ChatChallenge):
+        return cached
+
+    ch = _active_from_db(group)
+    _cache_active(group_id, ch)
+    return ch
+
+
+def _participant_ids(ch: ChatChallenge, meta: dict) -> set[int]:
+    """Participants captured at start plus anyone who sent a message since (no DB access)."""
+    ids: set[int] = set()
+    for x in list(meta.get("participants") or []) + list(meta.get("seen") or []):
+        try:
+            if int(x) > 0:
+                ids.add(int(x))
+        except Exception:
+            continue
+    return ids
+
+
+def live_meta(ch: ChatChallenge | None) -> dict:
+    """Return `ch.meta` merged with the live per-user progress held in cache."""
+    meta = dict(getattr(ch, "meta", None) or {})
+    if not ch or not ch.pk or ch.status != ChatChallenge.STATUS_ACTIVE:
+        return meta
+
+    try:
+        head = cache.get_many([_live_key(ch, "seen_n"), _live_key(ch, "winner")])
+        seen_n = int(head.get(_live_key(ch, "seen_n")) or 0)
+        slots = cache.get_many([_live_key(ch, "seen_at", i) for i in range(1, seen_n + 1)]) if seen_n else {}
+        seen = [int(x) for x in slots.values() if x]
+        meta["seen"] = sorted(set(seen) | set(int(x) for x in (meta.get("seen") or [])))
+
+        uids = sorted(_participant_ids(ch, meta))
+        keys = []
+        for uid in uids:
+            keys.extend([
+                _live_key(ch, "lost", uid),
+                _live_key(ch, "done", uid),
+                _live_key(ch, "count", uid),
+            ])
+        vals = cache.get_many(keys) if keys else {}
+    except Exception:
+        return meta
+
+    losers = set(int(x) for x in (meta.get("losers") or []))
+    completed = dict(meta.get("completed") or {})
+    counts = dict(meta.get("counts") or {})
+    for uid in uids:
+        if vals.get(_live_key(ch, "lost", uid)):
+            losers.add(uid)
+        if vals.get(_live_key(ch, "done", uid)):
+            completed[str(uid)] = True
+        live_count = int(vals.get(_live_key(ch, "count", uid)) or 0)
+        if live_count:
+            counts[str(uid)] = max(live_count, int(counts.get(str(uid)) or 0))
+    meta["losers"] = sorted(losers)
+    meta["completed"] = completed
+    meta["counts"] = counts
+
+    winner = head.get(_live_key(ch, "winner"))
+    if winner:
+        meta["winners"] = [int(winner)]
+    return meta
+
+
+def _note_sender(ch: ChatChallenge, meta: dict, user_id: int) -> None:
+    """Track senders who were not online when the challenge started."""
+    if not user_id or user_id in _participant_ids(ch, meta):
+        return
+    # Atomic like the lost/done/count counters: the per-user marker decides who is new,
+    # and each new sender gets its own numbered slot, so concurrent first messages
+    # never overwrite each other.
+    ttl = _live_ttl(ch)
+    try:
+        if cache.add(_live_key(ch, "seen", user_id), 1, timeout=ttl):
+            cache.add(_live_key(ch, "seen_n"), 0, timeout=ttl)
+            slot = int(cache.incr(_live_key(ch, "seen_n")))
+            cache.set(_live_key(ch, "seen_at", slot), int(user_id), timeout=ttl)
+    except Exception:
+        pass
+    meta["seen"] = sorted(set(meta.get("seen") or []) | {int(user_id)})
+    ch.meta = meta
+
+
+def _persist_fallback(ch: ChatChallenge) -> None:
+    # Cache unavailable: keep the old behaviour of saving progress on the row.
+    try:
+        ch.save(update_fields=["meta"])
+    except Exception:
+        pass
+
+
 def _members(group: ChatGroup) -> list[int]:
     try:
         return list(group.members.values_list("id", flat=True))
@@ -403,7 +562,7 @@ def start_challenge(group: ChatGroup, created_by, kind: str) -> ChatChallenge:
     with transaction.atomic():
         # Prevent double-start races.
         ChatGroup.objects.select_for_update().filter(pk=group.pk).exists()
-        active = get_active_challenge(group)
+        active = _active_from_db(group)
         if active:
             raise ValueError("A challenge is already active in this chat.")
 
@@ -484,7 +643,7 @@ def start_challenge(group: ChatGroup, created_by, kind: str) -> ChatChallenge:
 
         ends_at = now + duration
 
-        return ChatChallenge.objects.create(
+        ch = ChatChallenge.objects.create(
             group=group,
             kind=kind,
             status=ChatChallenge.STATUS_ACTIVE,
@@ -495,6 +654,86 @@ def start_challenge(group: ChatGroup, created_by, kind: str) -> ChatChallenge:
             meta=meta,
         )
 
+        def _publish():
+            _cache_active(group.pk, ch)
+            schedule_challenge_expiry(ch)
+
+        transaction.on_commit(_publish)
+        return ch
+
+
+def _result_deltas(ch: ChatChallenge) -> dict[int, dict]:
+    """Map user id -> stats deltas for a finalized challenge, from its meta lists."""
+    meta = dict(getattr(ch, "meta", None) or {})
+    out: dict[int, dict] = {}
+
+    if ch.status == ChatChallenge.STATUS_CANCELLED:
+        for uid in _participants_from_meta(ch.group, meta):
+            out[int(uid)] = {"cancelled": 1}
+        return out
+
+    if ch.status != ChatChallenge.STATUS_COMPLETED:
+        return out
+
+    def _ids(key):
+        ids = set()
+        for x in meta.get(key) or []:
+            try:
+                if int(x) > 0:
+                    ids.add(int(x))
+            except Exception:
+                continue
+        return ids
+
+    winners = _ids("winners")
+    losers = _ids("losers")
+    for uid in winners | losers:
+        out[uid] = {
+            "completed": 1,
+            "wins": int(uid in winners),
+            "losses": int(uid in losers),
+        }
+    return out
+
+
+def record_challenge_result(ch: ChatChallenge) -> None:
+    """Add a finalized challenge to the per-user totals and per-room rows."""
+    for uid, deltas in _result_deltas(ch).items():
+        deltas = {k: v for k, v in deltas.items() if v}
+        bump_counters(ChallengeStats, {"user_id": uid, "room_id": None}, deltas)
+        bump_counters(ChallengeStats, {"user_id": uid, "room_id": ch.group_id}, deltas)
+
+
+def _finalize(ch: ChatChallenge, meta: dict, status: str) -> ChatChallenge:
+    """Persist the final state and record stats exactly once.
+
+    The conditional UPDATE makes concurrent enders (WS + HTTP path) race safely:
+    only the caller that flips the row out of ACTIVE records the result.
+    """
+    ch.meta = meta
+    ch.status = status
+    ch.ended_at = timezone.now()
+    with transaction.atomic():
+        updated = ChatChallenge.objects.filter(pk=ch.pk, status=ChatChallenge.STATUS_ACTIVE).update(
+            meta=meta,
+            status=status,
+            ended_at=ch.ended_at,
+        )
+        if updated:
+            try:
+                # Savepoint: a stats failure must not undo ending the challenge.
+                with transaction.atomic():
+                    record_challenge_result(ch)
+            except Exception:
+                pass
+    _cache_active(ch.group_id, None)
+    if not updated:
+        try:
+            ch.refresh_from_db()
+        except Exception:
+            pass
+    return ch
+
 
 def cancel_challenge(ch: ChatChallenge) -> ChatChallenge:
     if not ch or ch.status != ChatChallenge.STATUS_ACTIVE:
@@ -504,11 +743,7 @@ def cancel_challenge(ch: ChatChallenge) -> ChatChallenge:
     meta["winners"] = []
     meta["losers"] = []
     meta["ended_kind"] = "cancelled"
-    ch.meta = meta
-    ch.status = ChatChallenge.STATUS_CANCELLED
-    ch.ended_at = timezone.now()
-    ch.save(update_fields=["meta", "status", "ended_at"])
-    return ch
+    return _finalize(ch, meta, ChatChallenge.STATUS_CANCELLED)
 
 
 def _set_loser(ch: ChatChallenge, user_id: int) -> None:
@@ -518,6 +753,12 @@ def _set_loser(ch: ChatChallenge, user_id: int) -> None:
         losers.add(int(user_id))
     meta["losers"] = sorted(losers)
     ch.meta = meta
+    if not user_id:
+        return
+    try:
+        cache.set(_live_key(ch, "lost", user_id), 1, timeout=_live_ttl(ch))
+    except Exception:
+        _persist_fallback(ch)
 
 
 def _mark_completed(ch: ChatChallenge, user_id: int) -> None:
@@ -527,15 +768,29 @@ def _mark_completed(ch: ChatChallenge, user_id: int) -> None:
         completed[str(int(user_id))] = True
     meta["completed"] = completed
     ch.meta = meta
+    if not user_id:
+        return
+    try:
+        cache.set(_live_key(ch, "done", user_id), 1, timeout=_live_ttl(ch))
+    except Exception:
+        _persist_fallback(ch)
 
 
 def _inc_count(ch: ChatChallenge, user_id: int) -> None:
     meta = dict(getattr(ch, "meta", None) or {})
     counts = dict(meta.get("counts") or {})
     key = str(int(user_id))
-    counts[key] = int(counts.get(key) or 0) + 1
-    meta["counts"] = counts
-    ch.meta = meta
+    try:
+        ckey = _live_key(ch, "count", user_id)
+        cache.add(ckey, 0, timeout=_live_ttl(ch))
+        counts[key] = int(cache.incr(ckey))
+        meta["counts"] = counts
+        ch.meta = meta
+    except Exception:
+        counts[key] = int(counts.get(key) or 0) + 1
+        meta["counts"] = counts
+        ch.meta = meta
+        _persist_fallback(ch)
 
 
 def end_if_expired(ch: ChatChallenge) -> bool:
@@ -550,7 +805,7 @@ def end_if_expired(ch: ChatChallenge) -> bool:
 def end_challenge(ch: ChatChallenge) -> ChatChallenge:
     if not ch or ch.status != ChatChallenge.STATUS_ACTIVE:
         return ch
-    meta = dict(getattr(ch, "meta", None) or {})
+    meta = live_meta(ch)
 
     member_ids = _participants_from_meta(ch.group, meta)
     losers = set(meta.get("losers") or [])
@@ -565,6 +820,11 @@ def end_challenge(ch: ChatChallenge) -> ChatChallenge:
         winners = [uid for uid in member_ids if uid and uid not in losers]
         meta["losers"] = sorted(losers)
 
+    # Finish the meme: a claimed first valid reply wins even if its sender never got to end it.
+    if ch.kind == ChatChallenge.KIND_FINISH_MEME and meta.get("winners"):
+        winners = [int(x) for x in meta.get("winners") or []]
+        meta["losers"] = sorted(set(int(uid) for uid in member_ids if uid and int(uid) not in winners))
+
     # Time attack: must send N messages.
     if ch.kind == ChatChallenge.KIND_TIME_ATTACK:
         target = int(meta.get("target_messages") or 3)
@@ -574,12 +834,8 @@ def end_challenge(ch: ChatChallenge) -> ChatChallenge:
         meta["losers"] = sorted(losers)
 
     meta["winners"] = sorted(int(x) for x in winners)
-    ch.meta = meta
     meta["ended_kind"] = "completed"
-    ch.status = ChatChallenge.STATUS_COMPLETED
-    ch.ended_at = timezone.now()
-    ch.save(update_fields=["meta", "status", "ended_at"])
-    return ch
+    return _finalize(ch, meta, ChatChallenge.STATUS_COMPLETED)
 
 
 def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckResult:
@@ -591,7 +847,9 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
         return ChallengeCheckResult(allowed=True, ended=True)
 
     uid = int(user_id or 0)
-    meta = dict(getattr(ch, "meta", None) or {})
+    meta = live_meta(ch)
+    ch.meta = meta
+    _note_sender(ch, meta, uid)
     losers = set(meta.get("losers") or [])
     if uid in losers:
         # Already lost; allow messages but do not count.
@@ -603,14 +861,12 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
     if ch.kind == ChatChallenge.KIND_EMOJI_ONLY:
         if not _is_emoji_only(text):
             _set_loser(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=False, reason="Emoji-only mode: text not allowed.")
         return ChallengeCheckResult(allowed=True)
 
     if ch.kind == ChatChallenge.KIND_NO_VOWELS:
         if VOWELS_RE.search(text or ""):
             _set_loser(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=False, reason="No-vowels challenge: vowel detected.")
         return ChallengeCheckResult(allowed=True)
 
@@ -619,10 +875,8 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
         if mode == 'truth':
             if _is_low_effort_answer(text, min_len=min_len) or _is_repeated_or_meaningless(text):
                 _set_loser(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=False, reason=f"Truth answer must be meaningful (≥{min_len} chars).")
             _mark_completed(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=True)
 
         if mode == 'dare':
@@ -631,73 +885,58 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
             if rtype == 'any_nonempty':
                 if not _normalize_text(text):
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: message required.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'equals':
                 expected = _normalize_cmp(str(rule.get('value') or ''))
                 got = _normalize_cmp(text)
                 if expected and got != expected:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: exact text required.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'starts_with':
                 expected = _normalize_cmp(str(rule.get('value') or ''))
                 got = _normalize_cmp(text)
                 if expected and not got.startswith(expected):
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: text must start with required phrase.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'one_word':
                 s = _normalize_text(text)
                 tokens = [t for t in re.split(r"\s+", s) if t]
                 if len(tokens) != 1:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: must be exactly one word.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'lowercase':
                 s = _normalize_text(text)
                 if not s or s != s.lower():
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: must be lowercase.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'single_letter':
                 s = _normalize_text(text)
                 if len(s) != 1 or not s.isalpha():
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: must be a single letter.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'numbers_only':
                 s = _normalize_text(text)
                 if not s or not s.isdigit():
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: numbers only.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'punctuation_only':
                 s = (text or '').strip()
                 if not s:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: punctuation required.")
                 ok = True
                 for c in s:
@@ -708,16 +947,13 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
                         break
                 if not ok:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: punctuation only.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'symbols_only':
                 s = (text or '').strip()
                 if not s:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: symbols required.")
                 ok = True
                 for c in s:
@@ -728,54 +964,42 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
                         break
                 if not ok:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: symbols only.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'only_dots':
                 s = (text or '').strip()
                 if not s or any((c not in {'.', '…'} and not c.isspace()) for c in s):
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: dots only.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'emoji_only':
                 if not _is_emoji_only(text):
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: emojis only.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'contains_emoji':
                 needle = str(rule.get('value') or '').strip()
                 if not needle or needle not in text:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: required emoji missing.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'all_caps':
                 letters = ''.join([c for c in text if c.isalpha()])
                 if not letters or text != text.upper():
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason="Dare failed: message must be ALL CAPS.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'contains':
                 needle = str(rule.get('value') or '').strip().lower()
                 if not needle or needle not in text.lower():
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason=f"Dare failed: must include '{needle}'.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
             if rtype == 'min_emojis':
                 target = int(rule.get('value') or 3)
@@ -785,51 +1009,162 @@ def check_message(ch: ChatChallenge, user_id: int, body: str) -> ChallengeCheckR
                         emoji_count += 1
                 if emoji_count < target:
                     _set_loser(ch, uid)
-                    ch.save(update_fields=["meta"])
                     return ChallengeCheckResult(allowed=False, reason=f"Dare failed: need ≥{target} emojis.")
                 _mark_completed(ch, uid)
-                ch.save(update_fields=["meta"])
                 return ChallengeCheckResult(allowed=True)
 
             # Unknown dare rule -> treat as fail-safe allow.
             _mark_completed(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=True)
 
         # If mode missing, require meaningful response.
         if _is_low_effort_answer(text, min_len=min_len) or _is_repeated_or_meaningless(text):
             _set_loser(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=False, reason=f"Answer must be meaningful (≥{min_len} chars).")
         _mark_completed(ch, uid)
-        ch.save(update_fields=["meta"])
         return ChallengeCheckResult(allowed=True)
 
     if ch.kind == ChatChallenge.KIND_TIME_ATTACK:
         _inc_count(ch, uid)
-        ch.save(update_fields=["meta"])
         return ChallengeCheckResult(allowed=True)
 
     if ch.kind == ChatChallenge.KIND_FINISH_MEME:
         if _is_low_effort_answer(text, min_len=min_len) or _is_repeated_or_meaningless(text):
             _set_loser(ch, uid)
-            ch.save(update_fields=["meta"])
             return ChallengeCheckResult(allowed=False, reason=f"Reply must be meaningful (≥{min_len} chars).")
 
-        # First valid reply wins immediately.
+        # First valid reply wins immediately; the cache claim settles simultaneous replies.
+        try:
+            won = bool(cache.add(_live_key(ch, "winner"), uid, timeout=_live_ttl(ch)))
+        except Exception:
+            won = True
+        if not won:
+            # Someone else's reply won a moment earlier; their request ends the challenge.
+            return ChallengeCheckResult(allowed=True)
+
         member_ids = _participants_from_meta(ch.group, meta)
         meta["winners"] = [uid]
         meta["losers"] = [x for x in member_ids if x and int(x) != uid]
         meta["ended_kind"] = "completed"
-        ch.meta = meta
-        ch.status = ChatChallenge.STATUS_COMPLETED
-        ch.ended_at = timezone.now()
-        ch.save(update_fields=["meta", "status", "ended_at"])
+        _finalize(ch, meta, ChatChallenge.STATUS_COMPLETED)
         return ChallengeCheckResult(allowed=True, ended=True)
 
     return ChallengeCheckResult(allowed=True)
 
 
+def announce_challenge_end(ch: ChatChallenge | None, title: str = "Challenge ended") -> bool:
+    """Broadcast the end of a finalized challenge to its room exactly once.
+
+    Whoever gets here first (expiry timer, WS consumer, HTTP send path) claims the
+    announcement; everyone else returns False.
+    """
+    if not ch or ch.status == ChatChallenge.STATUS_ACTIVE:
+        return False
+    meta = dict(getattr(ch, "meta", None) or {})
+    if meta.get("ended_notified"):
+        return False
+    try:
+        if not cache.add(_live_key(ch, "announced"), 1, timeout=60 * 60):
+            return False
+    except Exception:
+        pass
+
+    meta["ended_notified"] = True
+    ch.meta = meta
+    try:
+        ChatChallenge.objects.filter(pk=ch.pk).update(meta=meta)
+    except Exception:
+        pass
+
+    winners = meta.get("winners") or []
+    losers = meta.get("losers") or []
+    if winners:
+        msg = f"Winners: {len(winners)} • Losers: {len(losers)}"
+    else:
+        msg = "No winners this time."
+    try:
+        from .channels_utils import chatroom_channel_group_name
+
+        html = render_to_string("a_rtchat/partials/challenge_event.html", {
+            "title": title,
+            "body": msg,
+        })
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(
+                chatroom_channel_group_name(ch.group),
+                {
+                    "type": "challenge_event_handler",
+                    "html": html,
+                    "state": challenge_public_state(ch),
+                },
+            )
+    except Exception:
+        pass
+    return True
+
+
+def expire_challenge(challenge_id: int) -> bool:
+    """End a challenge whose time is up and announce it. Safe to call more than once."""
+    try:
+        ch = ChatChallenge.objects.select_related("group").filter(pk=int(challenge_id)).first()
+        if not ch:
+            return False
+        if ch.status == ChatChallenge.STATUS_ACTIVE:
+            if ch.ends_at and timezone.now() < ch.ends_at:
+                # Fired early (clock skew / ETA rounding): try again at ends_at.
+                schedule_challenge_expiry(ch)
+                return False
+            end_challenge(ch)
+        return announce_challenge_end(ch)
+    except Exception:
+        return False
+
+
+def _expire_in_thread(challenge_id: int) -> None:
+    try:
+        expire_challenge(challenge_id)
+    finally:
+        # Timer threads get their own DB connection; don't leak it.
+        connection.close()
+
+
+def _celery_broker_configured() -> bool:
+    try:
+        env_broker = (os.environ.get("CELERY_BROKER_URL") or "").strip()
+        settings_broker = (getattr(settings, "CELERY_BROKER_URL", None) or "").strip()
+        return bool(env_broker or settings_broker)
+    except Exception:
+        return False
+
+
+def schedule_challenge_expiry(ch: ChatChallenge) -> None:
+    """End `ch` at its ends_at without waiting for someone to ping or send.
+
+    An in-process timer always runs (it works without a Celery worker); when a broker
+    is configured an ETA task is queued too so a restart doesn't lose the expiry.
+    Both paths are idempotent.
+    """
+    if not ch or not ch.pk or not ch.ends_at:
+        return
+    delay = max(0.0, (ch.ends_at - timezone.now()).total_seconds())
+
+    try:
+        t = threading.Timer(delay + 0.05, _expire_in_thread, args=(ch.pk,))
+        t.daemon = True
+        t.start()
+    except Exception:
+        pass
+
+    if _celery_broker_configured():
+        try:
+            from .tasks import challenge_expire_task
+
+            challenge_expire_task.apply_async(args=[ch.pk], eta=ch.ends_at)
+        except Exception:
+            pass
+
+
 def get_win_loss_totals(
     user_id: int,
     *,
@@ -838,41 +1173,71 @@ def get_win_loss_totals(
 ) -> dict:
     """Return aggregated challenge results for a user.
 
-    We count wins/losses based on the persisted `meta['winners']`/`meta['losers']`
-    lists on COMPLETED challenges.
+    Reads the user's ChallengeStats row (all-rooms totals, or the room row when
+    `group` is given). Challenges only run in private chats, so `private_only`
+    is implied and kept for call-site compatibility. `completed` is the number of
+    completed challenges the user took part in.
     """
     uid = int(user_id or 0)
     if uid <= 0:
         return {'wins': 0, 'losses': 0, 'completed': 0}
 
-    qs = ChatChallenge.objects.filter(status=ChatChallenge.STATUS_COMPLETED)
-    if group is not None:
-        qs = qs.filter(group=group)
-    elif private_only:
-        qs = qs.filter(group__is_private=True)
+    row = (
+        ChallengeStats.objects.filter(user_id=uid, room_id=getattr(group, 'pk', None))
+        .values('wins', 'losses', 'completed')
+        .first()
+    )
+    if not row:
+        return {'wins': 0, 'losses': 0, 'completed': 0}
+    return {k: int(row[k] or 0) for k in ('wins', 'losses', 'completed')}
+
 
-    wins = 0
-    losses = 0
-    completed = 0
+def get_leaderboard(*, group: ChatGroup | None = None, limit: int = 10) -> list[dict]:
+    """Top-N users by challenge wins, overall or for one room."""
+    limit = max(1, min(int(limit or 10), 100))
+    return list(
+        ChallengeStats.objects.filter(room_id=getattr(group, 'pk', None), wins__gt=0)
+        .order_by('-wins', 'losses', 'user_id')
+        .values('user_id', 'user__username', 'wins', 'losses', 'completed')[:limit]
+    )
 
-    for meta in qs.values_list('meta', flat=True):
-        if not isinstance(meta, dict):
-            continue
-        completed += 1
-        winners = meta.get('winners') or []
-        losers = meta.get('losers') or []
-        if uid in winners:
-            wins += 1
-        if uid in losers:
-            losses += 1
 
-    return {'wins': wins, 'losses': losses, 'completed': completed}
+def rebuild_challenge_stats(*, batch_size: int = 1000) -> int:
+    """Recompute ChallengeStats from finalized challenges. Returns rows written."""
+    totals: dict[tuple, dict] = {}
+    qs = (
+        ChatChallenge.objects.filter(
+            status__in=[ChatChallenge.STATUS_COMPLETED, ChatChallenge.STATUS_CANCELLED]
+        )
+        .select_related('group')
+        .only('id', 'status', 'meta', 'group')
+        .order_by('id')
+    )
+    for ch in qs.iterator(chunk_size=batch_size):
+        for uid, deltas in _result_deltas(ch).items():
+            for room_id in (None, ch.group_id):
+                acc = totals.setdefault((uid, room_id), {})
+                for k, v in deltas.items():
+                    acc[k] = acc.get(k, 0) + int(v)
+
+    # Skip users deleted since the challenge ended (their rows would violate the FK).
+    user_ids = {u for (u, _r) in totals}
+    existing = set(get_user_model().objects.filter(id__in=user_ids).values_list('id', flat=True))
+    totals = {key: c for key, c in totals.items() if key[0] in existing}
+
+    with transaction.atomic():
+        ChallengeStats.objects.all().delete()
+        ChallengeStats.objects.bulk_create(
+            [ChallengeStats(user_id=u, room_id=r, **c) for (u, r), c in totals.items()],
+            batch_size=batch_size,
+        )
+    return len(totals)
 
 
 def challenge_public_state(ch: ChatChallenge | None) -> dict:
     if not ch:
         return {"active": False}
-    meta = dict(getattr(ch, "meta", None) or {})
+    meta = live_meta(ch)
     return {
         "active": ch.status == ChatChallenge.STATUS_ACTIVE,
         "id": ch.id,
@@ -6,9 +6,7 @@ from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
-import datetime
 import os
-from django.db.models import Count
 from asgiref.sync import async_to_sync
 import json
 from a_users.badges import get_verified_user_ids
@@ -16,27 +14,17 @@ from .models import *
 
 
 def _reaction_context_for(message, user):
-    emojis = getattr(settings, 'CHAT_REACTION_EMOJIS', ['👍', '❤️', '😂', '😮', '😢', '🙏'])
-
-    counts = {}
-    for row in (
-        MessageReaction.objects.filter(message=message, emoji__in=emojis)
-        .values('emoji')
-        .annotate(count=Count('id'))
-    ):
-        counts[row['emoji']] = int(row['count'] or 0)
-
-    reacted = set(
-        MessageReaction.objects.filter(message=message, user=user, emoji__in=emojis)
-        .values_list('emoji', flat=True)
-    )
-
-    pills = []
-    for emoji in emojis:
-        c = counts.get(emoji, 0)
-        if c:
-            pills.append({'emoji': emoji, 'count': c, 'reacted': emoji in reacted})
-    message.reaction_pills = pills
+    emojis = reaction_emojis()
+    counts = getattr(message, 'reaction_counts', None) or {}
+
+    reacted = set()
+    if counts:
+        reacted = set(
+            MessageReaction.objects.filter(message=message, user=user, emoji__in=emojis)
+            .values_list('emoji', flat=True)
+        )
+
+    message.reaction_pills = reaction_pills(counts, reacted)
     return emojis
 from django.conf import settings
 from .rate_limit import (
@@ -52,10 +40,12 @@ from .rate_limit import (
 from .moderation import moderate_message
 from .channels_utils import chatroom_channel_group_name
 from .mentions import extract_mention_usernames, resolve_mentioned_users
+from .reactions import reaction_emojis, reaction_pills
 from .auto_badges import attach_auto_badges
+from .ws_metrics import InstrumentedConsumerMixin
 
 
-class GlobalAnnouncementConsumer(WebsocketConsumer):
+class GlobalAnnouncementConsumer(InstrumentedConsumerMixin, WebsocketConsumer):
     """Site-wide global announcement banner updates (real-time).
 
     Any connected client joins a single channel-layer group and receives
@@ -66,12 +56,10 @@ class GlobalAnnouncementConsumer(WebsocketConsumer):
 
     def _current_state(self):
         try:
-            ann = GlobalAnnouncement.objects.filter(pk=1).first()
-            if not ann:
-                return {'active': False, 'message': ''}
-            msg = (ann.message or '').strip()
-            active = bool(ann.is_active and msg)
-            return {'active': active, 'message': msg if active else ''}
+            from a_core.runtime_config import announcement_message
+
+            msg = announcement_message()
+            return {'active': bool(msg), 'message': msg}
         except Exception:
             return {'active': False, 'message': ''}
 
@@ -127,6 +115,89 @@ class GlobalAnnouncementConsumer(WebsocketConsumer):
             return
 
 
+class StaffMetricsConsumer(InstrumentedConsumerMixin, WebsocketConsumer):
+    """Staff-only push channel for the live analytics snapshot.
+
+    Snapshots are computed once per interval (a_rtchat.live_metrics) and fanned out
+    to this group, so the number of connected staff does not change DB load.
+    """
+
+    def connect(self):
+        self.user = _resolve_authenticated_user(self.scope.get('user'))
+        if not getattr(self.user, 'is_authenticated', False) or not getattr(self.user, 'is_staff', False):
+            try:
+                self.close(code=4403)
+            except Exception:
+                self.close()
+            return
+
+        from .live_metrics import STAFF_METRICS_GROUP
+
+        self.group_name = STAFF_METRICS_GROUP
+        try:
+            async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
+        except Exception:
+            try:
+                self.close(code=1011)
+            except Exception:
+                self.close()
+            return
+
+        try:
+            self.accept()
+        except Exception:
+            return
+
+        self._send_latest()
+
+    def disconnect(self, close_code):
+        try:
+            if getattr(self, 'group_name', None):
+                async_to_sync(self.channel_layer.group_discard)(self.group_name, self.channel_name)
+        except Exception:
+            return
+
+    def _send_latest(self):
+        try:
+            from .live_metrics import get_snapshot, public_payload
+
+            self.send(text_data=json.dumps({'type': 'live_metrics', **public_payload(get_snapshot())}))
+        except Exception:
+            return
+
+    def receive(self, text_data=None, bytes_data=None):
+        if not text_data:
+            return
+        try:
+            payload = json.loads(text_data)
+        except Exception:
+            return
+        event_type = (payload.get('type') or '').strip().lower()
+        if event_type in {'ping', 'heartbeat'}:
+            try:
+                self.send(text_data=json.dumps({'type': 'pong'}))
+            except Exception:
+                pass
+            # Without a dedicated ticker process, staff heartbeats drive the
+            # refresh; get_snapshot() recomputes at most once per interval and
+            # broadcasts the result to every staff socket.
+            try:
+                from .live_metrics import get_snapshot
+
+                get_snapshot()
+            except Exception:
+                pass
+            return
+
+    def staff_metrics_handler(self, event):
+        try:
+            from .live_metrics import public_payload
+
+            self.send(text_data=json.dumps({'type': 'live_metrics', **public_payload(event.get('snapshot') or {})}))
+        except Exception:
+            return
+
+
 def _celery_broker_configured() -> bool:
     try:
         env_broker = (os.environ.get('CELERY_BROKER_URL') or '').strip()
@@ -134,7 +205,9 @@ def _celery_broker_configured() -> bool:
         return bool(env_broker or settings_broker)
     except Exception:
         return False
-from .models_read import ChatReadState
+from . import read_state, user_flags
+from .unread import attach_unread_counts
+from .recent_messages import latest_message_id, recent_bodies
 from .models import Notification
 from .link_policy import contains_link
 from .link_preview import extract_first_http_url, fetch_link_preview
@@ -148,34 +221,53 @@ from .challenges import (
     end_challenge as challenge_end,
     cancel_challenge as challenge_cancel,
     challenge_public_state,
+    announce_challenge_end,
+    live_meta as challenge_live_meta,
     get_win_loss_totals,
 )
 
 
-def _is_chat_blocked(user) -> bool:
-    """Chat-blocked users can read chats but cannot send messages.
+class UserFlagsMixin:
+    """Per-connection snapshot of the user's own flags (see a_rtchat.user_flags).
 
-    Mirrors the intent of the HTTP views' checks; staff users are never considered blocked.
+    Loaded once at connect; `profile_flags_changed` events replace it, so block/unblock
+    and DND apply in real time without re-checking the DB on every event.
     """
-    try:
-        if getattr(user, 'is_staff', False):
-            return False
-        uid = getattr(user, 'id', None)
-        if not uid:
-            return False
 
-        # IMPORTANT: do not trust `user.profile` here.
-        # In long-lived websocket consumers the profile relation can be cached,
-        # so block/unblock wouldn't apply in real-time. Always re-check the DB.
-        from a_users.models import Profile
-        val = (
-            Profile.objects.filter(user_id=uid)
-            .values_list('chat_blocked', flat=True)
-            .first()
-        )
-        return bool(val)
-    except Exception:
-        return False
+    def _load_user_flags(self) -> None:
+        self.flags = {}
+        uid = getattr(self.user, 'id', None)
+        if not (uid and getattr(self.user, 'is_authenticated', False)):
+            return
+        try:
+            self.flags = user_flags.load_flags(self.user)
+        except Exception:
+            self.flags = {}
+        try:
+            async_to_sync(self.channel_layer.group_add)(user_flags.group_name(uid), self.channel_name)
+        except Exception:
+            pass
+
+    def _drop_user_flags(self) -> None:
+        uid = getattr(getattr(self, 'user', None), 'id', None)
+        if not uid or getattr(self, 'flags', None) is None:
+            return
+        try:
+            async_to_sync(self.channel_layer.group_discard)(user_flags.group_name(uid), self.channel_name)
+        except Exception:
+            pass
+
+    def _flag(self, name: str) -> bool:
+        return bool((getattr(self, 'flags', None) or {}).get(name))
+
+    def _is_chat_blocked(self) -> bool:
+        """Chat-blocked users can read chats but cannot send messages; staff never are."""
+        return self._flag('chat_blocked') and not self._flag('staff')
+
+    def profile_flags_changed(self, event):
+        flags = event.get('flags')
+        if isinstance(flags, dict):
+            self.flags = flags
 
 
 def _is_maintenance_blocked(user) -> bool:
@@ -200,7 +292,7 @@ def _resolve_authenticated_user(scope_user):
     except Exception:
         return scope_user
 
-class ChatroomConsumer(WebsocketConsumer):
+class ChatroomConsumer(InstrumentedConsumerMixin, UserFlagsMixin, WebsocketConsumer):
     def _send_cooldown(self, seconds: int, reason: str = '') -> None:
         try:
             secs = int(seconds or 0)
@@ -289,41 +381,10 @@ class ChatroomConsumer(WebsocketConsumer):
             return
 
     def _broadcast_challenge_end_once(self, ch, title: str = 'Challenge ended'):
-        if not ch:
-            return
+        # The claim lives in the cache, so the expiry timer, this socket and the HTTP
+        # send path can all call this and the room still sees one announcement.
         try:
-            meta = dict(getattr(ch, 'meta', None) or {})
-            if meta.get('ended_notified'):
-                return
-            meta['ended_notified'] = True
-            ch.meta = meta
-            ch.save(update_fields=['meta'])
-
-            winners = meta.get('winners') or []
-            losers = meta.get('losers') or []
-            msg = f"Winners: {len(winners)} • Losers: {len(losers)}"
-            self._broadcast_challenge_event(title, msg, state=challenge_public_state(ch))
-        except Exception:
-            return
-
-    def _maybe_announce_challenge_end(self, ch):
-        if not ch:
-            return
-        try:
-            meta = dict(getattr(ch, 'meta', None) or {})
-            if meta.get('ended_notified'):
-                return
-            meta['ended_notified'] = True
-            ch.meta = meta
-            ch.save(update_fields=['meta'])
-
-            winners = meta.get('winners') or []
-            losers = meta.get('losers') or []
-            if winners:
-                msg = f"Winners: {len(winners)} • Losers: {len(losers)}"
-            else:
-                msg = "No winners this time."
-            self._broadcast_challenge_event('Challenge ended', msg, state=challenge_public_state(ch))
+            announce_challenge_end(ch, title=title)
         except Exception:
             return
 
@@ -451,30 +512,23 @@ class ChatroomConsumer(WebsocketConsumer):
         )
         
         self.accept()
+        self._load_user_flags()
 
         # Mark current messages as read on open (best-effort).
         if getattr(self.user, 'is_authenticated', False):
             try:
-                latest_id = int(
-                    GroupMessage.objects.filter(group=self.chatroom)
-                    .order_by('-id')
-                    .values_list('id', flat=True)
-                    .first()
-                    or 0
-                )
-                ChatReadState.objects.update_or_create(
-                    user=self.user,
-                    group=self.chatroom,
-                    defaults={'last_read_message_id': latest_id},
-                )
-                async_to_sync(self.channel_layer.group_send)(
-                    self.room_group_name,
-                    {
-                        'type': 'read_receipt_handler',
-                        'reader_id': getattr(self.user, 'id', None),
-                        'last_read_id': latest_id,
-                    },
-                )
+                latest_id = latest_message_id(self.chatroom.id)
+                if latest_id is None:
+                    latest_id = int(
+                        GroupMessage.objects.filter(group=self.chatroom)
+                        .order_by('-id')
+                        .values_list('id', flat=True)
+                        .first()
+                        or 0
+                    )
+                read_state.ensure_flusher()
+                if read_state.mark_read(self.user.id, self.chatroom.id, latest_id):
+                    read_state.broadcast_receipt(self.room_group_name, self.user.id, latest_id)
             except Exception:
                 pass
 
@@ -508,6 +562,7 @@ class ChatroomConsumer(WebsocketConsumer):
             async_to_sync(self.channel_layer.group_discard)(
                 self.room_group_name, self.channel_name
             )
+        self._drop_user_flags()
         # remove and update online users
         if getattr(getattr(self, 'user', None), 'is_authenticated', False) and hasattr(self, 'chatroom'):
             try:
@@ -552,7 +607,7 @@ class ChatroomConsumer(WebsocketConsumer):
             pass
 
         # Allow blocked users to connect/read, but never allow them to send any events.
-        if _is_chat_blocked(self.user):
+        if self._is_chat_blocked():
             return
 
         muted = get_muted_seconds(getattr(self.user, 'id', 0))
@@ -640,18 +695,8 @@ class ChatroomConsumer(WebsocketConsumer):
             if last_read_id <= 0:
                 return
             try:
-                obj, _created = ChatReadState.objects.get_or_create(user=self.user, group=self.chatroom)
-                if last_read_id > int(getattr(obj, 'last_read_message_id', 0) or 0):
-                    obj.last_read_message_id = last_read_id
-                    obj.save(update_fields=['last_read_message_id', 'updated'])
-                async_to_sync(self.channel_layer.group_send)(
-                    self.room_group_name,
-                    {
-                        'type': 'read_receipt_handler',
-                        'reader_id': getattr(self.user, 'id', None),
-                        'last_read_id': last_read_id,
-                    },
-                )
+                if read_state.mark_read(self.user.id, self.chatroom.id, last_read_id):
+                    read_state.broadcast_receipt(self.room_group_name, self.user.id, last_read_id)
             except Exception:
                 pass
             return
@@ -801,7 +846,7 @@ class ChatroomConsumer(WebsocketConsumer):
                             # If everyone lost, end early.
                             try:
                                 member_ids = list(self.chatroom.members.values_list('id', flat=True))
-                                losers = set((active.meta or {}).get('losers') or [])
+                                losers = set(challenge_live_meta(active).get('losers') or [])
                                 if member_ids and losers.issuperset(set(member_ids)):
                                     ended = challenge_end(active)
                                     self._broadcast_challenge_end_once(ended, title='Challenge ended')
@@ -843,13 +888,15 @@ class ChatroomConsumer(WebsocketConsumer):
             and not getattr(self.user, 'is_staff', False)
         ):
             try:
-                last_user_msgs = list(
-                    self.chatroom.chat_messages.filter(author=self.user)
-                    .exclude(body__isnull=True)
-                    .exclude(body='')
-                    .order_by('-created')
-                    .values_list('body', flat=True)[:5]
-                )
+                last_user_msgs = recent_bodies(self.chatroom.id, author_id=self.user.id, limit=5)
+                if last_user_msgs is None:
+                    last_user_msgs = list(
+                        self.chatroom.chat_messages.filter(author=self.user)
+                        .exclude(body__isnull=True)
+                        .exclude(body='')
+                        .order_by('-created')
+                        .values_list('body', flat=True)[:5]
+                    )
             except Exception:
                 last_user_msgs = []
 
@@ -1061,7 +1108,12 @@ class ChatroomConsumer(WebsocketConsumer):
                 from .natasha_bot import trigger_natasha_reply_after_commit, NATASHA_USERNAME
 
                 if getattr(self.user, 'username', '') != NATASHA_USERNAME:
-                    trigger_natasha_reply_after_commit(self.chatroom.id, message.id)
+                    trigger_natasha_reply_after_commit(
+                        self.chatroom.id,
+                        message.id,
+                        body=body,
+                        reply_to_author_id=getattr(reply_to, 'author_id', None),
+                    )
         except Exception:
             pass
 
@@ -1242,12 +1294,7 @@ class ChatroomConsumer(WebsocketConsumer):
             try:
                 other = self.chatroom.members.exclude(id=self.user.id).first()
                 if other:
-                    other_last_read_id = int(
-                        ChatReadState.objects.filter(user=other, group=self.chatroom)
-                        .values_list('last_read_message_id', flat=True)
-                        .first()
-                        or 0
-                    )
+                    other_last_read_id = read_state.get_last_read(other.id, self.chatroom.id)
             except Exception:
                 other_last_read_id = 0
 
@@ -1322,12 +1369,7 @@ class ChatroomConsumer(WebsocketConsumer):
             try:
                 other = self.chatroom.members.exclude(id=self.user.id).first()
                 if other:
-                    other_last_read_id = int(
-                        ChatReadState.objects.filter(user=other, group=self.chatroom)
-                        .values_list('last_read_message_id', flat=True)
-                        .first()
-                        or 0
-                    )
+                    other_last_read_id = read_state.get_last_read(other.id, self.chatroom.id)
             except Exception:
                 other_last_read_id = 0
 
@@ -1348,27 +1390,38 @@ class ChatroomConsumer(WebsocketConsumer):
 
 
     def reactions_handler(self, event):
+        """Counts arrive in the event (see reactions.toggle_reaction): no DB access here.
+
+        Only the actor's own "reacted" state is known server-side; other clients keep
+        theirs from the bar they already show (data-reacted).
+        """
         message_id = event.get('message_id')
         if not message_id:
             return
-        message = GroupMessage.objects.filter(id=message_id).first()
-        if not message:
-            return
+        counts = event.get('counts') or {}
+        actor_id = event.get('actor_id')
+        added = event.get('added')
+        reacted = {added} if (added and actor_id == getattr(self.user, 'id', None)) else set()
 
-        reaction_emojis = _reaction_context_for(message, self.user)
+        message = GroupMessage(id=message_id, reaction_counts=counts)
+        message.reaction_pills = reaction_pills(counts, reacted)
         html = render_to_string(
             "a_rtchat/partials/reactions_bar.html",
             context={
                 'message': message,
                 'user': self.user,
                 'chat_group': self.chatroom,
-                'reaction_emojis': reaction_emojis,
+                'reaction_emojis': reaction_emojis(),
             },
         )
         self.send(text_data=json.dumps({
             'type': 'reactions',
             'message_id': message_id,
             'html': html,
+            'counts': counts,
+            'actor_id': actor_id,
+            'emoji': event.get('emoji') or '',
+            'added': added,
         }))
 
 
@@ -1412,13 +1465,8 @@ class ChatroomConsumer(WebsocketConsumer):
             return
 
         # DND: user should not receive call invites.
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
 
         self.send(text_data=json.dumps({
             'type': 'call_invite',
@@ -1443,13 +1491,8 @@ class ChatroomConsumer(WebsocketConsumer):
     def call_control_handler(self, event):
         """Call control signals (e.g., end call for everyone)."""
         # DND: user should not receive call UI events.
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'call_control',
             'action': event.get('action') or '',
@@ -1459,7 +1502,7 @@ class ChatroomConsumer(WebsocketConsumer):
         }))
         
         
-class OnlineStatusConsumer(WebsocketConsumer):
+class OnlineStatusConsumer(InstrumentedConsumerMixin, WebsocketConsumer):
     def _active_start_key(self) -> str:
         return f"online_status_active_start:{getattr(self.user, 'id', 0)}"
 
@@ -1483,44 +1526,11 @@ class OnlineStatusConsumer(WebsocketConsumer):
             return None
 
     def _add_active_seconds(self, start_ts: int, end_ts: int) -> None:
-        """Accumulate active seconds into a_users.DailyUserActivity, split by local day."""
+        """Accumulate active seconds toward a_users.DailyUserActivity (buffered, flushed in bulk)."""
         try:
-            if not start_ts or not end_ts:
-                return
-            if end_ts <= start_ts:
-                return
+            from a_users.activity import add_active_seconds
 
-            from a_users.models import DailyUserActivity
-            from django.db.models import F
-
-            start_dt = timezone.localtime(datetime.datetime.fromtimestamp(start_ts, tz=datetime.timezone.utc))
-            end_dt = timezone.localtime(datetime.datetime.fromtimestamp(end_ts, tz=datetime.timezone.utc))
-
-            cur = start_dt
-            while cur.date() < end_dt.date():
-                next_midnight = (cur + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-                secs = int((next_midnight - cur).total_seconds())
-                if secs > 0:
-                    DailyUserActivity.objects.update_or_create(
-                        user_id=getattr(self.user, 'id', None),
-                        date=cur.date(),
-                        defaults={},
-                    )
-                    DailyUserActivity.objects.filter(user_id=getattr(self.user, 'id', None), date=cur.date()).update(
-                        active_seconds=F('active_seconds') + secs
-                    )
-                cur = next_midnight
-
-            secs = int((end_dt - cur).total_seconds())
-            if secs > 0:
-                DailyUserActivity.objects.update_or_create(
-                    user_id=getattr(self.user, 'id', None),
-                    date=cur.date(),
-                    defaults={},
-                )
-                DailyUserActivity.objects.filter(user_id=getattr(self.user, 'id', None), date=cur.date()).update(
-                    active_seconds=F('active_seconds') + secs
-                )
+            add_active_seconds(getattr(self.user, 'id', None), start_ts, end_ts)
         except Exception:
             return
 
@@ -1592,6 +1602,12 @@ class OnlineStatusConsumer(WebsocketConsumer):
                 pass
             # Start activity window when the first tab connects.
             self._set_active_start_if_missing()
+            try:
+                from a_users.activity import ensure_flusher
+
+                ensure_flusher()
+            except Exception:
+                pass
             
         try:
             async_to_sync(self.channel_layer.group_add)(
@@ -1721,6 +1737,7 @@ class OnlineStatusConsumer(WebsocketConsumer):
             context = {
                 'online_users': online_users,
                 'online_in_chats': online_in_chats,
+                'chat_groups': attach_unread_counts(self.user, my_chats),
                 'public_chat_users': public_chat_users,
                 'total_online': total_online,
                 'user': self.user
@@ -1732,7 +1749,7 @@ class OnlineStatusConsumer(WebsocketConsumer):
             return
 
 
-class NotificationsConsumer(WebsocketConsumer):
+class NotificationsConsumer(InstrumentedConsumerMixin, UserFlagsMixin, WebsocketConsumer):
     """Per-user websocket for global notifications (e.g., call invites).
 
     This allows users to receive incoming call toasts even if they switch to a
@@ -1764,6 +1781,7 @@ class NotificationsConsumer(WebsocketConsumer):
             self.accept()
         except Exception:
             return
+        self._load_user_flags()
 
     def disconnect(self, close_code):
         try:
@@ -1772,6 +1790,7 @@ class NotificationsConsumer(WebsocketConsumer):
             )
         except Exception:
             pass
+        self._drop_user_flags()
 
     def receive(self, text_data=None, bytes_data=None):
         if not text_data:
@@ -1790,13 +1809,8 @@ class NotificationsConsumer(WebsocketConsumer):
 
     def call_invite_notify_handler(self, event):
         # DND: user should not receive call invites.
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'call_invite',
             'call_type': event.get('call_type') or 'voice',
@@ -1808,13 +1822,8 @@ class NotificationsConsumer(WebsocketConsumer):
 
     def call_control_notify_handler(self, event):
         # DND: user should not receive call UI events.
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'call_control',
             'action': event.get('action') or '',
@@ -1824,13 +1833,8 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
     def mention_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'mention',
             'from_username': event.get('from_username') or '',
@@ -1840,13 +1844,8 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
     def reply_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'reply',
             'from_username': event.get('from_username') or '',
@@ -1856,13 +1855,8 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
     def follow_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'follow',
             'from_username': event.get('from_username') or '',
@@ -1871,13 +1865,8 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
     def support_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'support',
             'preview': event.get('preview') or '',
@@ -1885,13 +1874,8 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
     def chat_block_status_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
 
         self.send(text_data=json.dumps({
             'type': 'chat_block_status',
@@ -1900,7 +1884,7 @@ class NotificationsConsumer(WebsocketConsumer):
         }))
 
 
-class ProfilePresenceConsumer(WebsocketConsumer):
+class ProfilePresenceConsumer(InstrumentedConsumerMixin, UserFlagsMixin, WebsocketConsumer):
     """Realtime online/offline for a single user's profile page."""
 
     def connect(self):
@@ -1969,6 +1953,7 @@ class ProfilePresenceConsumer(WebsocketConsumer):
             )
         except Exception:
             pass
+        self._load_user_flags()
 
         # Initial state
         try:
@@ -1988,6 +1973,7 @@ class ProfilePresenceConsumer(WebsocketConsumer):
                 )
         except Exception:
             pass
+        self._drop_user_flags()
 
     def online_status_handler(self, event):
         """Recompute target's visible online state whenever the global presence changes."""
@@ -2034,13 +2020,8 @@ class ProfilePresenceConsumer(WebsocketConsumer):
             return
 
     def chat_block_status_notify_handler(self, event):
-        try:
-            from a_users.models import Profile
-
-            if Profile.objects.filter(user_id=getattr(self.user, 'id', None), is_dnd=True).exists():
-                return
-        except Exception:
-            pass
+        if self._flag('dnd'):
+            return
         self.send(text_data=json.dumps({
             'type': 'chat_block_status',
             'blocked': bool(event.get('blocked')),
@@ -98,12 +98,8 @@ def mobile_ads_config(request):
 def global_announcement(request):
     """Expose the current active global announcement (staff-set) to templates."""
     try:
-        from a_rtchat.models import GlobalAnnouncement
+        from a_core.runtime_config import announcement_message
 
-        ann = GlobalAnnouncement.objects.filter(is_active=True).order_by('-updated_at').first()
-        msg = (getattr(ann, 'message', '') or '').strip()
-        if not msg:
-            return {'GLOBAL_ANNOUNCEMENT_MESSAGE': ''}
-        return {'GLOBAL_ANNOUNCEMENT_MESSAGE': msg}
+        return {'GLOBAL_ANNOUNCEMENT_MESSAGE': announcement_message()}
     except Exception:
         return {'GLOBAL_ANNOUNCEMENT_MESSAGE': ''}
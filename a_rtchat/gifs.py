@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .templatetags.chat_extras import giphy_mp4_url, giphy_still_url
+
+
+logger = logging.getLogger(__name__)
+
+
+# Server-side Giphy search for the GIF picker.
+#
+# Browsers used to call api.giphy.com themselves with the key from the chat config, so
+# every client repeated the same trending/search requests. search() and trending() now
+# go through one keep-alive session per process and cache a compact page per
+# (query, offset) in the shared cache, so popular terms cost one upstream call per TTL
+# for the whole site. Trending pages are refreshed ahead of expiry on the gif worker
+# pool (and the next page is warmed) so the picker's first paint is a cache hit.
+#
+# Records carry only what the picker and message bubble use: the GIF URL that gets
+# sent, its MP4 and still renditions (same rules as the giphy_mp4_url/giphy_still_url
+# filters when Giphy omits them) and the dimensions.
+
+API_BASE = 'https://api.giphy.com/v1/gifs'
+MAX_QUERY_CHARS = 50
+MAX_OFFSET = 4999  # Giphy rejects larger offsets.
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+_runtime = None
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+class GifSearchError(Exception):
+    pass
+
+
+def _upstream_error(endpoint: str, exc: Exception) -> GifSearchError:
+    # Never str(exc): requests puts the full URL, api_key included, in its messages.
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    reason = f"HTTP {status}" if status else type(exc).__name__
+    return GifSearchError(f"giphy {endpoint.rsplit('/', 1)[-1]}: {reason}")
+
+
+def _setting_int(name: str, default: int) -> int:
+    try:
+        return int(getattr(settings, name, default))
+    except Exception:
+        return default
+
+
+def api_key() -> str:
+    return str(getattr(settings, 'GIPHY_API_KEY', '') or '').strip()
+
+
+def page_size() -> int:
+    return max(1, min(_setting_int('GIF_SEARCH_LIMIT', 30), 50))
+
+
+def _search_ttl() -> int:
+    return max(30, _setting_int('GIF_SEARCH_CACHE_SECONDS', 600))
+
+
+def _trending_ttl() -> int:
+    return max(30, _setting_int('GIF_TRENDING_CACHE_SECONDS', 300))
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session for api.giphy.com."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                pool_size = max(1, _setting_int('GIF_HTTP_POOL_SIZE', 4))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                s.mount('https://', adapter)
+                _SESSION = s
+    return _SESSION
+
+
+def get_runtime():
+    """Worker pool for trending refreshes (never blocks a request)."""
+    global _runtime
+    if _runtime is None:
+        from .bot_runtime import BotRuntime
+
+        _runtime = BotRuntime(name='gifs', workers=1, max_pending=10)
+    return _runtime
+
+
+def normalize_query(q: str) -> str:
+    return _SPACE_RE.sub(' ', (q or '').strip().lower())[:MAX_QUERY_CHARS].strip()
+
+
+def normalize_offset(offset) -> int:
+    """Clamp and align to page boundaries, so every client shares the same cache pages."""
+    try:
+        value = int(offset or 0)
+    except (TypeError, ValueError):
+        value = 0
+    value = max(0, min(value, MAX_OFFSET))
+    return value - (value % page_size())
+
+
+def _cache_key(query: str, offset: int) -> str:
+    if not query:
+        return f"gifs:trending:v1:{offset}:{page_size()}"
+    digest = hashlib.sha1(query.encode('utf-8')).hexdigest()[:20]
+    return f"gifs:search:v1:{digest}:{offset}:{page_size()}"
+
+
+def _int(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def compact(item: dict) -> dict | None:
+    """One Giphy result reduced to {id, title, url, mp4, still, thumb, width, height}."""
+    images = (item or {}).get('images') or {}
+    fixed = images.get('fixed_width') or {}
+    url = str(fixed.get('url') or '').strip()
+    if not url:
+        return None
+    small = images.get('fixed_width_small') or {}
+    still = images.get('fixed_width_still') or {}
+    return {
+        'id': str(item.get('id') or '')[:64],
+        'title': str(item.get('title') or '')[:120],
+        'url': url,
+        'mp4': str(fixed.get('mp4') or '') or giphy_mp4_url(url),
+        'still': str(still.get('url') or '') or giphy_still_url(url),
+        'thumb': str(small.get('url') or '') or url,
+        'width': _int(fixed.get('width')),
+        'height': _int(fixed.get('height')),
+    }
+
+
+def _fetch(query: str, offset: int) -> dict:
+    key = api_key()
+    if not key:
+        raise GifSearchError('GIPHY_API_KEY is not configured')
+    params = {
+        'api_key': key,
+        'limit': page_size(),
+        'offset': offset,
+        'rating': str(getattr(settings, 'GIF_SEARCH_RATING', 'pg-13') or 'pg-13'),
+    }
+    endpoint = f"{API_BASE}/trending"
+    if query:
+        endpoint = f"{API_BASE}/search"
+        params['q'] = query
+    timeout = max(1, _setting_int('GIF_HTTP_TIMEOUT_SECONDS', 5))
+    try:
+        resp = get_session().get(endpoint, params=params, timeout=timeout)
+        resp.raise_for_status()
+        payload = resp.json()
+    except (requests.RequestException, ValueError) as exc:
+        raise _upstream_error(endpoint, exc) from None
+
+    results = [r for r in (compact(item) for item in (payload.get('data') or [])) if r]
+    pagination = payload.get('pagination') or {}
+    total = _int(pagination.get('total_count'))
+    next_offset = offset + page_size()
+    has_more = bool(results) and next_offset <= MAX_OFFSET and (not total or next_offset < total)
+    return {
+        'results': results,
+        'next_offset': next_offset if has_more else None,
+        'fetched_at': time.time(),
+    }
+
+
+def _store(query: str, offset: int, page: dict) -> None:
+    ttl = _search_ttl() if query else _trending_ttl()
+    try:
+        cache.set(_cache_key(query, offset), page, timeout=ttl)
+    except Exception:
+        pass
+
+
+def _refresh_trending(offset: int) -> None:
+    try:
+        _store('', offset, _fetch('', offset))
+    except GifSearchError as exc:
+        logger.info("gif trending refresh failed: %s", exc)
+    finally:
+        try:
+            cache.delete(f"gifs:trending:refresh:{offset}")
+        except Exception:
+            pass
+
+
+def _schedule_trending_refresh(offset: int) -> None:
+    # One refresh per page at a time across processes.
+    try:
+        if not cache.add(f"gifs:trending:refresh:{offset}", 1, timeout=60):
+            return
+    except Exception:
+        return
+    if not get_runtime().submit(_refresh_trending, offset):
+        cache.delete(f"gifs:trending:refresh:{offset}")
+
+
+def _public(page: dict, query: str, offset: int, cached: bool) -> dict:
+    return {
+        'query': query,
+        'offset': offset,
+        'next_offset': page.get('next_offset'),
+        'results': page.get('results') or [],
+        'cached': cached,
+    }
+
+
+def search(q: str = '', offset=0) -> dict:
+    """A page of compact results for `q` (trending when empty), from cache when possible.
+
+    Raises GifSearchError when the page isn't cached and Giphy can't be reached.
+    """
+    query = normalize_query(q)
+    offset = normalize_offset(offset)
+    try:
+        page = cache.get(_cache_key(query, offset))
+    except Exception:
+        page = None
+
+    if page is not None:
+        if not query:
+            # Refresh ahead of expiry so nobody waits on the upstream call.
+            age = time.time() - float(page.get('fetched_at') or 0)
+            if age > _trending_ttl() * 0.75:
+                _schedule_trending_refresh(offset)
+        return _public(page, query, offset, cached=True)
+
+    page = _fetch(query, offset)
+    _store(query, offset, page)
+    if not query and page.get('next_offset') is not None:
+        # The picker's next scroll is almost always the following trending page.
+        _schedule_trending_refresh(page['next_offset'])
+    return _public(page, query, offset, cached=False)
+
+
+def prefetch_trending(pages: int = 2) -> int:
+    """Warm the first trending pages now (deploy hook / cron). Returns pages stored."""
+    stored = 0
+    for i in range(max(1, int(pages))):
+        try:
+            _store('', i * page_size(), _fetch('', i * page_size()))
+            stored += 1
+        except GifSearchError as exc:
+            logger.info("gif trending prefetch failed: %s", exc)
+            break
+    return stored
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+
+# Channel-layer group joined by StaffMetricsConsumer (staff only).
+STAFF_METRICS_GROUP = 'staff_metrics'
+
+SNAPSHOT_KEY = 'admin:live_metrics:snapshot'
+REFRESH_LOCK_KEY = 'admin:live_metrics:refresh_lock'
+
+
+def refresh_interval_seconds() -> int:
+    try:
+        return max(1, int(getattr(settings, 'ADMIN_LIVE_METRICS_INTERVAL_SECONDS', 5)))
+    except Exception:
+        return 5
+
+
+def _today_localdate():
+    try:
+        return timezone.localdate()
+    except Exception:
+        return timezone.now().date()
+
+
+def global_online_user_count() -> int:
+    """Best-effort global online users count.
+
+    Presence is driven by websockets updating ChatGroup.users_online.
+    """
+    from .models import ChatGroup
+
+    try:
+        through = ChatGroup.users_online.through
+        return int(through.objects.values('user_id').distinct().count())
+    except Exception:
+        try:
+            User = get_user_model()
+            return int(User.objects.filter(online_in_groups__isnull=False).distinct().count())
+        except Exception:
+            return 0
+
+
+def get_and_update_peak_today(current: int) -> int:
+    today = _today_localdate().isoformat()
+    key = f"admin:online_peak:{today}"
+    try:
+        prev = int(cache.get(key) or 0)
+    except Exception:
+        prev = 0
+    peak = max(prev, int(current or 0))
+    if peak != prev:
+        try:
+            cache.set(key, peak, timeout=60 * 60 * 48)
+        except Exception:
+            pass
+    return peak
+
+
+def compute_snapshot() -> dict:
+    """Run the live metric queries once. Callers should go through get_snapshot()."""
+    from a_users.models import SupportEnquiry, UserReport
+
+    from .analytics import daily_totals
+
+    today = _today_localdate()
+    online_now = global_online_user_count()
+    today_totals = daily_totals(start=today).get(today, {})
+
+    metrics = {
+        'online_now': int(online_now),
+        'peak_today': int(get_and_update_peak_today(online_now)),
+        'messages_today': int(today_totals.get('messages', 0)),
+        'blocked_today': int(today_totals.get('blocked', 0)),
+        'open_reports': int(UserReport.objects.filter(status=UserReport.STATUS_OPEN).count()),
+        'open_enquiries': int(SupportEnquiry.objects.filter(status=SupportEnquiry.STATUS_OPEN).count()),
+    }
+    # The ETag only changes when a number changes, not on every tick.
+    etag = hashlib.sha1(json.dumps(metrics, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return {
+        **metrics,
+        'ts': timezone.now().isoformat(),
+        'computed_at': timezone.now().timestamp(),
+        'etag': etag,
+    }
+
+
+def broadcast_snapshot(snapshot: dict) -> None:
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        async_to_sync(channel_layer.group_send)(
+            STAFF_METRICS_GROUP,
+            {'type': 'staff_metrics_handler', 'snapshot': snapshot},
+        )
+    except Exception:
+        return
+
+
+def refresh_snapshot(*, broadcast: bool = True) -> dict:
+    """Recompute, store and (optionally) push the snapshot to connected staff sockets."""
+    snapshot = compute_snapshot()
+    try:
+        cache.set(SNAPSHOT_KEY, snapshot, timeout=refresh_interval_seconds() * 12)
+    except Exception:
+        pass
+    if broadcast:
+        broadcast_snapshot(snapshot)
+    return snapshot
+
+
+def get_snapshot() -> dict:
+    """Return the latest snapshot, refreshing at most once per interval across all callers.
+
+    When the `live_metrics_ticker` command runs, the cached snapshot is always fresh
+    and this is a single cache read. Without it, the first caller after the interval
+    takes a short lock and refreshes; everyone else keeps getting the cached copy.
+    """
+    interval = refresh_interval_seconds()
+    try:
+        snapshot = cache.get(SNAPSHOT_KEY)
+    except Exception:
+        snapshot = None
+
+    now_ts = timezone.now().timestamp()
+    if snapshot and (now_ts - float(snapshot.get('computed_at') or 0)) < interval:
+        return snapshot
+
+    try:
+        acquired = bool(cache.add(REFRESH_LOCK_KEY, '1', timeout=interval))
+    except Exception:
+        acquired = True
+
+    if acquired or not snapshot:
+        try:
+            return refresh_snapshot()
+        except Exception:
+            return snapshot or {}
+    return snapshot
+
+
+def public_payload(snapshot: dict) -> dict:
+    """Strip internal bookkeeping fields before sending a snapshot to clients."""
+    return {k: v for k, v in (snapshot or {}).items() if k not in {'computed_at', 'etag'}}
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Providers known to this layer. "fake" is a local stand-in for offline benchmarks.
+PROVIDER_GROQ = 'groq'
+PROVIDER_OPENROUTER = 'openrouter'
+PROVIDER_FAKE = 'fake'
+
+
+def _setting_int(name: str, default: int) -> int:
+    try:
+        return int(getattr(settings, name, default))
+    except Exception:
+        return default
+
+
+# ---------------------------------------------------------------------------
+# Pooled HTTP session
+# ---------------------------------------------------------------------------
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide keep-alive session, so each LLM call skips the TCP/TLS handshake."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                pool_size = max(1, _setting_int('LLM_HTTP_POOL_SIZE', 4))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                s.mount('https://', adapter)
+                s.mount('http://', adapter)
+                _SESSION = s
+    return _SESSION
+
+
+# ---------------------------------------------------------------------------
+# Timing metrics (process-local)
+# ---------------------------------------------------------------------------
+
+_METRICS_LOCK = threading.Lock()
+_METRICS: dict[str, dict] = {}
+_SAMPLE_SIZE = 200
+
+
+def _record(provider: str, kind: str, elapsed_ms: float, status: str) -> None:
+    key = f"{provider}:{kind}"
+    with _METRICS_LOCK:
+        m = _METRICS.get(key)
+        if m is None:
+            m = {'requests': 0, 'errors': 0, 'total_ms': 0.0, 'samples': deque(maxlen=_SAMPLE_SIZE)}
+            _METRICS[key] = m
+        m['requests'] += 1
+        if status != 'ok':
+            m['errors'] += 1
+        m['total_ms'] += float(elapsed_ms)
+        m['samples'].append(float(elapsed_ms))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def metrics_snapshot() -> dict:
+    """Per provider/call-kind counters and latency percentiles (last 200 calls) for this process."""
+    with _METRICS_LOCK:
+        rows = {k: (dict(v), list(v['samples'])) for k, v in _METRICS.items()}
+    out = {}
+    for key, (m, samples) in rows.items():
+        out[key] = {
+            'requests': m['requests'],
+            'errors': m['errors'],
+            'avg_ms': round(m['total_ms'] / m['requests'], 1) if m['requests'] else 0.0,
+            'p50_ms': round(percentile(samples, 50), 1),
+            'p95_ms': round(percentile(samples, 95), 1),
+        }
+    return out
+
+
+def reset_metrics() -> None:
+    with _METRICS_LOCK:
+        _METRICS.clear()
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker (shared through the cache)
+# ---------------------------------------------------------------------------
+
+def _breaker_key(provider: str, field: str) -> str:
+    return f"llm:breaker:{provider}:{field}"
+
+
+def circuit_open(provider: str) -> bool:
+    try:
+        return bool(cache.get(_breaker_key(provider, 'open')))
+    except Exception:
+        return False
+
+
+def _trips_breaker(status_code: int) -> bool:
+    # 429 rate limit, 402 OpenRouter credits, and upstream 5xx.
+    return status_code in {402, 429} or 500 <= status_code < 600
+
+
+def _note_result(provider: str, status_code: int) -> None:
+    """Open the breaker after repeated 429/5xx, or at once for a rate limit."""
+    try:
+        if not _trips_breaker(status_code):
+            if 200 <= status_code < 300:
+                cache.delete(_breaker_key(provider, 'failures'))
+            return
+        threshold = max(1, _setting_int('LLM_BREAKER_THRESHOLD', 3))
+        cooldown = max(1, _setting_int('LLM_BREAKER_COOLDOWN_SECONDS', 120))
+        key = _breaker_key(provider, 'failures')
+        cache.add(key, 0, timeout=cooldown)
+        failures = int(cache.incr(key))
+        if status_code in {402, 429} or failures >= threshold:
+            cache.set(_breaker_key(provider, 'open'), status_code, timeout=cooldown)
+            cache.delete(key)
+    except Exception:
+        return
+
+
+def reset_breaker(provider: str) -> None:
+    try:
+        cache.delete_many([_breaker_key(provider, 'open'), _breaker_key(provider, 'failures')])
+    except Exception:
+        return
+
+
+class CircuitOpen(Exception):
+    """Raised by post_json() while a provider's breaker is open."""
+
+
+# ---------------------------------------------------------------------------
+# Requests
+# ---------------------------------------------------------------------------
+
+def post_json(provider: str, url: str, *, headers: dict, payload: dict, timeout: float):
+    """POST through the pooled session with breaker checks and timing. Returns the response."""
+    if circuit_open(provider):
+        raise CircuitOpen(provider)
+    started = time.monotonic()
+    status = 'exception'
+    try:
+        res = get_session().post(url, headers=headers, json=payload, timeout=timeout)
+        status = 'ok' if res.ok else f"http_{int(res.status_code)}"
+        _note_result(provider, int(res.status_code))
+        return res
+    except requests.RequestException:
+        _note_result(provider, 503)
+        raise
+    finally:
+        _record(provider, 'chat', (time.monotonic() - started) * 1000.0, status)
+
+
+def list_models(provider: str, url: str, api_key: str, *, timeout: float) -> list[str]:
+    """Return a provider's model IDs, cached for LLM_MODEL_LIST_TTL_SECONDS (best-effort)."""
+    key = f"llm:models:{provider}"
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return list(cached)
+
+    started = time.monotonic()
+    status = 'exception'
+    ids: list[str] = []
+    try:
+        res = get_session().get(url, headers={'Authorization': f"Bearer {api_key}"}, timeout=timeout)
+        status = 'ok' if res.ok else f"http_{int(res.status_code)}"
+        if res.ok:
+            data = res.json() or {}
+            for row in (data.get('data') or []):
+                mid = (row or {}).get('id')
+                if mid:
+                    ids.append(str(mid))
+    except Exception:
+        ids = []
+    finally:
+        _record(provider, 'models', (time.monotonic() - started) * 1000.0, status)
+
+    # Cache failures briefly too, so a broken /models endpoint isn't hit per reply.
+    ttl = _setting_int('LLM_MODEL_LIST_TTL_SECONDS', 6 * 60 * 60) if ids else 60
+    try:
+        cache.set(key, ids, timeout=ttl)
+    except Exception:
+        pass
+    return ids
+
+
+# ---------------------------------------------------------------------------
+# Fake provider
+# ---------------------------------------------------------------------------
+
+def fake_enabled() -> bool:
+    try:
+        raw = (os.environ.get('LLM_PROVIDER') or getattr(settings, 'LLM_PROVIDER', '') or '').strip().lower()
+    except Exception:
+        raw = ''
+    return raw == PROVIDER_FAKE
+
+
+def fake_chat_completion(prompt: str) -> tuple[str, str]:
+    """Deterministic local reply after LLM_FAKE_LATENCY_MS, for offline benchmarks and tests."""
+    started = time.monotonic()
+    latency_ms = max(0, _setting_int('LLM_FAKE_LATENCY_MS', 0))
+    if latency_ms:
+        time.sleep(latency_ms / 1000.0)
+    last_line = ((prompt or '').strip().splitlines() or [''])[-1]
+    reply = f"lol ok ({len(prompt or '')} chars, last: {last_line[:40]})"
+    _record(PROVIDER_FAKE, 'chat', (time.monotonic() - started) * 1000.0, 'ok')
+    return reply[:240], 'ok'
+
+
+def timed(provider: str, kind: str, fn: Callable, *args, **kwargs):
+    """Run fn and record its duration under provider/kind."""
+    started = time.monotonic()
+    status = 'exception'
+    try:
+        result = fn(*args, **kwargs)
+        status = 'ok'
+        return result
+    finally:
+        _record(provider, kind, (time.monotonic() - started) * 1000.0, status)
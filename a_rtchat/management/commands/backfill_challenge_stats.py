@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.challenges import rebuild_challenge_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the ChallengeStats table (wins/losses per user and per room) from "
+        "completed and cancelled challenges. Existing rows are replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=1000,
+            help="Iterator chunk / bulk_create batch size (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        batch = max(1, int(options.get("batch") or 1))
+        written = rebuild_challenge_stats(batch_size=batch)
+        self.stdout.write(f"backfill_challenge_stats: {written} rows")
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from a_rtchat.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the analytics rollup tables (ChatStatsHourly/ChatStatsDaily) from existing "
+        "messages, blocked events and moderation events. Rows in the rebuilt range are replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=0,
+            help="Only rebuild the last N days including today (default: 0 = everything)",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=1000,
+            help="bulk_create batch size (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        days = max(0, int(options.get("days") or 0))
+        batch = max(1, int(options.get("batch") or 1))
+
+        since_date = None
+        if days:
+            since_date = timezone.localdate() - timedelta(days=days - 1)
+
+        written = rebuild_rollups(since_date=since_date, batch_size=batch)
+        scope = f"since {since_date.isoformat()}" if since_date else "all time"
+        self.stdout.write(
+            f"backfill_chat_stats ({scope}): {written['hourly']} hourly rows, {written['daily']} daily rows"
+        )
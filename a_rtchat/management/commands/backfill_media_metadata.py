@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.media_pipeline import backfill_metadata
+
+
+class Command(BaseCommand):
+    help = (
+        "Record kind, mime type, dimensions, size and duration for chat uploads made "
+        "before these were captured at upload. Files are read with bounded parallelism."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=200,
+            help="Messages probed per batch (default: 200)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Concurrent storage reads (default: MEDIA_BACKFILL_WORKERS or 4)",
+        )
+
+    def handle(self, *args, **options):
+        result = backfill_metadata(
+            batch_size=max(1, int(options.get("batch") or 1)),
+            workers=options.get("workers"),
+        )
+        self.stdout.write(f"backfill_media_metadata: updated={result['updated']} failed={result['failed']}")
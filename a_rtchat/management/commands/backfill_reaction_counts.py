@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.reactions import recount
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild GroupMessage.reaction_counts from MessageReaction rows. Only needed "
+        "after reactions were changed outside message_react_toggle (admin, raw SQL)."
+    )
+
+    def handle(self, *args, **options):
+        updated = recount()
+        self.stdout.write(f"backfill_reaction_counts: {updated} messages")
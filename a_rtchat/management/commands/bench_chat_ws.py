@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import platform
+import time
+
+import channels
+import django
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from a_rtchat import llm_client, ws_bench, ws_metrics
+
+
+SCENARIOS = ('chat', 'presence', 'reactions', 'history')
+
+# The benchmark measures the stack, not the abuse limits in front of it.
+_UNLIMITED = 1_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the realtime chat stack in-process: N clients sending to public chat, "
+        "presence connect/disconnect churn, reaction storms and history paging. Runs offline "
+        "in a throwaway test database with the in-memory channel layer and a local cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma list of: {', '.join(SCENARIOS)}")
+        parser.add_argument("--clients", type=int, default=20, help="Chat clients in public chat (default: 20)")
+        parser.add_argument("--messages", type=int, default=10, help="Messages each chat client sends (default: 10)")
+        parser.add_argument("--rate", type=float, default=0.0, help="Messages/s per client, 0 = unthrottled (default: 0)")
+        parser.add_argument("--presence-clients", type=int, default=20)
+        parser.add_argument("--presence-cycles", type=int, default=5)
+        parser.add_argument("--listeners", type=int, default=10, help="Sockets watching the reaction storm (default: 10)")
+        parser.add_argument("--reactors", type=int, default=5)
+        parser.add_argument("--reactions", type=int, default=10, help="Toggles per reactor (default: 10)")
+        parser.add_argument("--history-messages", type=int, default=500)
+        parser.add_argument("--pages", type=int, default=10)
+        parser.add_argument("--output", default="", help="Also write the JSON result to this file.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable JSON only.")
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in (options.get("scenarios") or "").split(",") if s.strip()]
+        unknown = sorted(set(scenarios) - set(SCENARIOS))
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        def _n(name: str) -> int:
+            return max(1, int(options.get(name) or 1))
+
+        params = {
+            "scenarios": scenarios,
+            "clients": _n("clients"),
+            "messages": _n("messages"),
+            "rate": max(0.0, float(options.get("rate") or 0.0)),
+            "presence_clients": _n("presence_clients"),
+            "presence_cycles": _n("presence_cycles"),
+            "listeners": _n("listeners"),
+            "reactors": _n("reactors"),
+            "reactions": _n("reactions"),
+            "history_messages": _n("history_messages"),
+            "pages": _n("pages"),
+        }
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer", "CONFIG": {"capacity": 10000}}},
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-chat-ws"}},
+                ALLOWED_HOSTS=["testserver", "localhost"],
+                AI_MODERATION_ENABLED=0,
+                GEMINI_API_KEY="",
+                LLM_PROVIDER=llm_client.PROVIDER_FAKE,
+                WS_METRICS_ENABLED=True,
+                WS_MSG_RATE_LIMIT=_UNLIMITED,
+                WS_TYPING_RATE_LIMIT=_UNLIMITED,
+                CHAT_POLL_RATE_LIMIT=_UNLIMITED,
+            ):
+                results = self._run(params)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            ws_metrics.reset()
+
+        result = {
+            "params": params,
+            "env": {
+                "timestamp": int(time.time()),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "channels": channels.__version__,
+                "database": connection.vendor,
+            },
+            "results": results,
+        }
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(result, fh, indent=2)
+        if options.get("json"):
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(f"bench_chat_ws: {self._headline(results)}")
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def _run(self, params: dict) -> dict:
+        results = {}
+        scenarios = params["scenarios"]
+        if "chat" in scenarios:
+            users = ws_bench.bench_users(params["clients"], prefix="wsbench-chat")
+            results["chat"] = async_to_sync(ws_bench.chat_send)(users, messages=params["messages"], rate=params["rate"])
+        if "presence" in scenarios:
+            users = ws_bench.bench_users(params["presence_clients"], prefix="wsbench-presence")
+            results["presence"] = async_to_sync(ws_bench.presence_churn)(users, cycles=params["presence_cycles"])
+        if "reactions" in scenarios:
+            listeners = ws_bench.bench_users(params["listeners"], prefix="wsbench-listen")
+            reactors = ws_bench.bench_users(params["reactors"], prefix="wsbench-react")
+            results["reactions"] = async_to_sync(ws_bench.reaction_storm)(listeners, reactors, toggles=params["reactions"])
+        if "history" in scenarios:
+            reader = ws_bench.bench_users(1, prefix="wsbench-reader")[0]
+            results["history"] = ws_bench.history_paging(reader, seed_messages=params["history_messages"], pages=params["pages"])
+        return results
+
+    @staticmethod
+    def _headline(results: dict) -> str:
+        parts = []
+        if "chat" in results:
+            r = results["chat"]
+            parts.append(f"chat {r['messages_per_s']} msg/s, delivery p95 {r['delivery_ms']['p95']} ms")
+        if "presence" in results:
+            r = results["presence"]
+            parts.append(f"presence {r['ops_per_s']} ops/s")
+        if "reactions" in results:
+            r = results["reactions"]
+            parts.append(f"reactions {r['toggles_per_s']}/s, {r['queries_per_toggle']['avg']} queries each")
+        if "history" in results:
+            r = results["history"]
+            parts.append(f"history p95 {r['page_ms']['p95']} ms/page, {r['queries_per_page']['avg']} queries")
+        return "; ".join(parts) or "no scenarios"
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.llm_client import percentile
+from a_rtchat.media_pipeline import analyze_image
+
+
+# Typical phone / screenshot sizes for the synthetic corpus.
+SYNTHETIC_SIZES = ((4032, 3024), (3024, 4032), (1920, 1080), (1170, 2532), (1280, 960), (800, 600), (480, 480))
+
+
+def _synthetic_corpus(count: int, seed: int) -> list[tuple[str, bytes]]:
+    """Noisy gradient JPEGs with EXIF (camera, GPS-ish tags) attached, like phone photos."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        width, height = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        base = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), rng.randint(20, 60))
+        img = Image.merge('RGB', (base, noise, base.rotate(90).resize((width, height))))
+        exif = Image.Exif()
+        exif[0x010F] = 'BenchCam'  # Make
+        exif[0x0110] = 'Model X'  # Model
+        exif[0x0112] = rng.choice((1, 6))  # Orientation
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=92, exif=exif.tobytes())
+        corpus.append((f"synthetic_{i}_{width}x{height}.jpg", buf.getvalue()))
+    return corpus
+
+
+def _dir_corpus(path: str) -> list[tuple[str, bytes]]:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            with open(full, 'rb') as fh:
+                corpus.append((name, fh.read()))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the bytes the media pipeline saves: original vs display variant vs thumbnail, "
+        "over a synthetic photo corpus or a directory of real uploads. Nothing is stored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=14, help="Synthetic images to generate (default: 14)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--dir", default="", help="Benchmark the files in this directory instead.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable JSON only.")
+
+    def handle(self, *args, **options):
+        if options.get("dir"):
+            corpus = _dir_corpus(options["dir"])
+        else:
+            corpus = _synthetic_corpus(max(1, int(options.get("count") or 1)), int(options.get("seed") or 0))
+
+        original = display = thumb = 0
+        images = skipped = 0
+        durations: list[float] = []
+        for _name, data in corpus:
+            started = time.monotonic()
+            info = analyze_image(data)
+            durations.append((time.monotonic() - started) * 1000.0)
+            if not info or not info['display']:
+                skipped += 1
+                continue
+            images += 1
+            original += len(data)
+            display += len(info['display'])
+            # Narrow images have no thumbnail; the display variant is what list views load.
+            thumb += len(info['thumb'] or info['display'])
+
+        def _saved(variant: int) -> float:
+            return round(100.0 * (1 - variant / original), 1) if original else 0.0
+
+        result = {
+            "files": len(corpus),
+            "images": images,
+            "skipped": skipped,
+            "bytes": {"original": original, "display": display, "thumb": thumb},
+            "saved_pct": {"display": _saved(display), "thumb": _saved(thumb)},
+            "process_ms": {
+                "p50": round(percentile(durations, 50), 2),
+                "p95": round(percentile(durations, 95), 2),
+                "max": round(max(durations), 2) if durations else 0.0,
+            },
+        }
+        if options.get("json"):
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(
+            f"bench_media_pipeline: {images} images, {original} B original -> "
+            f"{display} B display ({result['saved_pct']['display']}% saved), "
+            f"{thumb} B thumb ({result['saved_pct']['thumb']}% saved)"
+        )
+        self.stdout.write(json.dumps(result, indent=2))
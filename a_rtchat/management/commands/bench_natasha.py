@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from a_rtchat import llm_client
+from a_rtchat.llm_client import percentile
+from a_rtchat.models import ChatGroup, GroupMessage
+from a_rtchat.natasha_bot import natasha_maybe_reply
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark Natasha's full reply path (trigger load, prompt, LLM call, message create, "
+        "broadcast) offline against the local fake provider, in a throwaway test database with "
+        "the in-memory channel layer and a local cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--latency-ms",
+            type=int,
+            default=0,
+            help="Simulated provider latency for the fake LLM (default: 0)",
+        )
+        parser.add_argument("--json", action="store_true", help="Print machine-readable JSON only.")
+
+    def handle(self, *args, **options):
+        iterations = max(1, int(options.get("iterations") or 1))
+        latency_ms = max(0, int(options.get("latency_ms") or 0))
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench-natasha"}},
+                LLM_PROVIDER=llm_client.PROVIDER_FAKE,
+                LLM_FAKE_LATENCY_MS=latency_ms,
+                NATASHA_MIN_TYPING_SECONDS=0,
+            ):
+                durations, queries = self._run(iterations)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        result = {
+            "iterations": iterations,
+            "fake_latency_ms": latency_ms,
+            "reply_ms": {
+                "p50": round(percentile(durations, 50), 2),
+                "p95": round(percentile(durations, 95), 2),
+                "p99": round(percentile(durations, 99), 2),
+                "max": round(max(durations), 2),
+            },
+            "queries_per_reply": {
+                "avg": round(sum(queries) / len(queries), 2),
+                "max": max(queries),
+            },
+            "llm": llm_client.metrics_snapshot(),
+        }
+        if options.get("json"):
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(
+            f"bench_natasha: {iterations} replies, p50={result['reply_ms']['p50']}ms "
+            f"p95={result['reply_ms']['p95']}ms, queries/reply avg={result['queries_per_reply']['avg']}"
+        )
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def _run(self, iterations: int) -> tuple[list[float], list[int]]:
+        # Natasha only answers in public chat; this one lives in the throwaway database.
+        room, _ = ChatGroup.objects.get_or_create(group_name="public-chat")
+        user = get_user_model().objects.create(username=f"natasha-bench-{uuid.uuid4().hex[:8]}")
+
+        durations: list[float] = []
+        queries: list[int] = []
+        llm_client.reset_metrics()
+        for i in range(iterations):
+            trigger = GroupMessage.objects.create(group=room, author=user, body=f"@natasha bench {i}")
+            # The per-room reply cooldown would skip every iteration after the first.
+            cache.delete(f"natasha:last_reply:{room.id}")
+            started = time.monotonic()
+            with CaptureQueriesContext(connection) as ctx:
+                natasha_maybe_reply(room.id, trigger.id)
+            durations.append((time.monotonic() - started) * 1000.0)
+            queries.append(len(ctx.captured_queries))
+        return durations, queries
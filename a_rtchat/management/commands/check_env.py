@@ -191,6 +191,17 @@ class Command(BaseCommand):
             )
         )
 
+        # GIF picker (always shown in chat; searched server-side by a_rtchat.gifs)
+        giphy_key = (getattr(settings, "GIPHY_API_KEY", "") or "").strip()
+        checks.append(
+            EnvCheck(
+                name="GIPHY_API_KEY",
+                required=False,
+                ok=bool(giphy_key),
+                message="Unset: the chat GIF picker's search answers 502. Set a Giphy API key.",
+            )
+        )
+
         # Sentry
         sentry_dsn = (environ.get("SENTRY_DSN") or "").strip()
         checks.append(
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from a_rtchat.live_metrics import refresh_interval_seconds, refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the staff live metrics snapshot every few seconds and push it to "
+        "connected staff sockets. Optional: without it, staff polls/heartbeats refresh lazily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=None,
+            help="Seconds between refreshes (default: settings.ADMIN_LIVE_METRICS_INTERVAL_SECONDS)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Refresh a single time and exit.",
+        )
+
+    def handle(self, *args, **options):
+        interval = max(1, int(options.get("interval") or refresh_interval_seconds()))
+
+        while True:
+            started = time.monotonic()
+            # Long-running loop: don't hold a stale DB connection across ticks.
+            close_old_connections()
+            try:
+                snapshot = refresh_snapshot()
+                if options.get("once"):
+                    self.stdout.write(f"live_metrics_ticker: online_now={snapshot.get('online_now', 0)}")
+                    return
+            except Exception as exc:
+                if options.get("once"):
+                    raise
+                self.stderr.write(f"live_metrics_ticker: refresh failed: {exc}")
+
+            elapsed = time.monotonic() - started
+            time.sleep(max(0.0, interval - elapsed))
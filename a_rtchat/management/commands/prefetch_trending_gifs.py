@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.gifs import prefetch_trending
+
+
+class Command(BaseCommand):
+    help = "Fetch the first trending GIF pages from Giphy into the shared cache (deploy hook / cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=2, help="Trending pages to warm (default: 2)")
+
+    def handle(self, *args, **options):
+        pages = max(1, int(options.get("pages") or 1))
+        stored = prefetch_trending(pages=pages)
+        self.stdout.write(f"prefetch_trending_gifs: stored={stored}/{pages}")
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from a_rtchat import budget_fixtures
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every budgeted hot view against a small and a large data set in a throwaway "
+        "test database and list the worst offenders: over budget, growing with data, or "
+        "repeating one query shape (N+1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=50, help="Public chat members in the large data set (default: 50)")
+        parser.add_argument("--messages", type=int, default=300, help="Messages in the large data set (default: 300)")
+        parser.add_argument("--shapes", type=int, default=3, help="Most frequent query shapes to list per view (default: 3)")
+        parser.add_argument("--output", default="", help="Also write the JSON result to this file.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable JSON only.")
+
+    def handle(self, *args, **options):
+        members = max(2, int(options.get("members") or 2))
+        messages = max(10, int(options.get("messages") or 10))
+        top_shapes = max(0, int(options.get("shapes") or 0))
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "query-budget-report"}},
+                ALLOWED_HOSTS=["testserver", "localhost"],
+            ):
+                small = budget_fixtures.measure_views(budget_fixtures.seed(members=2, messages=10, prefix="qbs"))
+                large = budget_fixtures.measure_views(budget_fixtures.seed(members=members, messages=messages, prefix="qbl"))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        rows = []
+        for name, row in large.items():
+            budget = row["budget"]
+            growth = row["queries"] - small[name]["queries"]
+            rows.append({
+                "view": name,
+                "status": row["status"],
+                "queries": row["queries"],
+                "queries_small": small[name]["queries"],
+                "growth": growth,
+                "budget": budget,
+                "over_budget": bool(budget is not None and row["queries"] > budget),
+                "repeated": [{"count": n, "sql": shape} for shape, n in row["repeated"]],
+                "top_shapes": [{"count": n, "sql": shape} for shape, n in row["recorder"].shapes().most_common(top_shapes)],
+            })
+        # Worst first: broken budgets, then N+1s, then growth, then raw count.
+        rows.sort(key=lambda r: (r["over_budget"], len(r["repeated"]), r["growth"], r["queries"]), reverse=True)
+
+        result = {
+            "params": {"members": members, "messages": messages},
+            "failing": sum(1 for r in rows if r["over_budget"] or r["repeated"] or r["growth"] > 0),
+            "views": rows,
+        }
+        if options.get("output"):
+            with open(options["output"], "w", encoding="utf-8") as fh:
+                json.dump(result, fh, indent=2)
+        if options.get("json"):
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(f"query_budget_report: {len(rows)} views, {result['failing']} failing")
+        for r in rows:
+            flags = []
+            if r["over_budget"]:
+                flags.append("OVER BUDGET")
+            if r["growth"] > 0:
+                flags.append(f"+{r['growth']} with data")
+            if r["repeated"]:
+                flags.append(f"{len(r['repeated'])} N+1 shape(s)")
+            self.stdout.write(
+                f"  {r['view']:<24} {r['queries']:>4} queries (budget {r['budget']}, small set {r['queries_small']})"
+                + (f"  [{', '.join(flags)}]" if flags else "")
+            )
+            for item in r["repeated"]:
+                self.stdout.write(f"      {item['count']}x {item['sql'][:160]}")
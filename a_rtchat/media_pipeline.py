@@ -0,0 +1,623 @@
+from __future__ import annotations
+
+import io
+import mimetypes
+import os
+import struct
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+
+# Media metadata and off-request processing for chat uploads and stories.
+#
+# At upload, probe() reads the file that is already in memory or a local temp file and
+# the row is created with its kind, mime type, dimensions, size and (MP4/MOV) duration,
+# so templates and views never open the stored object to find out what it is.
+#
+# The upload request stores the original with its metadata stripped (sanitize_upload:
+# GPS, camera and timestamps go, the orientation stays) and schedules processing after
+# commit. A worker (the Celery task when a broker is configured, otherwise a bounded
+# local pool; a cache claim keeps a redelivered job from running twice) reads the
+# original once and:
+# - records width, height, mime type and byte size on the row,
+# - writes a WebP display variant (longest side <= MEDIA_DISPLAY_MAX_PX) and a
+#   thumbnail (width <= MEDIA_THUMB_MAX_PX), EXIF orientation applied and no metadata
+#   at all.
+# Templates serve the smallest suitable variant and fall back to the original until the
+# variants exist. Animated images are measured but not re-encoded.
+
+_runtime = None
+
+
+def display_max_px() -> int:
+    try:
+        return max(320, int(getattr(settings, 'MEDIA_DISPLAY_MAX_PX', 1600)))
+    except Exception:
+        return 1600
+
+
+def thumb_max_px() -> int:
+    try:
+        return max(64, int(getattr(settings, 'MEDIA_THUMB_MAX_PX', 480)))
+    except Exception:
+        return 480
+
+
+def _quality() -> int:
+    try:
+        return min(100, max(30, int(getattr(settings, 'MEDIA_WEBP_QUALITY', 80))))
+    except Exception:
+        return 80
+
+
+def get_runtime():
+    """The process-wide media worker pool (MEDIA_PIPELINE_WORKERS threads)."""
+    global _runtime
+    if _runtime is None:
+        from .bot_runtime import BotRuntime
+
+        _runtime = BotRuntime(
+            name='media',
+            workers=int(getattr(settings, 'MEDIA_PIPELINE_WORKERS', 2) or 2),
+            max_pending=int(getattr(settings, 'MEDIA_PIPELINE_MAX_PENDING', 100) or 100),
+        )
+    return _runtime
+
+
+# Probing ------------------------------------------------------------------------
+
+KIND_IMAGE = 'image'
+KIND_VIDEO = 'video'
+KIND_FILE = 'file'
+
+# Formats commonly playable in browsers (.mkv/.avi often upload fine but usually don't
+# play in HTML5 video).
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.ogg', '.ogv', '.mov', '.m4v')
+_ISO_BMFF_EXTENSIONS = ('.mp4', '.mov', '.m4v')
+
+
+def video_mime_for(name: str) -> str:
+    guessed, _ = mimetypes.guess_type(name or '')
+    if guessed:
+        return guessed
+    lower = (name or '').lower()
+    if lower.endswith('.mov'):
+        return 'video/quicktime'
+    if lower.endswith('.m4v'):
+        return 'video/x-m4v'
+    return 'video/mp4'
+
+
+def _boxes(fh, start: int, end: int):
+    """Yield (type, payload_start, box_end) for the ISO-BMFF boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        head = fh.read(8)
+        if len(head) < 8:
+            return
+        size, kind = struct.unpack('>I4s', head)
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', fh.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _find(fh, start: int, end: int, kind: bytes):
+    for box_kind, payload, box_end in _boxes(fh, start, end):
+        if box_kind == kind:
+            return payload, box_end
+    return None
+
+
+def mp4_info(fh, size: int) -> dict:
+    """Duration (mvhd) and display size (first visual tkhd) of an MP4/MOV, without decoding.
+
+    Only the box headers and the `moov` box are read; `mdat` is skipped by seeking.
+    """
+    out = {}
+    moov = _find(fh, 0, size, b'moov')
+    if not moov:
+        return out
+
+    mvhd = _find(fh, moov[0], moov[1], b'mvhd')
+    if mvhd:
+        fh.seek(mvhd[0])
+        version = fh.read(4)[0]
+        if version == 1:
+            timescale, duration = struct.unpack('>16xIQ', fh.read(28))
+        else:
+            timescale, duration = struct.unpack('>8xII', fh.read(16))
+        if timescale:
+            out['duration'] = round(duration / timescale, 3)
+
+    for kind, payload, box_end in _boxes(fh, moov[0], moov[1]):
+        if kind != b'trak':
+            continue
+        tkhd = _find(fh, payload, box_end, b'tkhd')
+        if not tkhd:
+            continue
+        fh.seek(tkhd[0])
+        version = fh.read(4)[0]
+        fh.seek(tkhd[0] + 4 + (32 if version == 1 else 20) + 16)
+        matrix = struct.unpack('>9i', fh.read(36))
+        width, height = (v >> 16 for v in struct.unpack('>II', fh.read(8)))
+        if width and height:
+            # A zero `a` in the transform matrix means the track is rotated 90/270 degrees.
+            if matrix[0] == 0 and matrix[1] != 0:
+                width, height = height, width
+            out['width'], out['height'] = width, height
+            break
+    return out
+
+
+def probe(fh, name: str) -> dict:
+    """Kind, mime, dimensions, size and duration of a seekable binary file.
+
+    Images are identified by content (header only, nothing is decoded); videos by
+    extension. Keys match GroupMessage's media_* fields without the prefix.
+    """
+    from PIL import Image
+
+    fh.seek(0, os.SEEK_END)
+    size = fh.tell()
+    fh.seek(0)
+    info = {'kind': KIND_FILE, 'mime': '', 'width': None, 'height': None, 'size': size, 'duration': None}
+
+    try:
+        img = Image.open(fh)
+        width, height = img.size
+        # EXIF orientations 5-8 are stored sideways; report the size as displayed.
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+        info.update(kind=KIND_IMAGE, mime=Image.MIME.get(img.format or '', ''), width=width, height=height)
+        return info
+    except Exception:
+        pass
+
+    lower = (name or '').lower()
+    if lower.endswith(VIDEO_EXTENSIONS):
+        info.update(kind=KIND_VIDEO, mime=video_mime_for(name))
+        if lower.endswith(_ISO_BMFF_EXTENSIONS):
+            try:
+                info.update(mp4_info(fh, size))
+            except Exception:
+                pass
+    else:
+        info['mime'] = mimetypes.guess_type(name or '')[0] or ''
+    info['mime'] = (info['mime'] or '')[:100]
+    return info
+
+
+def probe_upload(upload) -> dict:
+    """GroupMessage field values for an UploadedFile, leaving it rewound for saving."""
+    try:
+        info = probe(upload, getattr(upload, 'name', '') or '')
+    except Exception:
+        return {}
+    finally:
+        try:
+            upload.seek(0)
+        except Exception:
+            pass
+    return {f"media_{key}": value for key, value in info.items()}
+
+
+# Metadata stripping ----------------------------------------------------------------
+
+# Originals are served as uploaded (full-size view, downloads, browsers without WebP),
+# so camera metadata is removed before they are stored. This is a container-level edit
+# (no decode, no re-encode): JPEG APP1 (EXIF/XMP), APP13 (IPTC) and COM segments, PNG
+# text/eXIf/tIME chunks and WebP EXIF/XMP chunks are dropped, and only the EXIF
+# orientation is written back so the photo still displays the right way up.
+
+_JPEG_DROP = {0xE1, 0xED, 0xFE}  # APP1, APP13, COM
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_DROP = {b'eXIf', b'tEXt', b'iTXt', b'zTXt', b'tIME'}
+_WEBP_EXIF_FLAG = 0x08
+_WEBP_XMP_FLAG = 0x04
+
+
+def _orientation(data: bytes) -> int:
+    from PIL import Image
+
+    try:
+        value = int(Image.open(io.BytesIO(data)).getexif().get(0x0112) or 1)
+    except Exception:
+        return 1
+    return value if 1 <= value <= 8 else 1
+
+
+def _orientation_exif(orientation: int) -> bytes:
+    """A TIFF-structured EXIF block holding only the orientation tag."""
+    from PIL import Image
+
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return exif.tobytes()[len(b'Exif\x00\x00'):]
+
+
+def _strip_jpeg(data: bytes, orientation: int) -> bytes:
+    out = [data[:2]]
+    pos = 2
+    while True:
+        if data[pos] != 0xFF:
+            raise ValueError('bad JPEG marker')
+        while data[pos + 1] == 0xFF:  # fill bytes
+            pos += 1
+        marker = data[pos + 1]
+        if marker == 0xDA or marker == 0xD9:  # start of scan / end of image
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.append(data[pos:pos + 2])
+            pos += 2
+            continue
+        (length,) = struct.unpack('>H', data[pos + 2:pos + 4])
+        if marker not in _JPEG_DROP:
+            out.append(data[pos:pos + 2 + length])
+        pos += 2 + length
+    if orientation != 1:
+        payload = b'Exif\x00\x00' + _orientation_exif(orientation)
+        # After JFIF APP0 when present, otherwise straight after SOI.
+        at = 2 if len(out) > 1 and out[1][:2] == b'\xff\xe0' else 1
+        out.insert(at, b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload)
+    out.append(data[pos:])
+    return b''.join(out)
+
+
+def _strip_png(data: bytes, orientation: int) -> bytes:
+    import zlib
+
+    out = [_PNG_SIGNATURE]
+    pos = len(_PNG_SIGNATURE)
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if end > len(data):
+            raise ValueError('truncated PNG chunk')
+        if kind == b'IDAT' and orientation != 1:
+            payload = _orientation_exif(orientation)
+            crc = zlib.crc32(b'eXIf' + payload) & 0xFFFFFFFF
+            out.append(struct.pack('>I4s', len(payload), b'eXIf') + payload + struct.pack('>I', crc))
+            orientation = 1
+        if kind not in _PNG_DROP:
+            out.append(data[pos:end])
+        pos = end
+    return b''.join(out)
+
+
+def _strip_webp(data: bytes, orientation: int) -> bytes:
+    chunks = []
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, length = struct.unpack('<4sI', data[pos:pos + 8])
+        end = pos + 8 + length + (length & 1)
+        if end > len(data):
+            raise ValueError('truncated WebP chunk')
+        if kind not in (b'EXIF', b'XMP '):
+            chunks.append([kind, data[pos + 8:pos + 8 + length]])
+        pos = end
+    exif = _orientation_exif(orientation) if orientation != 1 else b''
+    if chunks and chunks[0][0] == b'VP8X':
+        flags = chunks[0][1][0] & ~(_WEBP_EXIF_FLAG | _WEBP_XMP_FLAG)
+        if exif:
+            flags |= _WEBP_EXIF_FLAG
+        chunks[0][1] = bytes([flags]) + chunks[0][1][1:]
+        if exif:
+            chunks.append([b'EXIF', exif])
+    body = b''.join(
+        struct.pack('<4sI', kind, len(payload)) + payload + (b'\x00' if len(payload) & 1 else b'')
+        for kind, payload in chunks
+    )
+    return b'RIFF' + struct.pack('<I', 4 + len(body)) + b'WEBP' + body
+
+
+def strip_metadata(data: bytes) -> bytes | None:
+    """`data` without camera/location metadata, or None when it isn't a JPEG/PNG/WebP
+    this can rewrite (the caller keeps the bytes as they are)."""
+    if data[:3] == b'\xff\xd8\xff':
+        strip = _strip_jpeg
+    elif data[:8] == _PNG_SIGNATURE:
+        strip = _strip_png
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        strip = _strip_webp
+    else:
+        return None
+    try:
+        return strip(data, _orientation(data))
+    except (IndexError, ValueError, struct.error):
+        return None
+
+
+def sanitize_upload(upload):
+    """The upload to store: a metadata-free copy for images, `upload` itself otherwise."""
+    try:
+        upload.seek(0)
+        head = upload.read(12)
+        if not (head[:3] == b'\xff\xd8\xff' or head[:8] == _PNG_SIGNATURE or head[8:12] == b'WEBP'):
+            return upload
+        upload.seek(0)
+        cleaned = strip_metadata(upload.read())
+    except Exception:
+        cleaned = None
+    finally:
+        try:
+            upload.seek(0)
+        except Exception:
+            pass
+    if cleaned is None:
+        return upload
+    return ContentFile(cleaned, name=os.path.basename(getattr(upload, 'name', '') or '') or f"{uuid.uuid4().hex}.jpg")
+
+
+def _probe_stored(storage, name: str) -> dict | None:
+    try:
+        with storage.open(name, 'rb') as fh:
+            data = fh.read()
+        return probe(io.BytesIO(data), name)
+    except Exception:
+        return None
+
+
+def backfill_metadata(*, batch_size: int = 200, workers: int | None = None) -> dict:
+    """Probe stored files of messages that predate upload-time probing. Returns counts.
+
+    Downloads run on a bounded thread pool (MEDIA_BACKFILL_WORKERS, default 4); rows are
+    written from the calling thread, one bulk update per batch. Walks by id, so files
+    that can't be read are counted once and left for a later run.
+    """
+    from .models import GroupMessage
+
+    batch_size = max(1, int(batch_size))
+    if workers is None:
+        workers = int(getattr(settings, 'MEDIA_BACKFILL_WORKERS', 4) or 4)
+    workers = max(1, int(workers))
+    storage = GroupMessage._meta.get_field('file').storage
+
+    updated = 0
+    failed = 0
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = list(
+                GroupMessage.objects.filter(id__gt=last_id, media_kind='')
+                .exclude(file='').exclude(file__isnull=True)
+                .order_by('id').only('id', 'file')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            to_update = []
+            for row, info in zip(rows, pool.map(lambda r: _probe_stored(storage, r.file.name), rows)):
+                if info is None:
+                    failed += 1
+                    continue
+                for key, value in info.items():
+                    setattr(row, f"media_{key}", value)
+                to_update.append(row)
+            if to_update:
+                GroupMessage.objects.bulk_update(
+                    to_update,
+                    ['media_kind', 'media_mime', 'media_width', 'media_height', 'media_size', 'media_duration'],
+                )
+                updated += len(to_update)
+    return {'updated': updated, 'failed': failed}
+
+
+# Image work -------------------------------------------------------------------
+
+def _encode_webp(img) -> bytes:
+    buf = io.BytesIO()
+    # No exif=/icc_profile= arguments: the encoded copy carries no metadata.
+    img.save(buf, format='WEBP', quality=_quality(), method=4)
+    return buf.getvalue()
+
+
+def _fit(img, *, max_width: int | None = None, longest: int | None = None):
+    from PIL import Image
+
+    width, height = img.size
+    scale = 1.0
+    if longest and max(width, height) > longest:
+        scale = longest / max(width, height)
+    if max_width and width * scale > max_width:
+        scale = max_width / width
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+
+def analyze_image(data: bytes) -> dict | None:
+    """Measure and re-encode an image. Returns None when `data` isn't an image.
+
+    Result: {'width', 'height', 'mime', 'display': bytes | None, 'thumb': bytes | None}.
+    `thumb` is None when the image is already narrower than the thumbnail size.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return None
+
+    mime = Image.MIME.get(img.format or '', '') or ''
+    if getattr(img, 'is_animated', False):
+        width, height = img.size
+        return {'width': width, 'height': height, 'mime': mime, 'display': None, 'thumb': None}
+
+    img = ImageOps.exif_transpose(img)
+    width, height = img.size
+    if img.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+    display = _encode_webp(_fit(img, longest=display_max_px()))
+    thumb = None
+    if width > thumb_max_px():
+        thumb = _encode_webp(_fit(img, max_width=thumb_max_px()))
+    return {'width': width, 'height': height, 'mime': mime, 'display': display, 'thumb': thumb}
+
+
+def _read(field_file) -> bytes:
+    field_file.open('rb')
+    try:
+        return field_file.read()
+    finally:
+        try:
+            field_file.close()
+        except Exception:
+            pass
+
+
+def _save_variant(instance, field_name: str, original_name: str, data: bytes, suffix: str) -> str:
+    """Store a variant next to its siblings, named after the original upload."""
+    field = type(instance)._meta.get_field(field_name)
+    base = os.path.splitext(os.path.basename(original_name or ''))[0] or uuid.uuid4().hex
+    filename = field.generate_filename(instance, f"{base}_{suffix}.webp")
+    return field.storage.save(filename, ContentFile(data))
+
+
+# Per-model processing ------------------------------------------------------------
+
+# Field names on each model: original, display variant, thumbnail, width, height, mime,
+# size, kind (None when the model has no such field).
+MESSAGE_FIELDS = ('file', 'file_display', 'file_thumb', 'media_width', 'media_height', 'media_mime', 'media_size', 'media_kind')
+STORY_FIELDS = ('image', 'image_display', 'image_thumb', 'image_width', 'image_height', 'image_mime', 'image_size', None)
+
+
+def _claim(key: str) -> bool:
+    try:
+        return bool(cache.add(key, 1, timeout=10 * 60))
+    except Exception:
+        return True
+
+
+def _release(key: str) -> None:
+    # A failed run gives the claim back, so a retry or the next schedule() can try again.
+    try:
+        cache.delete(key)
+    except Exception:
+        pass
+
+
+def _process(model, pk: int, fields: tuple) -> dict | None:
+    """Process one row's upload. Returns the fields written, or None when skipped."""
+    original, display_f, thumb_f, width_f, height_f, mime_f, size_f, kind_f = fields
+
+    obj = model.objects.filter(pk=pk).first()
+    if obj is None:
+        return None
+    upload = getattr(obj, original)
+    if not upload or getattr(obj, display_f):
+        return None
+    # Kind was recorded at upload: only images have anything left to do.
+    if kind_f and getattr(obj, kind_f) not in ('', KIND_IMAGE):
+        return None
+
+    data = _read(upload)
+    updates = {
+        size_f: len(data),
+        mime_f: (mimetypes.guess_type(upload.name or '')[0] or '')[:100],
+    }
+    info = analyze_image(data)
+    if info:
+        updates[width_f] = info['width']
+        updates[height_f] = info['height']
+        if info['mime']:
+            updates[mime_f] = info['mime']
+        if kind_f:
+            updates[kind_f] = KIND_IMAGE
+        if info['display']:
+            updates[display_f] = _save_variant(obj, display_f, upload.name, info['display'], 'display')
+        if info['thumb']:
+            updates[thumb_f] = _save_variant(obj, thumb_f, upload.name, info['thumb'], 'thumb')
+
+    # .update(): no signals, and nothing else on the row is overwritten.
+    model.objects.filter(pk=pk).update(**updates)
+    return updates
+
+
+def process_message(message_id: int) -> bool:
+    """Process a chat upload and refresh its bubble for everyone in the room."""
+    from .channels_utils import chatroom_channel_group_name
+    from .models import ChatGroup, GroupMessage
+
+    claim = f"media:message:{int(message_id)}"
+    if not _claim(claim):
+        return False
+    try:
+        updates = _process(GroupMessage, message_id, MESSAGE_FIELDS)
+    except Exception:
+        _release(claim)
+        raise
+    if not updates or 'file_display' not in updates:
+        return bool(updates)
+
+    group_id = GroupMessage.objects.filter(pk=message_id).values_list('group_id', flat=True).first()
+    if group_id:
+        try:
+            from asgiref.sync import async_to_sync
+            from channels.layers import get_channel_layer
+
+            async_to_sync(get_channel_layer().group_send)(
+                chatroom_channel_group_name(ChatGroup(pk=group_id)),
+                {'type': 'message_update_handler', 'message_id': int(message_id)},
+            )
+        except Exception:
+            pass
+    return True
+
+
+def process_story(story_id: int) -> bool:
+    from a_users.models import Story
+
+    claim = f"media:story:{int(story_id)}"
+    if not _claim(claim):
+        return False
+    try:
+        return bool(_process(Story, story_id, STORY_FIELDS))
+    except Exception:
+        _release(claim)
+        raise
+
+
+PROCESSORS = {
+    'message': process_message,
+    'story': process_story,
+}
+
+
+def schedule(kind: str, object_id: int) -> None:
+    """Process an upload after the current transaction commits, off the request path."""
+    fn = PROCESSORS[kind]
+
+    def _kickoff():
+        # Celery when a broker is configured; the local pool only when it isn't (or the
+        # enqueue fails), so the web process never decodes images next to a worker.
+        try:
+            from .views import _celery_broker_configured  # avoid circular import at module import time
+
+            if _celery_broker_configured():
+                from .tasks import process_media_task
+
+                process_media_task.delay(kind, int(object_id))
+                return
+        except Exception:
+            pass
+        get_runtime().submit(fn, int(object_id))
+
+    transaction.on_commit(_kickoff)
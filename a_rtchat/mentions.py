@@ -1,8 +1,10 @@
 import re
 from typing import Iterable
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
 
 
 # Conservative @mention pattern: @username (letters, numbers, underscore, dot, dash)
@@ -72,3 +74,97 @@ def resolve_mentioned_users(usernames: Iterable[str]):
         if len(out) >= 10:
             break
     return out
+
+
+def search_cache_seconds() -> int:
+    try:
+        return max(0, int(getattr(settings, 'MENTION_SEARCH_CACHE_SECONDS', 30)))
+    except Exception:
+        return 30
+
+
+def _search_cache_prefix_len() -> int:
+    try:
+        return max(0, int(getattr(settings, 'MENTION_SEARCH_CACHE_PREFIX_LEN', 2)))
+    except Exception:
+        return 2
+
+
+def is_cacheable_prefix(q: str) -> bool:
+    """Short prefixes match the most rows and repeat the most; their results are cached."""
+    return bool(q) and len(q) <= _search_cache_prefix_len() and search_cache_seconds() > 0
+
+
+def search_mention_candidates(q: str, *, room_id: int | None = None, limit: int = 8) -> list[dict]:
+    """Active users whose username or display name starts with q, best matches first.
+
+    Ranking: recent authors in the room, then room members, then everyone else; ties by
+    username. The username and display-name prefixes are matched in two separate queries
+    so each can use its own case-insensitive prefix index (a_users migration 0019)
+    instead of one OR across the Profile join.
+
+    Returns [{username, display, avatar}].
+    """
+    from .models import ChatGroup
+    from . import recent_messages
+
+    q = (q or '').strip()
+    if not q:
+        return []
+
+    cache_key = None
+    if is_cacheable_prefix(q):
+        cache_key = f"mention:search:{int(room_id or 0)}:{q.lower()}"
+        try:
+            cached = cache.get(cache_key)
+        except Exception:
+            cached = None
+        if cached is not None:
+            return cached
+
+    User = get_user_model()
+    rank = Value(2, output_field=IntegerField())
+    if room_id:
+        recent_ids: list[int] = []
+        try:
+            buf = recent_messages.get_buffer(room_id, rebuild=False)
+        except Exception:
+            buf = None
+        for it in reversed((buf or {}).get('items') or []):
+            aid = it.get('author_id')
+            if aid and aid not in recent_ids:
+                recent_ids.append(aid)
+        is_member = Exists(
+            ChatGroup.members.through.objects.filter(chatgroup_id=room_id, user_id=OuterRef('pk'))
+        )
+        whens = [When(is_member, then=Value(1))]
+        if recent_ids:
+            whens.insert(0, When(pk__in=recent_ids, then=Value(0)))
+        rank = Case(*whens, default=Value(2), output_field=IntegerField())
+
+    base = User.objects.filter(is_active=True).select_related('profile').annotate(mention_rank=rank)
+    found = {}
+    for cond in (Q(username__istartswith=q), Q(profile__displayname__istartswith=q)):
+        for u in base.filter(cond).order_by('mention_rank', 'username')[:limit]:
+            found.setdefault(u.pk, u)
+    users = sorted(found.values(), key=lambda u: (u.mention_rank, u.username.lower()))[:limit]
+
+    results = []
+    for u in users:
+        try:
+            profile = getattr(u, 'profile', None)
+        except Exception:
+            profile = None
+        display = (getattr(profile, 'name', None) or u.username)
+        try:
+            avatar = getattr(profile, 'avatar', '') if profile else ''
+        except Exception:
+            avatar = ''
+        results.append({'username': u.username, 'display': display, 'avatar': avatar})
+
+    if cache_key:
+        try:
+            cache.set(cache_key, results, timeout=search_cache_seconds())
+        except Exception:
+            pass
+    return results
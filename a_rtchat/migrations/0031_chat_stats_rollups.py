@@ -0,0 +1,55 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0030_one_time_message_view'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatStatsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('blocked', models.PositiveIntegerField(default=0)),
+                ('blocked_ai_scope', models.PositiveIntegerField(default=0)),
+                ('auto_actions', models.PositiveIntegerField(default=0)),
+                ('mod_allow', models.PositiveIntegerField(default=0)),
+                ('mod_flag', models.PositiveIntegerField(default=0)),
+                ('mod_block', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stats_daily', to='a_rtchat.chatgroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_stats_daily', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-date', 'room'], name='csd_date_room_idx'), models.Index(fields=['user', '-date'], name='csd_user_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'room', 'user'), name='uniq_chat_stats_daily_date_room_user')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatStatsHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('blocked', models.PositiveIntegerField(default=0)),
+                ('blocked_ai_scope', models.PositiveIntegerField(default=0)),
+                ('auto_actions', models.PositiveIntegerField(default=0)),
+                ('mod_allow', models.PositiveIntegerField(default=0)),
+                ('mod_flag', models.PositiveIntegerField(default=0)),
+                ('mod_block', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stats_hourly', to='a_rtchat.chatgroup')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-bucket'], name='csh_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'room'), name='uniq_chat_stats_hourly_bucket_room')],
+            },
+        ),
+    ]
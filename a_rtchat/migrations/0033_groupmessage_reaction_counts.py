@@ -0,0 +1,38 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reaction_counts(apps, schema_editor):
+    GroupMessage = apps.get_model('a_rtchat', 'GroupMessage')
+    MessageReaction = apps.get_model('a_rtchat', 'MessageReaction')
+
+    counts = {}
+    for row in (
+        MessageReaction.objects.values('message_id', 'emoji')
+        .annotate(n=Count('user_id', distinct=True))
+        .order_by()
+    ):
+        counts.setdefault(row['message_id'], {})[row['emoji']] = int(row['n'])
+
+    rows = [GroupMessage(id=mid, reaction_counts=c) for mid, c in counts.items()]
+    GroupMessage.objects.bulk_update(rows, ['reaction_counts'], batch_size=500)
+
+
+def noop(apps, schema_editor):
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0032_challenge_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='reaction_counts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(backfill_reaction_counts, reverse_code=noop),
+    ]
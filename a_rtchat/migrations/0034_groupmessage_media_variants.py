@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-19 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0033_groupmessage_reaction_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmessage',
+            name='file_display',
+            field=models.ImageField(blank=True, null=True, upload_to='files/variants/'),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='file_thumb',
+            field=models.ImageField(blank=True, null=True, upload_to='files/variants/'),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='media_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='media_mime',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='media_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupmessage',
+            name='media_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-19 15:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+COUNTER_FIELDS = ('messages', 'blocked', 'blocked_ai_scope', 'auto_actions', 'mod_allow', 'mod_flag', 'mod_block')
+
+
+def merge_site_duplicates(apps, schema_editor):
+    # NULL rooms never collided under the old constraints: fold duplicates into one row.
+    for model_name, keys in (('ChatStatsHourly', ('bucket',)), ('ChatStatsDaily', ('date', 'user_id'))):
+        model = apps.get_model('a_rtchat', model_name)
+        site = model.objects.filter(room__isnull=True)
+        dupes = site.values(*keys).annotate(n=Count('id')).filter(n__gt=1).order_by()
+        for group in dupes:
+            rows = list(site.filter(**{k: group[k] for k in keys}).order_by('id'))
+            keep = rows[0]
+            for row in rows[1:]:
+                for field in COUNTER_FIELDS:
+                    setattr(keep, field, getattr(keep, field) + getattr(row, field))
+            keep.save(update_fields=list(COUNTER_FIELDS))
+            model.objects.filter(id__in=[r.id for r in rows[1:]]).delete()
+
+
+def noop(apps, schema_editor):
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0035_groupmessage_media_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_site_duplicates, reverse_code=noop),
+        migrations.AddConstraint(
+            model_name='chatstatsdaily',
+            constraint=models.UniqueConstraint(condition=models.Q(('room__isnull', True)), fields=('date', 'user'), name='uniq_chat_stats_daily_date_user_site'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatstatshourly',
+            constraint=models.UniqueConstraint(condition=models.Q(('room__isnull', True)), fields=('bucket',), name='uniq_chat_stats_hourly_bucket_site'),
+        ),
+    ]
@@ -3,12 +3,12 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 import shortuuid
-from PIL import Image
 import os
 import mimetypes
 
 from .models_notifications import Notification
 from .models_read import ChatReadState
+from .models_analytics import ChatStatsDaily, ChatStatsHourly
 
 class ChatGroup(models.Model):
     group_name = models.CharField(max_length=128, unique=True, blank=True)
@@ -113,6 +113,13 @@ class PrivateChatGroup(ChatGroup):
         verbose_name_plural = 'Private chats'
     
     
+def _scaled_width(width, height, *, longest: int) -> int:
+    width, height = int(width or 0), int(height or 0)
+    if not width or not height or max(width, height) <= longest:
+        return width
+    return max(1, round(width * longest / max(width, height)))
+
+
 class GroupMessage(models.Model):
     group = models.ForeignKey(ChatGroup, related_name='chat_messages', on_delete=models.CASCADE)
     reply_to = models.ForeignKey('self', related_name='replies', null=True, blank=True, on_delete=models.SET_NULL)
@@ -120,6 +127,21 @@ class GroupMessage(models.Model):
     body = models.CharField(max_length=300, blank=True, null=True)
     file = models.FileField(upload_to='files/', blank=True, null=True)
     file_caption = models.CharField(max_length=300, blank=True, null=True)
+    # Probed at upload by a_rtchat.media_pipeline (backfill_media_metadata for older rows).
+    MEDIA_KIND_CHOICES = (
+        ('image', 'Image'),
+        ('video', 'Video'),
+        ('file', 'File'),
+    )
+    media_kind = models.CharField(max_length=10, choices=MEDIA_KIND_CHOICES, blank=True, default='')
+    media_width = models.PositiveIntegerField(null=True, blank=True)
+    media_height = models.PositiveIntegerField(null=True, blank=True)
+    media_mime = models.CharField(max_length=100, blank=True, default='')
+    media_size = models.PositiveBigIntegerField(null=True, blank=True)
+    media_duration = models.FloatField(null=True, blank=True)
+    # Filled in off the request path by a_rtchat.media_pipeline.
+    file_display = models.ImageField(upload_to='files/variants/', blank=True, null=True)
+    file_thumb = models.ImageField(upload_to='files/variants/', blank=True, null=True)
     # One-time view (private chats): recipient can open once, then it expires after N seconds.
     one_time_view_seconds = models.PositiveSmallIntegerField(null=True, blank=True)
     one_time_viewed_at = models.DateTimeField(null=True, blank=True)
@@ -137,6 +159,8 @@ class GroupMessage(models.Model):
     link_site_name = models.CharField(max_length=120, blank=True, default='')
     created = models.DateTimeField(auto_now_add=True)
     edited_at = models.DateTimeField(null=True, blank=True)
+    # {emoji: users}; maintained by a_rtchat.reactions.toggle_reaction.
+    reaction_counts = models.JSONField(default=dict, blank=True)
     
     @property
     def filename(self):
@@ -178,38 +202,68 @@ class GroupMessage(models.Model):
             models.Index(fields=['author', '-created'], name='gm_author_created_idx'),
         ]
         
-    @property    
-    def is_image(self):
-        try:
-            image = Image.open(self.file)
-            image.verify()
-            return True
-        except:
-            return False
+    @property
+    def display_url(self):
+        """Metadata-free, downscaled image when processed; the original otherwise."""
+        if self.file_display:
+            return self.file_display.url
+        return self.file.url if self.file else ''
 
     @property
-    def is_video(self):
+    def thumb_url(self):
+        if self.file_thumb:
+            return self.file_thumb.url
+        return self.display_url
+
+    @property
+    def display_width(self):
+        from .media_pipeline import display_max_px
+
+        return _scaled_width(self.media_width, self.media_height, longest=display_max_px())
+
+    @property
+    def thumb_width(self):
+        from .media_pipeline import thumb_max_px
+
+        return min(int(self.media_width or 0), thumb_max_px())
+
+    @property
+    def file_kind(self):
+        """'image', 'video', 'file', or '' when there's no file.
+
+        Rows not yet probed (see backfill_media_metadata) are classified by file name
+        rather than by opening the stored object.
+        """
         if not self.file:
-            return False
+            return ''
+        if self.media_kind:
+            return self.media_kind
+        from .media_pipeline import VIDEO_EXTENSIONS
+
         name = (getattr(self.file, 'name', '') or '').lower()
-        # Keep this to formats that are commonly playable in browsers.
-        # (e.g. .mkv/.avi often upload fine but usually don't play in HTML5 video.)
-        return name.endswith(('.mp4', '.webm', '.ogg', '.ogv', '.mov', '.m4v'))
+        if (mimetypes.guess_type(name)[0] or '').startswith('image/'):
+            return 'image'
+        if name.endswith(VIDEO_EXTENSIONS):
+            return 'video'
+        return 'file'
+
+    @property
+    def is_image(self):
+        return self.file_kind == 'image'
+
+    @property
+    def is_video(self):
+        return self.file_kind == 'video'
 
     @property
     def video_mime_type(self):
         if not self.file:
             return ''
-        name = (getattr(self.file, 'name', '') or '')
-        guessed, _ = mimetypes.guess_type(name)
-        if guessed:
-            return guessed
-        lower = name.lower()
-        if lower.endswith('.mov'):
-            return 'video/quicktime'
-        if lower.endswith('.m4v'):
-            return 'video/x-m4v'
-        return 'video/mp4'
+        if self.media_kind == 'video' and self.media_mime:
+            return self.media_mime
+        from .media_pipeline import video_mime_for
+
+        return video_mime_for(getattr(self.file, 'name', '') or '')
 
 
 class OneTimeMessageView(models.Model):
@@ -369,3 +423,40 @@ class ChatChallenge(models.Model):
     def __str__(self):
         return f"Challenge({self.kind}) room={getattr(self.group, 'group_name', '')} status={self.status}"
 
+
+class ChallengeStats(models.Model):
+    """Per-user challenge results, maintained when a challenge is finalized.
+
+    `room` is NULL for the user's all-rooms totals (what `!sc` shows); rows with a
+    room hold the per-room totals used for room leaderboards.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='challenge_stats')
+    room = models.ForeignKey(
+        ChatGroup,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='challenge_stats',
+    )
+    wins = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'room'], name='uniq_challenge_stats_user_room'),
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(room__isnull=True),
+                name='uniq_challenge_stats_user_total',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['room', '-wins'], name='cs_room_wins_idx'),
+        ]
+
+    def __str__(self):
+        return f"ChallengeStats(u={self.user_id} room={self.room_id} W{self.wins}/L{self.losses})"
+
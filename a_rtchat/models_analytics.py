@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import models
+
+
+class ChatStatsHourly(models.Model):
+    """Per-room hourly counters for the staff analytics dashboard.
+
+    Maintained incrementally at write time (see a_rtchat.analytics) so the
+    dashboard never has to aggregate raw messages, which retention trims anyway.
+    """
+
+    bucket = models.DateTimeField()
+    room = models.ForeignKey(
+        'a_rtchat.ChatGroup',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='stats_hourly',
+    )
+    messages = models.PositiveIntegerField(default=0)
+    blocked = models.PositiveIntegerField(default=0)
+    blocked_ai_scope = models.PositiveIntegerField(default=0)
+    auto_actions = models.PositiveIntegerField(default=0)
+    mod_allow = models.PositiveIntegerField(default=0)
+    mod_flag = models.PositiveIntegerField(default=0)
+    mod_block = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'room'], name='uniq_chat_stats_hourly_bucket_room'),
+            # Site-wide rows: NULL rooms never collide in the constraint above.
+            models.UniqueConstraint(
+                fields=['bucket'],
+                condition=models.Q(room__isnull=True),
+                name='uniq_chat_stats_hourly_bucket_site',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-bucket'], name='csh_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"ChatStatsHourly({self.bucket:%Y-%m-%d %H}:00 room={self.room_id} msgs={self.messages})"
+
+
+class ChatStatsDaily(models.Model):
+    """Per-(day, room, user) counters.
+
+    Distinct active users per room/day are the number of rows with messages > 0,
+    so no DISTINCT scan over messages is needed.
+    """
+
+    date = models.DateField()
+    room = models.ForeignKey(
+        'a_rtchat.ChatGroup',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='stats_daily',
+    )
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_stats_daily')
+    messages = models.PositiveIntegerField(default=0)
+    blocked = models.PositiveIntegerField(default=0)
+    blocked_ai_scope = models.PositiveIntegerField(default=0)
+    auto_actions = models.PositiveIntegerField(default=0)
+    mod_allow = models.PositiveIntegerField(default=0)
+    mod_flag = models.PositiveIntegerField(default=0)
+    mod_block = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'room', 'user'], name='uniq_chat_stats_daily_date_room_user'),
+            models.UniqueConstraint(
+                fields=['date', 'user'],
+                condition=models.Q(room__isnull=True),
+                name='uniq_chat_stats_daily_date_user_site',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-date', 'room'], name='csd_date_room_idx'),
+            models.Index(fields=['user', '-date'], name='csd_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"ChatStatsDaily({self.date} room={self.room_id} u={self.user_id} msgs={self.messages})"
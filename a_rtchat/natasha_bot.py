@@ -3,12 +3,10 @@ from __future__ import annotations
 import os
 import random
 import re
-import threading
 import time
 from datetime import timedelta
 from typing import Optional
 
-import requests
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.db import transaction
@@ -16,6 +14,9 @@ from django.utils import timezone
 
 from a_users.models import Profile
 
+from . import llm_client
+from .bot_runtime import BotRuntime
+from .llm_client import PROVIDER_FAKE, PROVIDER_GROQ, PROVIDER_OPENROUTER, CircuitOpen
 from .models import ChatGroup, GroupMessage, Notification
 from .mentions import extract_mention_usernames, resolve_mentioned_users
 
@@ -97,9 +98,19 @@ def _get_openrouter_api_key() -> str:
         return ''
 
 
+def _active_provider() -> str:
+    """Provider replies go to: the local fake when enabled, else OpenRouter, else Groq."""
+    if llm_client.fake_enabled():
+        return PROVIDER_FAKE
+    if _openrouter_configured():
+        return PROVIDER_OPENROUTER
+    if _groq_configured():
+        return PROVIDER_GROQ
+    return ''
+
+
 def _llm_configured() -> bool:
-    # Prefer OpenRouter if configured, else Groq.
-    return bool(_openrouter_configured() or _groq_configured())
+    return bool(_active_provider())
 
 
 def _dedupe_trigger(trigger_message_id: int) -> bool:
@@ -389,8 +400,11 @@ def _recent_non_bot_chatter_count(chat_group: ChatGroup) -> int:
             return 0
 
 
-def _should_random_interject(chat_group: ChatGroup) -> bool:
-    """Occasional "3rd person" replies only when the chat is active."""
+def _should_random_interject(chat_group: ChatGroup, *, sampled: bool = False) -> bool:
+    """Occasional "3rd person" replies only when the chat is active.
+
+    `sampled` means the coin was already flipped by should_schedule_reply().
+    """
     try:
         from django.conf import settings
 
@@ -405,9 +419,9 @@ def _should_random_interject(chat_group: ChatGroup) -> bool:
     try:
         if prob <= 0:
             return False
-        if _recent_non_bot_chatter_count(chat_group) < int(min_chatters):
+        if not sampled and random.random() >= float(prob):
             return False
-        if random.random() >= float(prob):
+        if _recent_non_bot_chatter_count(chat_group) < int(min_chatters):
             return False
         # Only apply cooldown when we actually decide to interject.
         return bool(cache.add(f"natasha:random_interject:{chat_group.id}", '1', timeout=int(cooldown_seconds)))
@@ -427,6 +441,84 @@ def _is_reply_to_natasha(trigger: GroupMessage) -> bool:
         return False
 
 
+_NATASHA_USER_IDS: set[int] | None = None
+
+
+def _natasha_user_ids() -> set[int]:
+    """IDs of the bot account(s), looked up once per process."""
+    global _NATASHA_USER_IDS
+    if _NATASHA_USER_IDS is None:
+        try:
+            ids = set(
+                get_user_model().objects.filter(username__in=NATASHA_ALIASES).values_list('id', flat=True)
+            )
+        except Exception:
+            return set()
+        if not ids:
+            # Bot not created yet; don't memoize an empty answer.
+            return set()
+        _NATASHA_USER_IDS = ids
+    return _NATASHA_USER_IDS
+
+
+def should_schedule_reply(
+    chat_group_id: int,
+    body: str,
+    *,
+    reply_to_author_id: int | None = None,
+) -> tuple[bool, bool]:
+    """Cheap in-process check run for every public-chat message before any work is queued.
+
+    Returns (schedule, random_sampled). Explicit triggers (@mention, reply to Natasha)
+    always pass; otherwise the random-interjection coin is flipped here so that ~95% of
+    messages cost nothing. The activity check for random replies runs later on a worker.
+    """
+    try:
+        if cache.get(f"natasha:disable_replies:{int(chat_group_id)}"):
+            return False, False
+    except Exception:
+        pass
+
+    text = (body or '').strip()
+    if not text:
+        return False, False
+    if _is_direct_mention(text):
+        return True, False
+    if reply_to_author_id and int(reply_to_author_id) in _natasha_user_ids():
+        return True, False
+
+    try:
+        from django.conf import settings
+
+        prob = float(getattr(settings, 'NATASHA_RANDOM_REPLY_PROB', 0.05))
+    except Exception:
+        prob = 0.05
+    if prob <= 0 or random.random() >= prob:
+        return False, False
+    provider = _active_provider()
+    if not provider or llm_client.circuit_open(provider):
+        return False, False
+    return True, True
+
+
+_RUNTIME: BotRuntime | None = None
+
+
+def get_runtime() -> BotRuntime:
+    """Process-wide worker pool for Natasha (see a_rtchat.bot_runtime)."""
+    global _RUNTIME
+    if _RUNTIME is None:
+        try:
+            from django.conf import settings
+
+            workers = int(getattr(settings, 'NATASHA_WORKERS', 2))
+            max_pending = int(getattr(settings, 'NATASHA_QUEUE_MAX', 50))
+        except Exception:
+            workers, max_pending = 2, 50
+        _RUNTIME = BotRuntime(name='natasha', workers=workers, max_pending=max_pending)
+    return _RUNTIME
+
+
 def _cooldown_ok(chat_group: ChatGroup) -> bool:
     key = f"natasha:last_reply:{chat_group.id}"
     # allow at most one reply every 25 seconds
@@ -434,19 +526,25 @@ def _cooldown_ok(chat_group: ChatGroup) -> bool:
 
 
 def _build_prompt(chat_group: ChatGroup, trigger: GroupMessage) -> str:
-    # Provide minimal context: last few messages (excluding bot)
-    qs = (
-        GroupMessage.objects.filter(group=chat_group)
-        .select_related('author')
-        .order_by('-created')[:10]
-    )
-    msgs = list(qs)
-    msgs.reverse()
+    # Provide minimal context: last few messages (excluding bot). Served from the room's
+    # recent-message buffer; plain tuples from the DB on a miss.
+    from .recent_messages import latest_records
+
+    records = latest_records(chat_group.id, 10)
+    if records is not None:
+        rows = [(r['username'], r['body'], r['caption']) for r in records]
+    else:
+        rows = list(
+            GroupMessage.objects.filter(group=chat_group)
+            .order_by('-created')
+            .values_list('author__username', 'body', 'file_caption')[:10]
+        )
+        rows.reverse()
 
     lines = []
-    for m in msgs:
-        u = getattr(m.author, 'username', 'user')
-        body = (m.body or m.file_caption or '').strip()
+    for u, body, caption in rows:
+        u = u or 'user'
+        body = (body or caption or '').strip()
         if not body:
             continue
         if u == NATASHA_USERNAME:
@@ -554,22 +652,13 @@ def _natasha_replies_disabled(chat_group: ChatGroup) -> bool:
 
 
 def _groq_list_models(api_key: str) -> list[str]:
-    """Return available Groq model IDs (best-effort)."""
-    try:
-        url = "https://api.groq.com/openai/v1/models"
-        headers = {'Authorization': f"Bearer {api_key}"}
-        res = requests.get(url, headers=headers, timeout=12)
-        if not res.ok:
-            return []
-        data = res.json() or {}
-        ids: list[str] = []
-        for row in (data.get('data') or []):
-            mid = (row or {}).get('id')
-            if mid:
-                ids.append(str(mid))
-        return ids
-    except Exception:
-        return []
+    """Return available Groq model IDs (best-effort, cached)."""
+    return llm_client.list_models(
+        PROVIDER_GROQ,
+        "https://api.groq.com/openai/v1/models",
+        api_key,
+        timeout=12,
+    )
 
 
 def _pick_preferred_model(model_ids: list[str]) -> str:
@@ -614,21 +703,13 @@ def _extract_openai_compatible_error(res) -> tuple[str, str]:
 
 
 def _openrouter_list_models(api_key: str) -> list[str]:
-    """Return available OpenRouter model IDs (best-effort)."""
-    try:
-        url = "https://openrouter.ai/api/v1/models"
-        res = requests.get(url, headers={'Authorization': f"Bearer {api_key}"}, timeout=20)
-        if not res.ok:
-            return []
-        data = res.json() or {}
-        ids: list[str] = []
-        for row in (data.get('data') or []):
-            mid = (row or {}).get('id')
-            if mid:
-                ids.append(str(mid))
-        return ids
-    except Exception:
-        return []
+    """Return available OpenRouter model IDs (best-effort, cached)."""
+    return llm_client.list_models(
+        PROVIDER_OPENROUTER,
+        "https://openrouter.ai/api/v1/models",
+        api_key,
+        timeout=20,
+    )
 
 
 def _openrouter_pick_preferred_model(model_ids: list[str]) -> str:
@@ -729,7 +810,7 @@ def _groq_chat_completion(prompt: str) -> tuple[Optional[str], str]:
     }
 
     try:
-        res = requests.post(url, headers=headers, json=payload, timeout=12)
+        res = llm_client.post_json(PROVIDER_GROQ, url, headers=headers, payload=payload, timeout=12)
 
         # If the configured/default model is invalid/decommissioned, try a best-effort fallback once.
         if not res.ok:
@@ -752,7 +833,7 @@ def _groq_chat_completion(prompt: str) -> tuple[Optional[str], str]:
 
                 if fallback and fallback != model:
                     payload['model'] = fallback
-                    res = requests.post(url, headers=headers, json=payload, timeout=12)
+                    res = llm_client.post_json(PROVIDER_GROQ, url, headers=headers, payload=payload, timeout=12)
 
         if not res.ok:
             return None, f"http_{int(res.status_code)}"
@@ -764,6 +845,8 @@ def _groq_chat_completion(prompt: str) -> tuple[Optional[str], str]:
 
         text = str(content).strip()
         return text[:240], 'ok'
+    except CircuitOpen:
+        return None, 'circuit_open'
     except Exception:
         return None, 'exception'
 
@@ -802,7 +885,7 @@ def _openrouter_chat_completion(prompt: str) -> tuple[Optional[str], str]:
     }
 
     try:
-        res = requests.post(url, headers=headers, json=payload, timeout=20)
+        res = llm_client.post_json(PROVIDER_OPENROUTER, url, headers=headers, payload=payload, timeout=20)
         if not res.ok:
             code, msg = _extract_openai_compatible_error(res)
             s = (msg or '').lower()
@@ -821,7 +904,7 @@ def _openrouter_chat_completion(prompt: str) -> tuple[Optional[str], str]:
 
                 if fallback and fallback != model:
                     payload['model'] = fallback
-                    res = requests.post(url, headers=headers, json=payload, timeout=20)
+                    res = llm_client.post_json(PROVIDER_OPENROUTER, url, headers=headers, payload=payload, timeout=20)
 
         if not res.ok:
             return None, f"http_{int(res.status_code)}"
@@ -831,18 +914,84 @@ def _openrouter_chat_completion(prompt: str) -> tuple[Optional[str], str]:
         if not content:
             return None, 'no_content'
         return str(content).strip()[:240], 'ok'
+    except CircuitOpen:
+        return None, 'circuit_open'
     except Exception:
         return None, 'exception'
 
 
 def _llm_chat_completion(prompt: str) -> tuple[Optional[str], str]:
-    """Prefer OpenRouter if configured, else Groq."""
-    if _openrouter_configured():
+    """Route to the active provider (see _active_provider)."""
+    provider = _active_provider()
+    if provider == PROVIDER_FAKE:
+        return llm_client.fake_chat_completion(prompt)
+    if provider == PROVIDER_OPENROUTER:
         return _openrouter_chat_completion(prompt)
     return _groq_chat_completion(prompt)
 
 
-def natasha_maybe_reply(chat_group_id: int, trigger_message_id: int) -> None:
+def _send_typing(chat_group: ChatGroup, bot, is_typing: bool) -> None:
+    try:
+        from channels.layers import get_channel_layer
+        from asgiref.sync import async_to_sync
+        from .channels_utils import chatroom_channel_group_name
+
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            return
+        async_to_sync(channel_layer.group_send)(
+            chatroom_channel_group_name(chat_group),
+            {
+                'type': 'typing_handler',
+                'author_id': getattr(bot, 'id', None),
+                'username': NATASHA_DISPLAYNAME,
+                'is_typing': bool(is_typing),
+            },
+        )
+    except Exception:
+        return
+
+
+def _deliver_reply(chat_group: ChatGroup, bot, reply: str) -> None:
+    """Create Natasha's message, broadcast it and clear the typing indicator."""
+    try:
+        msg = GroupMessage.objects.create(
+            group=chat_group,
+            author=bot,
+            body=reply,
+        )
+
+        # Broadcast to room websocket listeners
+        try:
+            from channels.layers import get_channel_layer
+            from asgiref.sync import async_to_sync
+            from .channels_utils import chatroom_channel_group_name
+
+            channel_layer = get_channel_layer()
+            async_to_sync(channel_layer.group_send)(
+                chatroom_channel_group_name(chat_group),
+                {
+                    'type': 'message_handler',
+                    'message_id': msg.id,
+                    'skip_sender': False,
+                    'author_id': getattr(bot, 'id', None),
+                },
+            )
+        except Exception:
+            pass
+
+        # Ensure @mentions from Natasha behave like normal users (notifications + badge).
+        try:
+            _send_mention_notifications(chat_group, from_user=bot, message=msg, body=reply)
+        except Exception:
+            pass
+    except Exception:
+        pass
+    finally:
+        _send_typing(chat_group, bot, False)
+
+
+def natasha_maybe_reply(chat_group_id: int, trigger_message_id: int, random_sampled: bool = False) -> None:
     try:
         if not _dedupe_trigger(trigger_message_id):
             return
@@ -876,7 +1025,12 @@ def natasha_maybe_reply(chat_group_id: int, trigger_message_id: int) -> None:
 
         # Explicit triggers: @mention or reply-to.
         # Random interjections: only when multiple people are actively chatting.
-        random_interject = bool(llm_on and (not direct_mention) and (not reply_to_natasha) and _should_random_interject(chat_group))
+        random_interject = bool(
+            llm_on
+            and (not direct_mention)
+            and (not reply_to_natasha)
+            and _should_random_interject(chat_group, sampled=random_sampled)
+        )
 
         # Never auto-reply to every message (even when LLM is configured).
         # Only reply on explicit triggers, or the rare random interjection.
@@ -892,32 +1046,15 @@ def natasha_maybe_reply(chat_group_id: int, trigger_message_id: int) -> None:
         if not bot:
             return
 
-        def _send_typing(is_typing: bool) -> None:
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                from .channels_utils import chatroom_channel_group_name
-
-                channel_layer = get_channel_layer()
-                if not channel_layer:
-                    return
-                async_to_sync(channel_layer.group_send)(
-                    chatroom_channel_group_name(chat_group),
-                    {
-                        'type': 'typing_handler',
-                        'author_id': getattr(bot, 'id', None),
-                        'username': NATASHA_DISPLAYNAME,
-                        'is_typing': bool(is_typing),
-                    },
-                )
-            except Exception:
-                return
-
         typing_started = time.monotonic()
-        _send_typing(True)
+        _send_typing(chat_group, bot, True)
+        deferred = False
         try:
-            prompt = _build_prompt(chat_group, trigger)
+            prompt = llm_client.timed('natasha', 'prompt', _build_prompt, chat_group, trigger)
             reply, reply_status = _llm_chat_completion(prompt)
+            if reply_status == 'circuit_open':
+                # Provider is cooling down after 429/5xx; stay quiet until it closes.
+                return
             if not reply:
                 # No canned replies. If user explicitly triggers Natasha but AI isn't available,
                 # send a minimal notice (deduped) so it doesn't spam the room.
@@ -945,68 +1082,58 @@ def natasha_maybe_reply(chat_group_id: int, trigger_message_id: int) -> None:
                             _send_ai_unavailable_notice(chat_group, bot)
                 return
 
-            # Ensure the user sees a short "typing..." moment.
+            # Ensure the user sees a short "typing..." moment (3-4s by default, deterministic
+            # per message id). The send is scheduled rather than slept on, so the worker is
+            # free for other rooms meanwhile.
+            delay = 0.0
             try:
-                elapsed = time.monotonic() - typing_started
-                # Target 3-4 seconds typing (deterministic per message id).
-                target_typing = 3.0 + ((int(trigger_message_id) % 1000) / 1000.0)
-                if elapsed < target_typing:
-                    time.sleep(target_typing - elapsed)
-            except Exception:
-                pass
-
-            # Create message
-            msg = GroupMessage.objects.create(
-                group=chat_group,
-                author=bot,
-                body=reply,
-            )
+                from django.conf import settings
 
-            # Broadcast to room websocket listeners
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                from .channels_utils import chatroom_channel_group_name
-
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    chatroom_channel_group_name(chat_group),
-                    {
-                        'type': 'message_handler',
-                        'message_id': msg.id,
-                        'skip_sender': False,
-                        'author_id': getattr(bot, 'id', None),
-                    },
-                )
+                base = max(0.0, float(getattr(settings, 'NATASHA_MIN_TYPING_SECONDS', 3.0)))
+                elapsed = time.monotonic() - typing_started
+                target_typing = base * (1.0 + (int(trigger_message_id) % 1000) / 3000.0)
+                delay = max(0.0, target_typing - elapsed)
             except Exception:
                 pass
 
-            # Ensure @mentions from Natasha behave like normal users (notifications + badge).
-            try:
-                _send_mention_notifications(chat_group, from_user=bot, message=msg, body=reply)
-            except Exception:
-                pass
+            if delay > 0 and get_runtime().submit_later(delay, _deliver_reply, chat_group, bot, reply):
+                deferred = True
+            else:
+                _deliver_reply(chat_group, bot, reply)
+                deferred = True
         finally:
-            _send_typing(False)
+            if not deferred:
+                _send_typing(chat_group, bot, False)
     except Exception:
         return
 
 
-def trigger_natasha_reply_after_commit(chat_group_id: int, trigger_message_id: int) -> None:
-    """Schedule a bot reply without blocking the request."""
+def trigger_natasha_reply_after_commit(
+    chat_group_id: int,
+    trigger_message_id: int,
+    *,
+    body: str | None = None,
+    reply_to_author_id: int | None = None,
+) -> None:
+    """Schedule a bot reply without blocking the request.
+
+    When `body` is given, should_schedule_reply() filters the message first, so ordinary
+    chatter never reaches the worker pool, Celery or the database.
+    """
+    random_sampled = False
+    if body is not None:
+        schedule, random_sampled = should_schedule_reply(
+            chat_group_id,
+            body,
+            reply_to_author_id=reply_to_author_id,
+        )
+        if not schedule:
+            return
 
     def _kickoff():
-        # Always start a short-lived thread so it works even when Celery broker exists
+        # Always run on the local pool so it works even when a Celery broker exists
         # but a worker isn't running. We dedupe inside natasha_maybe_reply.
-        try:
-            t = threading.Thread(
-                target=natasha_maybe_reply,
-                args=(chat_group_id, trigger_message_id),
-                daemon=True,
-            )
-            t.start()
-        except Exception:
-            pass
+        get_runtime().submit(natasha_maybe_reply, chat_group_id, trigger_message_id, random_sampled)
 
         # Also enqueue to Celery when configured (optional).
         try:
@@ -1016,7 +1143,7 @@ def trigger_natasha_reply_after_commit(chat_group_id: int, trigger_message_id: i
                 try:
                     from .tasks import natasha_maybe_reply_task
 
-                    natasha_maybe_reply_task.delay(chat_group_id, trigger_message_id)
+                    natasha_maybe_reply_task.delay(chat_group_id, trigger_message_id, random_sampled)
                 except Exception:
                     pass
         except Exception:
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import transaction
+
+
+# Denormalized per-message reaction counts.
+#
+# GroupMessage.reaction_counts ({emoji: users}) is changed in the same transaction as
+# the MessageReaction rows it summarizes, under a row lock on the message, so page
+# renders and WebSocket fan-out read the counts off the message instead of running a
+# GROUP BY per render. A user holds at most one reaction per message.
+#
+# toggle_reaction() keeps the counts itself. Reactions deleted any other way (a user or
+# admin delete, a queryset delete) are released by a post_delete receiver in
+# a_rtchat.signals via release_counts(), after commit.
+
+DEFAULT_EMOJIS = ['👍', '❤️', '😂', '😮', '😢', '🙏']
+
+
+def reaction_emojis() -> list[str]:
+    return list(getattr(settings, 'CHAT_REACTION_EMOJIS', DEFAULT_EMOJIS))
+
+
+def toggle_reaction(message_id: int, user, emoji: str) -> dict:
+    """Toggle user's reaction on a message and update its counters.
+
+    Tapping the current emoji removes it; any other emoji replaces the previous one.
+    Returns {'counts', 'added' (emoji or None), 'removed' (list of emojis)}.
+    """
+    from .models import GroupMessage, MessageReaction
+
+    with transaction.atomic():
+        message = GroupMessage.objects.select_for_update().only('id', 'group_id', 'reaction_counts').get(pk=message_id)
+        previous = list(MessageReaction.objects.filter(message_id=message.id, user=user).values_list('id', 'emoji'))
+        removed = [e for _id, e in previous]
+        added = None if emoji in removed else emoji
+
+        # Delete instance by instance with the message attached, so the post_delete
+        # receivers don't look the message up again.
+        for reaction_id, previous_emoji in previous:
+            reaction = MessageReaction(id=reaction_id, message=message, user=user, emoji=previous_emoji)
+            reaction._counted = True  # counts are adjusted below, not by the receiver
+            reaction.delete()
+        if added:
+            MessageReaction.objects.create(message=message, user=user, emoji=added)
+
+        deltas = {e: -1 for e in removed}
+        if added:
+            deltas[added] = deltas.get(added, 0) + 1
+        counts = _apply(message.reaction_counts, deltas)
+        message.reaction_counts = counts
+        message.save(update_fields=['reaction_counts'])
+
+    return {'counts': counts, 'added': added, 'removed': removed}
+
+
+def _apply(counts: dict, deltas: dict) -> dict:
+    counts = dict(counts or {})
+    for emoji, delta in deltas.items():
+        n = int(counts.get(emoji) or 0) + int(delta)
+        if n > 0:
+            counts[emoji] = n
+        else:
+            counts.pop(emoji, None)
+    return counts
+
+
+def release_counts(removed: dict[int, dict[str, int]]) -> None:
+    """Subtract {message_id: {emoji: reactions deleted}} from the messages' counts."""
+    from .models import GroupMessage
+
+    for message_id, per_emoji in removed.items():
+        with transaction.atomic():
+            message = GroupMessage.objects.select_for_update().only('id', 'reaction_counts').filter(pk=message_id).first()
+            if message is None:
+                continue
+            counts = _apply(message.reaction_counts, {e: -n for e, n in per_emoji.items()})
+            # .update(): no signals, the buffer receivers already saw the reaction go.
+            GroupMessage.objects.filter(pk=message_id).update(reaction_counts=counts)
+
+
+def reaction_pills(counts: dict | None, reacted=()) -> list[dict]:
+    """Template pills in configured emoji order, skipping zero counts."""
+    counts = counts or {}
+    pills = []
+    for emoji in reaction_emojis():
+        c = int(counts.get(emoji) or 0)
+        if c > 0:
+            pills.append({'emoji': emoji, 'count': c, 'reacted': emoji in reacted})
+    return pills
+
+
+def recount(message_ids=None) -> int:
+    """Rebuild reaction_counts from MessageReaction rows. Returns messages updated."""
+    from django.db.models import Count
+
+    from .models import GroupMessage, MessageReaction
+
+    qs = MessageReaction.objects.all()
+    if message_ids is not None:
+        qs = qs.filter(message_id__in=list(message_ids))
+    counts: dict[int, dict] = {}
+    for row in qs.values('message_id', 'emoji').annotate(n=Count('user_id', distinct=True)).order_by():
+        counts.setdefault(row['message_id'], {})[row['emoji']] = int(row['n'])
+
+    stale = GroupMessage.objects.exclude(reaction_counts={})
+    if message_ids is not None:
+        stale = stale.filter(id__in=list(message_ids))
+    stale.exclude(id__in=list(counts)).update(reaction_counts={})
+
+    rows = [GroupMessage(id=mid, reaction_counts=c) for mid, c in counts.items()]
+    GroupMessage.objects.bulk_update(rows, ['reaction_counts'], batch_size=500)
+    return len(rows)
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+
+# Write-behind buffer for read receipts.
+#
+# Clients send {type:'read'} on every scroll, so instead of a ChatReadState write per
+# frame we keep the highest read message id per (user, room) in the cache (shared by
+# every process, so readers see it at once) and remember which pairs changed in a
+# process-local dirty map. A ticker thread flushes that map to ChatReadState in bulk
+# every CHAT_READ_FLUSH_SECONDS; it is also flushed at interpreter exit. Writes only
+# ever raise last_read_message_id, so overlapping flushes from several processes are safe.
+#
+# The room-wide `read_receipt` broadcast is coalesced per reader: the first mark in a
+# window is sent at once, later ones only update a pending value that the ticker sends
+# when the window closes.
+
+
+def _flush_seconds() -> float:
+    try:
+        return max(0.5, float(getattr(settings, 'CHAT_READ_FLUSH_SECONDS', 3)))
+    except Exception:
+        return 3.0
+
+
+def _receipt_window() -> float:
+    try:
+        return max(0.0, float(getattr(settings, 'CHAT_READ_RECEIPT_WINDOW_SECONDS', 1.0)))
+    except Exception:
+        return 1.0
+
+
+def _cache_ttl() -> int:
+    return 24 * 60 * 60
+
+
+def _key(user_id: int, room_id: int) -> str:
+    return f"chat:read:{int(room_id or 0)}:{int(user_id or 0)}"
+
+
+_LOCK = threading.Lock()
+_dirty: dict[tuple[int, int], int] = {}
+# (channel group name, reader id) -> [last sent at (monotonic), pending last_read_id or 0]
+_receipts: dict[tuple[str, int], list] = {}
+_ticker: threading.Thread | None = None
+
+
+def _db_last_read(user_id: int, room_id: int) -> int:
+    from .models_read import ChatReadState
+
+    return int(
+        ChatReadState.objects.filter(user_id=user_id, group_id=room_id)
+        .values_list('last_read_message_id', flat=True)
+        .first()
+        or 0
+    )
+
+
+def get_last_read(user_id: int, room_id: int) -> int:
+    """Highest message id the user has read in the room, including unflushed marks."""
+    if not user_id or not room_id:
+        return 0
+    try:
+        cached = cache.get(_key(user_id, room_id))
+    except Exception:
+        cached = None
+    if cached is not None:
+        return int(cached)
+    try:
+        value = _db_last_read(user_id, room_id)
+    except Exception:
+        return 0
+    try:
+        cache.add(_key(user_id, room_id), value, timeout=_cache_ttl())
+    except Exception:
+        pass
+    return value
+
+
+def get_many_last_read(user_id: int, room_ids) -> dict[int, int]:
+    """get_last_read() for several rooms: one cache round-trip plus at most one query."""
+    room_ids = [int(r) for r in room_ids if r]
+    if not user_id or not room_ids:
+        return {}
+    keys = {_key(user_id, rid): rid for rid in room_ids}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception:
+        cached = {}
+    out = {keys[k]: int(v) for k, v in cached.items()}
+    missing = [rid for rid in room_ids if rid not in out]
+    if missing:
+        from .models_read import ChatReadState
+
+        try:
+            found = dict(
+                ChatReadState.objects.filter(user_id=user_id, group_id__in=missing)
+                .values_list('group_id', 'last_read_message_id')
+            )
+        except Exception:
+            found = {}
+        for rid in missing:
+            out[rid] = int(found.get(rid) or 0)
+            try:
+                cache.add(_key(user_id, rid), out[rid], timeout=_cache_ttl())
+            except Exception:
+                pass
+    return out
+
+
+def _raise_cached(user_id: int, room_id: int, message_id: int) -> bool:
+    """Compare-and-set the cached watermark so concurrent marks never move it backwards.
+
+    Returns False when the cache already holds an equal or higher mark.
+    """
+    key = _key(user_id, room_id)
+    lock_key = f"{key}:lock"
+    try:
+        for _attempt in range(5):
+            if cache.add(lock_key, 1, timeout=2):
+                try:
+                    current = cache.get(key)
+                    if current is not None and int(current) >= message_id:
+                        return False
+                    cache.set(key, message_id, timeout=_cache_ttl())
+                    return True
+                finally:
+                    cache.delete(lock_key)
+            time.sleep(0.005)
+        # Lock still busy: another mark for this pair is being written. Only raise.
+        current = cache.get(key)
+        if current is not None and int(current) >= message_id:
+            return False
+        cache.set(key, message_id, timeout=_cache_ttl())
+    except Exception:
+        pass
+    return True
+
+
+def mark_read(user_id: int, room_id: int, message_id: int) -> bool:
+    """Record that the user has read up to message_id. Returns True if that moved the watermark."""
+    try:
+        user_id, room_id, message_id = int(user_id or 0), int(room_id or 0), int(message_id or 0)
+    except Exception:
+        return False
+    if not user_id or not room_id or message_id <= 0:
+        return False
+
+    if message_id <= get_last_read(user_id, room_id):
+        return False
+    if not _raise_cached(user_id, room_id, message_id):
+        return False
+    with _LOCK:
+        pair = (user_id, room_id)
+        if message_id > _dirty.get(pair, 0):
+            _dirty[pair] = message_id
+
+    from .unread import note_read
+
+    note_read(user_id, room_id, message_id)
+    return True
+
+
+def pending_count() -> int:
+    return len(_dirty)
+
+
+def _write(batch: dict[tuple[int, int], int]) -> None:
+    from .models_read import ChatReadState
+
+    user_ids = {u for u, _r in batch}
+    room_ids = {r for _u, r in batch}
+    existing = {
+        (row.user_id, row.group_id): row
+        for row in ChatReadState.objects.filter(user_id__in=user_ids, group_id__in=room_ids)
+        .only('id', 'user_id', 'group_id', 'last_read_message_id')
+    }
+
+    now = timezone.now()
+    to_raise = {}
+    to_create = []
+    for (user_id, room_id), message_id in batch.items():
+        row = existing.get((user_id, room_id))
+        if row is None:
+            to_create.append(ChatReadState(user_id=user_id, group_id=room_id, last_read_message_id=message_id))
+            # Another process may insert the row first (the insert below then skips it).
+            to_raise[(user_id, room_id)] = message_id
+        elif message_id > int(row.last_read_message_id or 0):
+            to_raise[(user_id, room_id)] = message_id
+
+    try:
+        with transaction.atomic():
+            if to_create:
+                ChatReadState.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=500)
+            # Conditional updates only ever raise the mark, whatever other processes wrote
+            # since the read above.
+            for (user_id, room_id), message_id in to_raise.items():
+                ChatReadState.objects.filter(
+                    user_id=user_id,
+                    group_id=room_id,
+                    last_read_message_id__lt=message_id,
+                ).update(last_read_message_id=message_id, updated=now)
+    except IntegrityError:
+        # A user or room was deleted since the mark; write row by row and drop the orphans.
+        for (user_id, room_id), message_id in batch.items():
+            try:
+                with transaction.atomic():
+                    obj, _created = ChatReadState.objects.get_or_create(
+                        user_id=user_id,
+                        group_id=room_id,
+                        defaults={'last_read_message_id': message_id},
+                    )
+                    if message_id > int(obj.last_read_message_id or 0):
+                        obj.last_read_message_id = message_id
+                        obj.save(update_fields=['last_read_message_id', 'updated'])
+            except IntegrityError:
+                continue
+
+
+def flush_read_states(*, room_id: int | None = None) -> int:
+    """Write buffered marks (optionally only one room's) to ChatReadState. Returns rows flushed."""
+    global _dirty
+    with _LOCK:
+        if room_id is None:
+            batch, _dirty = _dirty, {}
+        else:
+            batch = {pair: mid for pair, mid in _dirty.items() if pair[1] == int(room_id)}
+            for pair in batch:
+                _dirty.pop(pair, None)
+    if not batch:
+        return 0
+    try:
+        _write(batch)
+    except Exception:
+        # Put the batch back for the next tick; marks only ever move forward.
+        with _LOCK:
+            for pair, mid in batch.items():
+                if mid > _dirty.get(pair, 0):
+                    _dirty[pair] = mid
+        return 0
+    return len(batch)
+
+
+# Receipts --------------------------------------------------------------------
+
+def _send_receipt(group_name: str, reader_id: int, last_read_id: int) -> None:
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    async_to_sync(layer.group_send)(
+        group_name,
+        {
+            'type': 'read_receipt_handler',
+            'reader_id': reader_id,
+            'last_read_id': last_read_id,
+        },
+    )
+
+
+def broadcast_receipt(group_name: str, reader_id: int, last_read_id: int) -> bool:
+    """Send a read receipt now, or fold it into the reader's pending one. Returns True if sent now."""
+    key = (group_name, int(reader_id or 0))
+    now = time.monotonic()
+    with _LOCK:
+        state = _receipts.get(key)
+        if state is not None and now - state[0] < _receipt_window():
+            state[1] = max(int(state[1] or 0), int(last_read_id or 0))
+            return False
+        _receipts[key] = [now, 0]
+    try:
+        _send_receipt(group_name, int(reader_id or 0), int(last_read_id or 0))
+    except Exception:
+        pass
+    return True
+
+
+def send_due_receipts(*, now: float | None = None) -> int:
+    """Send pending receipts whose window has closed. Returns how many were sent."""
+    now = time.monotonic() if now is None else now
+    window = _receipt_window()
+    due = []
+    with _LOCK:
+        for key, state in list(_receipts.items()):
+            if now - state[0] < window:
+                continue
+            if state[1]:
+                due.append((key, state[1]))
+                _receipts[key] = [now, 0]
+            else:
+                del _receipts[key]
+    for (group_name, reader_id), last_read_id in due:
+        try:
+            _send_receipt(group_name, reader_id, last_read_id)
+        except Exception:
+            continue
+    return len(due)
+
+
+# Ticker ----------------------------------------------------------------------
+
+def _ticker_loop() -> None:
+    last_flush = time.monotonic()
+    while True:
+        time.sleep(max(0.05, min(_receipt_window() or 0.5, _flush_seconds())))
+        try:
+            send_due_receipts()
+        except Exception:
+            pass
+        if time.monotonic() - last_flush < _flush_seconds():
+            continue
+        last_flush = time.monotonic()
+        try:
+            flush_read_states()
+        except Exception:
+            pass
+        finally:
+            connection.close()
+
+
+def ensure_flusher() -> None:
+    """Start this process's ticker thread (idempotent) and flush on interpreter exit."""
+    global _ticker
+    if _ticker is not None and _ticker.is_alive():
+        return
+    with _LOCK:
+        if _ticker is not None and _ticker.is_alive():
+            return
+        first_start = _ticker is None
+        _ticker = threading.Thread(target=_ticker_loop, name='read-state-flush', daemon=True)
+        _ticker.start()
+    if first_start:
+        atexit.register(flush_read_states)
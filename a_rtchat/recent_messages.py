@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Per-room ring buffer of compact message records, newest last.
+#
+# Appended on create and patched on edit/delete/react (see a_rtchat.signals), so the
+# hot "latest messages" reads (poll, room open, bot prompt, moderation context) are one
+# cache get. Readers rebuild from the DB on a miss. Any write that can't take the room
+# lock drops the buffer instead of risking a stale copy; the next reader rebuilds it.
+#
+# Stored value: {'complete': bool, 'items': [record, ...]}. `complete` means the buffer
+# holds every message in the room (the room has fewer messages than the buffer size).
+
+
+def buffer_size() -> int:
+    try:
+        return max(10, int(getattr(settings, 'CHAT_RECENT_BUFFER_SIZE', 100)))
+    except Exception:
+        return 100
+
+
+def _ttl() -> int:
+    try:
+        return max(60, int(getattr(settings, 'CHAT_RECENT_BUFFER_TTL', 60 * 60)))
+    except Exception:
+        return 60 * 60
+
+
+def _key(room_id: int) -> str:
+    return f"chat:recent:{int(room_id or 0)}"
+
+
+def _lock_key(room_id: int) -> str:
+    return f"chat:recent:{int(room_id or 0)}:lock"
+
+
+def _gen_key(room_id: int) -> str:
+    return f"chat:recent:{int(room_id or 0)}:gen"
+
+
+def _bump_generation(room_id: int) -> None:
+    try:
+        cache.add(_gen_key(room_id), 0, timeout=None)
+        cache.incr(_gen_key(room_id))
+    except Exception:
+        pass
+
+
+def _generation(room_id: int):
+    try:
+        return cache.get(_gen_key(room_id))
+    except Exception:
+        return None
+
+
+def message_record(message, *, username: str | None = None) -> dict:
+    """Compact, picklable snapshot of a GroupMessage."""
+    if username is None:
+        # Only use an already-loaded author; never query from a signal handler.
+        author_field = type(message)._meta.get_field('author')
+        author = message.author if author_field.is_cached(message) else None
+        username = getattr(author, 'username', '') or ''
+    created = getattr(message, 'created', None)
+    return {
+        'id': int(message.id),
+        'author_id': getattr(message, 'author_id', None),
+        'username': username or '',
+        'body': getattr(message, 'body', None) or '',
+        'caption': getattr(message, 'file_caption', None) or '',
+        'has_file': bool(getattr(message, 'file', None)),
+        'created': created.timestamp() if created else 0.0,
+        'edited': bool(getattr(message, 'edited_at', None)),
+        'reply_to_id': getattr(message, 'reply_to_id', None),
+        'reactions': {},
+    }
+
+
+def _rebuild(room_id: int) -> dict:
+    from .models import GroupMessage
+
+    size = buffer_size()
+    rows = list(
+        GroupMessage.objects.filter(group_id=room_id)
+        .order_by('-id')
+        .values(
+            'id', 'author_id', 'author__username', 'body', 'file_caption', 'file',
+            'created', 'edited_at', 'reply_to_id', 'reaction_counts',
+        )[: size + 1]
+    )
+    complete = len(rows) <= size
+    rows = rows[:size]
+    rows.reverse()
+
+    items = []
+    for r in rows:
+        items.append({
+            'id': int(r['id']),
+            'author_id': r['author_id'],
+            'username': r['author__username'] or '',
+            'body': r['body'] or '',
+            'caption': r['file_caption'] or '',
+            'has_file': bool(r['file']),
+            'created': r['created'].timestamp() if r['created'] else 0.0,
+            'edited': bool(r['edited_at']),
+            'reply_to_id': r['reply_to_id'],
+            'reactions': dict(r['reaction_counts'] or {}),
+        })
+
+    return {'complete': complete, 'items': items}
+
+
+def get_buffer(room_id: int, *, rebuild: bool = True) -> dict | None:
+    """Return the room's buffer, rebuilding it from the DB on a miss (unless rebuild=False)."""
+    if not room_id:
+        return None
+    try:
+        buf = cache.get(_key(room_id))
+    except Exception:
+        buf = None
+    if buf is not None or not rebuild:
+        return buf
+
+    gen = _generation(room_id)
+    try:
+        buf = _rebuild(room_id)
+    except Exception:
+        return None
+    # A write that landed while we were reading would be missing from our copy:
+    # serve it, but don't cache it.
+    if _generation(room_id) == gen:
+        try:
+            cache.add(_key(room_id), buf, timeout=_ttl())
+        except Exception:
+            pass
+    return buf
+
+
+def invalidate(room_id: int) -> None:
+    try:
+        cache.delete(_key(room_id))
+    except Exception:
+        pass
+
+
+def _mutate(room_id: int, fn) -> None:
+    """Apply fn(buffer) under a short per-room lock. Missing buffers are left for readers to rebuild."""
+    if not room_id:
+        return
+    _bump_generation(room_id)
+    lock = _lock_key(room_id)
+    acquired = False
+    try:
+        for _ in range(20):
+            if cache.add(lock, '1', timeout=2):
+                acquired = True
+                break
+            time.sleep(0.005)
+    except Exception:
+        acquired = False
+
+    if not acquired:
+        invalidate(room_id)
+        return
+
+    try:
+        buf = cache.get(_key(room_id))
+        if buf is None:
+            return
+        fn(buf)
+        cache.set(_key(room_id), buf, timeout=_ttl())
+    except Exception:
+        invalidate(room_id)
+    finally:
+        try:
+            cache.delete(lock)
+        except Exception:
+            pass
+
+
+def append(room_id: int, record: dict) -> None:
+    def _apply(buf):
+        items = [it for it in buf['items'] if it['id'] != record['id']]
+        items.append(record)
+        items.sort(key=lambda it: it['id'])
+        size = buffer_size()
+        if len(items) > size:
+            items = items[-size:]
+            buf['complete'] = False
+        buf['items'] = items
+
+    _mutate(room_id, _apply)
+
+
+def patch(room_id: int, message_id: int, **changes) -> None:
+    def _apply(buf):
+        for it in buf['items']:
+            if it['id'] == int(message_id):
+                it.update(changes)
+                return
+
+    _mutate(room_id, _apply)
+
+
+def remove(room_id: int, message_ids) -> None:
+    # Dropping records keeps the invariant "items are the newest messages that still exist".
+    ids = {int(x) for x in message_ids}
+
+    def _apply(buf):
+        buf['items'] = [it for it in buf['items'] if it['id'] not in ids]
+
+    _mutate(room_id, _apply)
+
+
+def add_reaction(room_id: int, message_id: int, emoji: str, delta: int) -> None:
+    def _apply(buf):
+        for it in buf['items']:
+            if it['id'] == int(message_id):
+                counts = dict(it.get('reactions') or {})
+                n = int(counts.get(emoji) or 0) + int(delta)
+                if n > 0:
+                    counts[emoji] = n
+                else:
+                    counts.pop(emoji, None)
+                it['reactions'] = counts
+                return
+
+    _mutate(room_id, _apply)
+
+
+# Readers ---------------------------------------------------------------------
+
+def latest_message_id(room_id: int) -> int | None:
+    """Newest message id in the room (0 for an empty room); None if the buffer is unavailable."""
+    buf = get_buffer(room_id)
+    if buf is None:
+        return None
+    if buf['items']:
+        return int(buf['items'][-1]['id'])
+    return 0 if buf['complete'] else None
+
+
+def latest_records(room_id: int, limit: int) -> list[dict] | None:
+    """The newest `limit` records (oldest first), or None when the buffer can't answer."""
+    buf = get_buffer(room_id)
+    if buf is None:
+        return None
+    items = buf['items']
+    if len(items) < limit and not buf['complete']:
+        return None
+    return items[-limit:] if limit > 0 else []
+
+
+def has_older_than(room_id: int, message_id: int) -> bool | None:
+    """Whether the room has messages older than `message_id`; None when unknown."""
+    buf = get_buffer(room_id, rebuild=False)
+    if buf is None:
+        return None
+    items = buf['items']
+    if items and items[0]['id'] < int(message_id):
+        return True
+    if buf['complete']:
+        return False
+    return None
+
+
+def recent_bodies(room_id: int, *, author_id: int | None = None, limit: int = 5) -> list[str] | None:
+    """Newest-first non-empty text bodies, optionally for one author; None when unknown."""
+    buf = get_buffer(room_id)
+    if buf is None:
+        return None
+    out = []
+    for it in reversed(buf['items']):
+        if author_id is not None and it['author_id'] != author_id:
+            continue
+        if not it['body']:
+            continue
+        out.append(it['body'])
+        if len(out) >= limit:
+            return out
+    return out if buf['complete'] else None
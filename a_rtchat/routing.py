@@ -7,4 +7,5 @@ websocket_urlpatterns = [
     path("ws/presence/<username>/", ProfilePresenceConsumer.as_asgi()),
     path("ws/notify/", NotificationsConsumer.as_asgi()),
     path("ws/global-announcement/", GlobalAnnouncementConsumer.as_asgi()),
+    path("ws/staff-metrics/", StaffMetricsConsumer.as_asgi()),
 ]
\ No newline at end of file
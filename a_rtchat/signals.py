@@ -0,0 +1,155 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import recent_messages, unread
+from .reactions import release_counts as release_reaction_counts
+from .analytics import blocked_event_deltas, fold_room_rollups, moderation_event_deltas, record_activity
+from .models import BlockedMessageEvent, ChatGroup, GroupMessage, MessageReaction, ModerationEvent
+
+
+# Analytics rollups
+# Counted once, on insert, after the surrounding transaction commits so
+# rolled-back sends never show up on the staff dashboard.
+@receiver(post_save, sender=GroupMessage)
+def rollup_message_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    transaction.on_commit(lambda: record_activity(
+        when=instance.created,
+        room_id=instance.group_id,
+        user_id=instance.author_id,
+        messages=1,
+    ))
+
+
+@receiver(post_save, sender=BlockedMessageEvent)
+def rollup_blocked_event_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    transaction.on_commit(lambda: record_activity(
+        when=instance.created,
+        room_id=instance.room_id,
+        user_id=instance.user_id,
+        **blocked_event_deltas(instance),
+    ))
+
+
+@receiver(post_save, sender=ModerationEvent)
+def rollup_moderation_event_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    transaction.on_commit(lambda: record_activity(
+        when=instance.created,
+        room_id=instance.room_id,
+        user_id=instance.user_id,
+        **moderation_event_deltas(instance),
+    ))
+
+
+@receiver(pre_delete, sender=ChatGroup)
+def rollup_room_deleted(sender, instance, **kwargs):
+    fold_room_rollups(instance.id)
+
+
+# Recent-message ring buffer (a_rtchat.recent_messages)
+@receiver(post_save, sender=GroupMessage)
+def recent_buffer_message_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    room_id = instance.group_id
+    if created:
+        record = recent_messages.message_record(instance)
+        transaction.on_commit(lambda: recent_messages.append(room_id, record))
+        return
+    changes = {
+        'body': instance.body or '',
+        'caption': instance.file_caption or '',
+        'edited': bool(instance.edited_at),
+    }
+    transaction.on_commit(lambda: recent_messages.patch(room_id, instance.id, **changes))
+
+
+@receiver(post_delete, sender=GroupMessage)
+def recent_buffer_message_deleted(sender, instance, origin=None, **kwargs):
+    # One delete() call (a queryset, a cascade from the room, a single message) can remove
+    # many rows: collect their ids on the origin and patch each room's buffer once, after
+    # commit. A rollback discards the callback together with the collected ids.
+    room_id, message_id = instance.group_id, instance.id
+    if origin is None:
+        transaction.on_commit(lambda: recent_messages.remove(room_id, [message_id]))
+        return
+    pending = getattr(origin, '_recent_buffer_removals', None)
+    if pending is None:
+        pending = {}
+        try:
+            origin._recent_buffer_removals = pending
+        except Exception:
+            transaction.on_commit(lambda: recent_messages.remove(room_id, [message_id]))
+            return
+
+        def _flush():
+            for rid, ids in pending.items():
+                recent_messages.remove(rid, ids)
+
+        transaction.on_commit(_flush)
+    pending.setdefault(room_id, set()).add(message_id)
+
+
+def _reaction_room_id(instance, origin=None):
+    message_field = MessageReaction._meta.get_field('message')
+    if message_field.is_cached(instance):
+        return instance.message.group_id
+    # Cascade from deleting the message itself: its record goes away anyway.
+    if isinstance(origin, GroupMessage) or (isinstance(origin, QuerySet) and origin.model is GroupMessage):
+        return None
+    return GroupMessage.objects.filter(pk=instance.message_id).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=MessageReaction)
+def recent_buffer_reaction_added(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    room_id = _reaction_room_id(instance)
+    if room_id:
+        transaction.on_commit(lambda: recent_messages.add_reaction(room_id, instance.message_id, instance.emoji, 1))
+
+
+# Denormalized reaction counts (a_rtchat.reactions)
+@receiver(post_delete, sender=MessageReaction)
+def reaction_counts_released(sender, instance, origin=None, **kwargs):
+    # toggle_reaction() adjusts the counts itself; a deleted message takes its counts along.
+    if getattr(instance, '_counted', False):
+        return
+    if isinstance(origin, GroupMessage) or (isinstance(origin, QuerySet) and origin.model is GroupMessage):
+        return
+    # Collected per delete() call, like the recent-buffer removals above.
+    holder = origin if origin is not None else instance
+    pending = getattr(holder, '_reaction_count_releases', None)
+    if pending is None:
+        pending = {}
+        try:
+            holder._reaction_count_releases = pending
+        except Exception:
+            return
+        transaction.on_commit(lambda: release_reaction_counts(pending))
+    per_emoji = pending.setdefault(instance.message_id, {})
+    per_emoji[instance.emoji] = per_emoji.get(instance.emoji, 0) + 1
+
+
+@receiver(post_delete, sender=MessageReaction)
+def recent_buffer_reaction_removed(sender, instance, origin=None, **kwargs):
+    room_id = _reaction_room_id(instance, origin)
+    if room_id:
+        message_id, emoji = instance.message_id, instance.emoji
+        transaction.on_commit(lambda: recent_messages.add_reaction(room_id, message_id, emoji, -1))
+
+
+# Unread counters (a_rtchat.unread)
+@receiver(post_save, sender=GroupMessage)
+def unread_message_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    room_id, message_id, author_id = instance.group_id, instance.id, instance.author_id
+    transaction.on_commit(lambda: unread.note_message_created(room_id, message_id, author_id))
@@ -6,5 +6,23 @@ from .natasha_bot import natasha_maybe_reply
 
 
 @shared_task(bind=True, ignore_result=True)
-def natasha_maybe_reply_task(self, chat_group_id: int, trigger_message_id: int):
-    natasha_maybe_reply(chat_group_id=chat_group_id, trigger_message_id=trigger_message_id)
+def natasha_maybe_reply_task(self, chat_group_id: int, trigger_message_id: int, random_sampled: bool = False):
+    natasha_maybe_reply(
+        chat_group_id=chat_group_id,
+        trigger_message_id=trigger_message_id,
+        random_sampled=random_sampled,
+    )
+
+
+@shared_task(bind=True, ignore_result=True)
+def challenge_expire_task(self, challenge_id: int):
+    from .challenges import expire_challenge
+
+    expire_challenge(challenge_id)
+
+
+@shared_task(bind=True, ignore_result=True)
+def process_media_task(self, kind: str, object_id: int):
+    from .media_pipeline import PROCESSORS
+
+    PROCESSORS[kind](object_id)
@@ -1,14 +1,57 @@
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.messages import get_messages
 from django.utils import timezone
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from datetime import timedelta
 import base64
+import io
+import json
+import time
+from unittest import mock
 
-from .models import ChatGroup, CodeRoomJoinRequest, GroupMessage, OneTimeMessageView
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from a_core import runtime_config
+from a_core.query_budget import QueryBudgetExceeded, query_budget, sql_shape
+from a_core.maintenance_views import is_maintenance_enabled, set_maintenance_enabled
+from a_users.models import BetaFeature
+
+from .models import BlockedMessageEvent, ChallengeStats, ChatChallenge, ChatGroup, GlobalAnnouncement, MessageReaction, ChatStatsDaily, ChatStatsHourly, CodeRoomJoinRequest, GroupMessage, OneTimeMessageView
+from .analytics import rebuild_rollups, record_activity
+from . import budget_fixtures
+from .bot_runtime import BotRuntime
+from .challenges import (
+	cancel_challenge,
+	check_message,
+	end_challenge,
+	expire_challenge,
+	get_active_challenge,
+	get_leaderboard,
+	get_win_loss_totals,
+	rebuild_challenge_stats,
+	start_challenge,
+)
+from .exports import PROFILE_FLAG_FIELDS, stream_users_csv
+from .live_metrics import get_snapshot as get_live_metrics_snapshot
+from . import gifs
+from . import llm_client
+from . import media_pipeline
+from .mentions import search_mention_candidates
+from .consumers import ChatroomConsumer, NotificationsConsumer, ProfilePresenceConsumer
+from .models_read import ChatReadState
+from .natasha_bot import natasha_maybe_reply, should_schedule_reply
+from . import read_state, recent_messages
+from .unread import unread_counts
+from .reactions import recount
 from .retention import trim_chat_group_messages
+from . import user_flags
+from . import ws_bench, ws_metrics
 
 
 class AdminToggleUserBlockTests(TestCase):
@@ -253,3 +296,1108 @@ class OneTimeViewTests(TestCase):
 		url = reverse('message-one-time-open', kwargs={'message_id': msg.id})
 		resp = self.client.post(url)
 		self.assertEqual(resp.status_code, 403)
+
+
+class AnalyticsRollupTests(TestCase):
+	def test_writes_update_rollups(self):
+		user = User.objects.create_user(username='roll_user', password='pass12345')
+		room = ChatGroup.objects.create(group_name='roll-room')
+
+		with self.captureOnCommitCallbacks(execute=True):
+			GroupMessage.objects.create(group=room, author=user, body='a')
+			GroupMessage.objects.create(group=room, author=user, body='b')
+			BlockedMessageEvent.objects.create(user=user, room=room, scope='dup_msg', auto_muted_seconds=60)
+
+		day = ChatStatsDaily.objects.get(room=room, user=user)
+		self.assertEqual(day.messages, 2)
+		self.assertEqual(day.blocked, 1)
+		self.assertEqual(day.auto_actions, 1)
+		self.assertEqual(ChatStatsHourly.objects.get(room=room).messages, 2)
+
+	def test_rebuild_matches_write_time_counters(self):
+		user = User.objects.create_user(username='roll_user2', password='pass12345')
+		room = ChatGroup.objects.create(group_name='roll-room2')
+		with self.captureOnCommitCallbacks(execute=True):
+			for i in range(3):
+				GroupMessage.objects.create(group=room, author=user, body=f'm{i}')
+
+		ChatStatsDaily.objects.update(messages=0)
+		written = rebuild_rollups()
+		self.assertEqual(written['daily'], 1)
+		self.assertEqual(ChatStatsDaily.objects.get(room=room, user=user).messages, 3)
+
+	def test_site_wide_rows_are_unique_and_deleted_rooms_fold_into_them(self):
+		from django.db import IntegrityError, transaction
+
+		user = User.objects.create_user(username='roll_user3', password='pass12345')
+		room = ChatGroup.objects.create(group_name='roll-room4')
+		other = ChatGroup.objects.create(group_name='roll-room5')
+		now = timezone.now()
+		for room_id in (None, room.id, other.id):
+			record_activity(when=now, room_id=room_id, user_id=user.id, messages=2)
+		with self.assertRaises(IntegrityError), transaction.atomic():
+			ChatStatsDaily.objects.create(date=timezone.localdate(now), room=None, user=user, messages=1)
+
+		room.delete()
+		other.delete()
+		self.assertEqual(ChatStatsDaily.objects.get(room=None, user=user).messages, 6)
+		self.assertEqual(ChatStatsHourly.objects.get(room=None).messages, 6)
+
+	def test_dashboard_reads_rollups(self):
+		staff = User.objects.create_user(username='roll_staff', password='pass12345', is_staff=True)
+		room = ChatGroup.objects.create(group_name='roll-room3')
+		with self.captureOnCommitCallbacks(execute=True):
+			GroupMessage.objects.create(group=room, author=staff, body='hi')
+
+		# Retention deleting raw rows must not change the dashboard numbers.
+		GroupMessage.objects.all().delete()
+
+		self.client.force_login(staff)
+		resp = self.client.get(reverse('admin-analytics'))
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.context['messages_today'], 1)
+		self.assertEqual(resp.context['room_rows'][0]['active_users'], 1)
+
+
+class LiveMetricsSnapshotTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_live_view_serves_cached_snapshot_with_etag(self):
+		staff = User.objects.create_user(username='live_staff', password='pass12345', is_staff=True)
+		self.client.force_login(staff)
+		url = reverse('admin-analytics-live')
+
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.json().get('ok'))
+		etag = resp['ETag']
+		self.assertTrue(etag)
+
+		# Within the refresh interval no metric queries run, regardless of how many pollers.
+		self.assertEqual(get_live_metrics_snapshot()['etag'], etag.strip('"'))
+		with self.assertNumQueries(0):
+			get_live_metrics_snapshot()
+
+		resp2 = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp2.status_code, 304)
+
+	def test_non_staff_gets_404(self):
+		user = User.objects.create_user(username='live_user', password='pass12345')
+		self.client.force_login(user)
+		resp = self.client.get(reverse('admin-analytics-live'))
+		self.assertEqual(resp.status_code, 404)
+
+
+class AdminUsersExportTests(TestCase):
+	async def test_export_streams_with_extra_columns(self):
+		from asgiref.sync import sync_to_async
+		from a_users.models import UserDevice
+
+		def _seed():
+			staff = User.objects.create_user(username='exp_staff', password='pass12345', is_staff=True)
+			other = User.objects.create_user(username='exp_other', email='o@example.com', password='pass12345')
+			other.profile.is_dnd = True
+			other.profile.save(update_fields=['is_dnd'])
+			UserDevice.objects.create(user=other, ua_hash='x', user_agent='UA', device_label='Android')
+			return staff
+
+		staff = await sync_to_async(_seed)()
+		await self.async_client.aforce_login(staff)
+		resp = await self.async_client.get(reverse('admin-users-export'), {'q': 'exp_', 'columns': 'joined,profile_flags,last_device'})
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.streaming)
+		# Under ASGI a sync iterator would be collected in full before the first byte.
+		self.assertTrue(resp.is_async)
+		self.assertTrue(hasattr(resp.streaming_content, '__aiter__'))
+
+		chunks = [chunk async for chunk in resp.streaming_content]
+		lines = b''.join(chunks).decode('utf-8').lstrip('\ufeff').splitlines()
+		self.assertEqual(lines[0].split(',')[:3], ['username', 'email', 'date_joined'])
+		self.assertEqual(len(lines), 3)
+		row = lines[1].split(',')
+		self.assertEqual(row[:2], ['exp_other', 'o@example.com'])
+		self.assertIn('Android', row)
+		self.assertEqual(row[3 + PROFILE_FLAG_FIELDS.index('is_dnd')], '1')
+
+	def test_export_of_100k_users_is_memory_bounded(self):
+		import tracemalloc
+
+		User.objects.bulk_create(
+			[User(username=f'bulk{i:06d}', email=f'bulk{i:06d}@example.com') for i in range(100_000)],
+			batch_size=5000,
+		)
+
+		tracemalloc.start()
+		try:
+			total_bytes = 0
+			rows = 0
+			for chunk in stream_users_csv(User.objects.all(), limit=200_000, batch_size=500):
+				total_bytes += len(chunk)
+				rows += chunk.count('\n')
+			_current, peak = tracemalloc.get_traced_memory()
+		finally:
+			tracemalloc.stop()
+
+		self.assertEqual(rows, User.objects.count() + 1)
+		# A buffered response would hold every line at once; streaming is bounded by the batch.
+		self.assertGreater(total_bytes, 3_000_000)
+		self.assertLess(peak, total_bytes // 3)
+
+
+class ChallengeStatsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.a = User.objects.create_user(username='ch_a', password='pass12345')
+		self.b = User.objects.create_user(username='ch_b', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='ch-room', is_private=True)
+
+	def _challenge(self, losers=()):
+		return ChatChallenge.objects.create(
+			group=self.room,
+			kind=ChatChallenge.KIND_EMOJI_ONLY,
+			status=ChatChallenge.STATUS_ACTIVE,
+			started_at=timezone.now(),
+			ends_at=timezone.now() + timedelta(seconds=30),
+			meta={'participants': [self.a.id, self.b.id], 'losers': list(losers), 'winners': []},
+		)
+
+	def test_end_and_cancel_update_stats_once(self):
+		ch = self._challenge(losers=[self.b.id])
+		end_challenge(ch)
+		# A second end (e.g. WS and HTTP racing) must not double count.
+		end_challenge(ChatChallenge.objects.get(pk=ch.pk))
+		cancel_challenge(self._challenge())
+
+		with self.assertNumQueries(1):
+			totals = get_win_loss_totals(self.a.id)
+		self.assertEqual(totals, {'wins': 1, 'losses': 0, 'completed': 1})
+		self.assertEqual(get_win_loss_totals(self.b.id, group=self.room)['losses'], 1)
+		self.assertEqual(ChallengeStats.objects.get(user=self.b, room__isnull=True).cancelled, 1)
+
+		board = get_leaderboard(group=self.room)
+		self.assertEqual([r['user__username'] for r in board], ['ch_a'])
+
+	def test_rebuild_matches_live_counters(self):
+		end_challenge(self._challenge(losers=[self.a.id]))
+		end_challenge(self._challenge())
+		before = get_win_loss_totals(self.a.id)
+
+		ChallengeStats.objects.all().delete()
+		self.assertEqual(rebuild_challenge_stats(), 4)
+		self.assertEqual(get_win_loss_totals(self.a.id), before)
+		self.assertEqual(get_win_loss_totals(self.b.id)['wins'], 2)
+
+
+class LiveChallengeStateTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.a = User.objects.create_user(username='live_ch_a', password='pass12345')
+		self.b = User.objects.create_user(username='live_ch_b', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='live-ch-room', is_private=True)
+		self.room.users_online.add(self.a, self.b)
+
+	def test_messages_do_not_touch_the_db_until_end(self):
+		start_challenge(self.room, created_by=self.a, kind=ChatChallenge.KIND_EMOJI_ONLY)
+		get_active_challenge(self.room)
+
+		with self.assertNumQueries(0):
+			active = get_active_challenge(self.room)
+			self.assertFalse(check_message(active, self.a.id, 'hello there').allowed)
+			self.assertTrue(check_message(get_active_challenge(self.room), self.b.id, '\U0001F600').allowed)
+
+		self.assertEqual(ChatChallenge.objects.get(pk=active.pk).meta['losers'], [])
+
+		ended = end_challenge(get_active_challenge(self.room))
+		self.assertEqual(ended.meta['losers'], [self.a.id])
+		self.assertEqual(ended.meta['winners'], [self.b.id])
+		with self.assertNumQueries(0):
+			self.assertIsNone(get_active_challenge(self.room))
+
+	def test_expiry_ends_and_announces_once(self):
+		ch = start_challenge(self.room, created_by=self.a, kind=ChatChallenge.KIND_TIME_ATTACK)
+		ChatChallenge.objects.filter(pk=ch.pk).update(ends_at=timezone.now() - timedelta(seconds=1))
+		layer = get_channel_layer()
+		channel = async_to_sync(layer.new_channel)()
+		async_to_sync(layer.group_add)(f'chatroom.{self.room.id}', channel)
+
+		self.assertTrue(expire_challenge(ch.pk))
+		self.assertFalse(expire_challenge(ch.pk))
+		ch.refresh_from_db()
+		self.assertEqual(ch.status, ChatChallenge.STATUS_COMPLETED)
+		self.assertTrue(ch.meta.get('ended_notified'))
+
+		event = async_to_sync(layer.receive)(channel)
+		self.assertEqual(event['type'], 'challenge_event_handler')
+		self.assertIn('No winners this time.', event['html'])
+
+	def test_concurrent_new_senders_are_all_kept(self):
+		from .challenges import _note_sender, live_meta
+
+		ch = start_challenge(self.room, created_by=self.a, kind=ChatChallenge.KIND_EMOJI_ONLY)
+		late = [User.objects.create_user(username=f'live_ch_late{i}', password='pass12345') for i in range(3)]
+		# Each sender works from the same stale snapshot, as concurrent workers would.
+		for user in late:
+			_note_sender(ch, dict(ch.meta or {}), user.id)
+		_note_sender(ch, dict(ch.meta or {}), late[0].id)
+
+		fresh = ChatChallenge.objects.get(pk=ch.pk)
+		self.assertTrue({u.id for u in late} <= set(live_meta(fresh)['seen']))
+		self.assertEqual(cache.get(f'challenge:{ch.pk}:seen_n'), 3)
+
+
+class NatashaTriggerTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.room = ChatGroup.objects.get_or_create(group_name='public-chat')[0]
+
+	@override_settings(NATASHA_RANDOM_REPLY_PROB=0)
+	def test_ordinary_chatter_is_filtered_without_queries(self):
+		with self.assertNumQueries(0):
+			self.assertEqual(should_schedule_reply(self.room.id, 'just chatting'), (False, False))
+			self.assertEqual(should_schedule_reply(self.room.id, 'hey @natasha what up'), (True, False))
+
+	@override_settings(NATASHA_RANDOM_REPLY_PROB=0)
+	def test_reply_to_bot_triggers(self):
+		bot = User.objects.filter(username__in=['natasha', 'natasha-bot']).first()
+		if bot is None:
+			bot = User.objects.create_user(username='natasha', password='pass12345')
+		self.assertEqual(should_schedule_reply(self.room.id, 'ok', reply_to_author_id=bot.id), (True, False))
+
+	def test_disabled_room_skips_everything(self):
+		cache.set(f"natasha:disable_replies:{self.room.id}", '1', timeout=60)
+		self.assertEqual(should_schedule_reply(self.room.id, '@natasha hi'), (False, False))
+
+
+class BotRuntimeTests(TestCase):
+	def test_delayed_jobs_run_in_due_order_and_queue_is_bounded(self):
+		import threading
+
+		runtime = BotRuntime(name='test-bot', workers=1, max_pending=3)
+		done = threading.Event()
+		order = []
+
+		runtime.submit_later(0.2, order.append, 'late')
+		runtime.submit_later(0.05, order.append, 'early')
+		runtime.submit_later(0.3, lambda: (order.append('last'), done.set()))
+		self.assertFalse(runtime.submit(order.append, 'dropped'))
+		self.assertEqual(runtime.dropped, 1)
+
+		self.assertTrue(done.wait(timeout=5))
+		self.assertEqual(order, ['early', 'late', 'last'])
+
+
+class LLMClientTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	@override_settings(LLM_BREAKER_THRESHOLD=3, LLM_BREAKER_COOLDOWN_SECONDS=60)
+	def test_breaker_opens_on_rate_limit_and_repeated_5xx(self):
+		llm_client._note_result('groq', 429)
+		self.assertTrue(llm_client.circuit_open('groq'))
+		with self.assertRaises(llm_client.CircuitOpen):
+			llm_client.post_json('groq', 'https://example.invalid/', headers={}, payload={}, timeout=1)
+
+		for _ in range(2):
+			llm_client._note_result('openrouter', 502)
+		self.assertFalse(llm_client.circuit_open('openrouter'))
+		llm_client._note_result('openrouter', 503)
+		self.assertTrue(llm_client.circuit_open('openrouter'))
+
+	@override_settings(LLM_PROVIDER='fake', NATASHA_MIN_TYPING_SECONDS=0)
+	def test_fake_provider_runs_full_reply_path_offline(self):
+		room = ChatGroup.objects.get_or_create(group_name='public-chat')[0]
+		user = User.objects.create_user(username='llm_user', password='pass12345')
+		trigger = GroupMessage.objects.create(group=room, author=user, body='@natasha you there?')
+
+		natasha_maybe_reply(room.id, trigger.id)
+
+		reply = GroupMessage.objects.filter(group=room).exclude(author=user).order_by('-id').first()
+		self.assertIsNotNone(reply)
+		self.assertTrue(reply.body.startswith('lol ok'))
+		self.assertEqual(llm_client.metrics_snapshot()['fake:chat']['errors'], 0)
+
+
+class RecentMessageBufferTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='ring_user', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='ring-room')
+
+	def test_buffer_tracks_create_edit_react_delete(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			first = GroupMessage.objects.create(group=self.room, author=self.user, body='one')
+		# First read builds the buffer from the DB; later writes patch it in place.
+		self.assertEqual(recent_messages.latest_message_id(self.room.id), first.id)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			second = GroupMessage.objects.create(group=self.room, author=self.user, body='two')
+			second.body = 'two (edited)'
+			second.edited_at = timezone.now()
+			second.save(update_fields=['body', 'edited_at'])
+			MessageReaction.objects.create(message=second, user=self.user, emoji='🔥')
+			first.delete()
+
+		with self.assertNumQueries(0):
+			records = recent_messages.latest_records(self.room.id, 1)
+			bodies = recent_messages.recent_bodies(self.room.id, author_id=self.user.id, limit=5)
+		self.assertEqual(records[0]['id'], second.id)
+		self.assertTrue(records[0]['edited'])
+		self.assertEqual(records[0]['reactions'], {'🔥': 1})
+		self.assertEqual(bodies, ['two (edited)'])
+
+	def test_bulk_delete_patches_each_room_buffer_once(self):
+		other = ChatGroup.objects.create(group_name='ring-room-2')
+		with self.captureOnCommitCallbacks(execute=True):
+			msgs = [GroupMessage.objects.create(group=room, author=self.user, body=f'm{i}') for i in range(6) for room in (self.room, other)]
+		recent_messages.get_buffer(self.room.id)
+		recent_messages.get_buffer(other.id)
+
+		with mock.patch.object(recent_messages, 'remove', wraps=recent_messages.remove) as remove, \
+			self.captureOnCommitCallbacks(execute=True):
+			GroupMessage.objects.filter(body__in=['m0', 'm1', 'm2']).delete()
+		self.assertEqual(remove.call_count, 2)
+		self.assertEqual(
+			{rid: set(ids) for (rid, ids), _ in remove.call_args_list},
+			{room.id: {m.id for m in msgs if m.group_id == room.id and m.body in ('m0', 'm1', 'm2')} for room in (self.room, other)},
+		)
+		self.assertEqual([r['body'] for r in recent_messages.latest_records(self.room.id, 3)], ['m3', 'm4', 'm5'])
+
+		# Trimming old messages costs one buffer update, not one per row.
+		with mock.patch.object(recent_messages, 'remove') as remove, \
+			self.captureOnCommitCallbacks(execute=True):
+			trim_chat_group_messages(chat_group_id=self.room.id, keep_last=1)
+		remove.assert_called_once()
+
+	def test_poll_with_nothing_new_skips_message_query(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			msg = GroupMessage.objects.create(group=self.room, author=self.user, body='hi')
+		recent_messages.get_buffer(self.room.id)
+
+		self.client.force_login(self.user)
+		url = reverse('chat-poll', args=[self.room.group_name])
+		with CaptureQueriesContext(connection) as ctx:
+			resp = self.client.get(url, {'after': msg.id})
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()['messages_html'], '')
+		self.assertFalse([q for q in ctx.captured_queries if 'a_rtchat_groupmessage' in q['sql']])
+
+
+class ReadStateBufferTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		read_state._dirty.clear()
+		read_state._receipts.clear()
+		self.user = User.objects.create_user(username='reader', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='read-room')
+
+	def test_marks_are_buffered_then_flushed_as_max(self):
+		read_state.get_last_read(self.user.id, self.room.id)
+		with self.assertNumQueries(0):
+			self.assertTrue(read_state.mark_read(self.user.id, self.room.id, 5))
+			self.assertTrue(read_state.mark_read(self.user.id, self.room.id, 9))
+			self.assertFalse(read_state.mark_read(self.user.id, self.room.id, 7))
+			self.assertEqual(read_state.get_last_read(self.user.id, self.room.id), 9)
+		self.assertFalse(ChatReadState.objects.exists())
+
+		self.assertEqual(read_state.flush_read_states(), 1)
+		self.assertEqual(ChatReadState.objects.get(user=self.user, group=self.room).last_read_message_id, 9)
+
+		# A flush never lowers a row another process already advanced.
+		ChatReadState.objects.filter(user=self.user).update(last_read_message_id=20)
+		read_state.mark_read(self.user.id, self.room.id, 12)
+		read_state.flush_read_states()
+		self.assertEqual(ChatReadState.objects.get(user=self.user).last_read_message_id, 20)
+
+	def test_flush_raises_a_row_another_process_inserted_first(self):
+		from django.db.models.query import QuerySet
+
+		ChatReadState.objects.create(user=self.user, group=self.room, last_read_message_id=4)
+		read_state.mark_read(self.user.id, self.room.id, 11)
+		# The pre-read misses the row, as if it was inserted after it: the insert is
+		# skipped as a conflict and the mark must still land.
+		with mock.patch.object(QuerySet, 'only', lambda qs, *fields: qs.none()):
+			self.assertEqual(read_state.flush_read_states(), 1)
+		self.assertEqual(ChatReadState.objects.get(user=self.user).last_read_message_id, 11)
+
+		cache.set(read_state._key(self.user.id, self.room.id), 30)
+		self.assertFalse(read_state._raise_cached(self.user.id, self.room.id, 25))
+		self.assertEqual(read_state.get_last_read(self.user.id, self.room.id), 30)
+
+	def test_receipts_are_coalesced_per_reader(self):
+		with override_settings(CHAT_READ_RECEIPT_WINDOW_SECONDS=60), \
+				mock.patch.object(read_state, '_send_receipt') as send:
+			self.assertTrue(read_state.broadcast_receipt('room-g', self.user.id, 3))
+			self.assertFalse(read_state.broadcast_receipt('room-g', self.user.id, 4))
+			self.assertFalse(read_state.broadcast_receipt('room-g', self.user.id, 6))
+			self.assertEqual(send.call_count, 1)
+
+			read_state.send_due_receipts(now=10 ** 9)
+		self.assertEqual(send.call_count, 2)
+		send.assert_called_with('room-g', self.user.id, 6)
+
+
+class UnreadCountTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		read_state._dirty.clear()
+		self.me = User.objects.create_user(username='unread_me', password='pass12345')
+		self.other = User.objects.create_user(username='unread_other', password='pass12345')
+		self.rooms = [ChatGroup.objects.create(group_name=f'unread-{i}', is_private=True) for i in range(3)]
+		for room in self.rooms:
+			room.members.add(self.me, self.other)
+
+	def _post(self, room, author, body='hi'):
+		with self.captureOnCommitCallbacks(execute=True):
+			return GroupMessage.objects.create(group=room, author=author, body=body)
+
+	def test_counts_seed_in_one_query_then_track_creates_and_reads(self):
+		first = self._post(self.rooms[0], self.other)
+		self._post(self.rooms[0], self.other)
+		self._post(self.rooms[1], self.me)
+		read_state.mark_read(self.me.id, self.rooms[0].id, first.id)
+
+		ids = [r.id for r in self.rooms]
+		# Seeding: one ChatReadState lookup plus one grouped count, for all rooms at once.
+		with self.assertNumQueries(2):
+			counts = unread_counts(self.me.id, ids)
+		self.assertEqual(counts, {ids[0]: 1, ids[1]: 0, ids[2]: 0})
+
+		latest = self._post(self.rooms[2], self.other)
+		self._post(self.rooms[2], self.me)
+		with self.assertNumQueries(0):
+			self.assertEqual(unread_counts(self.me.id, ids), {ids[0]: 1, ids[1]: 0, ids[2]: 1})
+
+		read_state.mark_read(self.me.id, self.rooms[2].id, latest.id + 1)
+		with self.assertNumQueries(0):
+			self.assertEqual(unread_counts(self.me.id, ids)[ids[2]], 0)
+
+
+class RuntimeConfigTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		runtime_config.invalidate()
+		self.addCleanup(runtime_config.invalidate)
+
+	def test_hot_reads_are_process_local(self):
+		self.assertFalse(is_maintenance_enabled())
+		with self.assertNumQueries(0):
+			for _ in range(20):
+				is_maintenance_enabled()
+				runtime_config.announcement_message()
+				runtime_config.beta_feature('new-chat-ui')
+
+		# The process that flips the switch sees it at once.
+		set_maintenance_enabled(True)
+		self.assertTrue(is_maintenance_enabled())
+
+	@override_settings(RUNTIME_CONFIG_VERSION_CHECK_SECONDS=0)
+	def test_saves_bump_the_shared_version(self):
+		self.assertEqual(runtime_config.announcement_message(), '')
+		with self.captureOnCommitCallbacks(execute=True):
+			GlobalAnnouncement.objects.create(message='Scheduled upgrade', is_active=True)
+			BetaFeature.objects.create(slug='new-chat-ui', title='New chat UI', is_enabled=True)
+		self.assertEqual(runtime_config.announcement_message(), 'Scheduled upgrade')
+		self.assertTrue(runtime_config.beta_feature('new-chat-ui')['is_enabled'])
+
+		# Another process bumping the version makes this one reload on its next check.
+		GlobalAnnouncement.objects.update(is_active=False)
+		cache.incr(runtime_config.VERSION_KEY)
+		self.assertEqual(runtime_config.announcement_message(), '')
+
+
+class MentionSearchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.me = User.objects.create_user(username='mention_me', password='pass12345')
+		self.alpha = User.objects.create_user(username='ma_alpha', password='pass12345')
+		self.member = User.objects.create_user(username='mz_member', password='pass12345')
+		self.author = User.objects.create_user(username='my_author', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='mention-room')
+		self.room.members.add(self.member, self.author)
+		GroupMessage.objects.create(group=self.room, author=self.author, body='hello')
+
+	def _names(self, results):
+		return [r['username'] for r in results]
+
+	def test_ranks_recent_authors_then_members(self):
+		self.assertEqual(
+			self._names(search_mention_candidates('ma_', room_id=None)),
+			['ma_alpha'],
+		)
+		recent_messages.invalidate(self.room.id)
+		recent_messages.get_buffer(self.room.id)
+		results = search_mention_candidates('m', room_id=self.room.id)
+		self.assertEqual(self._names(results)[:3], ['my_author', 'mz_member', 'ma_alpha'])
+
+	def test_matches_display_name_prefix(self):
+		self.alpha.profile.displayname = 'Zorro'
+		self.alpha.profile.save()
+		results = search_mention_candidates('zor')
+		self.assertEqual(self._names(results), ['ma_alpha'])
+		self.assertEqual(results[0]['display'], 'Zorro')
+
+	def test_short_prefixes_are_cached(self):
+		first = search_mention_candidates('m', room_id=self.room.id)
+		with self.assertNumQueries(0):
+			self.assertEqual(search_mention_candidates('M', room_id=self.room.id), first)
+
+		self.client.force_login(self.me)
+		resp = self.client.get(reverse('mention-search'), {'q': 'ma', 'room': 'mention-room'})
+		self.assertEqual(resp.status_code, 200)
+		self.assertIn('max-age=', resp['Cache-Control'])
+		self.assertIn('private', resp['Cache-Control'])
+		resp = self.client.get(reverse('mention-search'), {'q': 'ma_alpha'})
+		self.assertEqual(self._names(resp.json()['results']), ['ma_alpha'])
+		self.assertFalse(resp.has_header('Cache-Control') and 'max-age' in resp['Cache-Control'])
+
+	def test_private_room_ranking_requires_membership(self):
+		self.room.is_private = True
+		self.room.save()
+		self.client.force_login(self.me)
+		resp = self.client.get(reverse('mention-search'), {'q': 'm', 'room': 'mention-room'})
+		self.assertEqual(self._names(resp.json()['results'])[:3], ['ma_alpha', 'mention_me', 'my_author'])
+
+
+class ReactionCounterTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.alice = User.objects.create_user(username='react_alice', password='pass12345')
+		self.bob = User.objects.create_user(username='react_bob', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='react-room')
+		self.msg = GroupMessage.objects.create(group=self.room, author=self.alice, body='hi')
+
+	def _toggle(self, user, emoji):
+		self.client.force_login(user)
+		with mock.patch('a_rtchat.views.async_to_sync') as sync:
+			resp = self.client.post(reverse('message-react', args=[self.msg.id]), {'emoji': emoji})
+		self.assertEqual(resp.status_code, 204)
+		return sync.return_value.call_args.args[1]
+
+	def test_toggle_maintains_counts_and_broadcasts_them(self):
+		event = self._toggle(self.alice, '👍')
+		self.assertEqual(event['counts'], {'👍': 1})
+		self.assertEqual((event['actor_id'], event['emoji'], event['added']), (self.alice.id, '👍', '👍'))
+
+		self._toggle(self.bob, '👍')
+		event = self._toggle(self.alice, '❤️')
+		self.assertEqual(event['counts'], {'👍': 1, '❤️': 1})
+		event = self._toggle(self.alice, '❤️')
+		self.assertEqual(event['counts'], {'👍': 1})
+		self.assertIsNone(event['added'])
+
+		self.msg.refresh_from_db()
+		self.assertEqual(self.msg.reaction_counts, {'👍': 1})
+		self.assertEqual(MessageReaction.objects.filter(message=self.msg).count(), 1)
+
+		GroupMessage.objects.filter(pk=self.msg.pk).update(reaction_counts={'😂': 5})
+		recount([self.msg.id])
+		self.msg.refresh_from_db()
+		self.assertEqual(self.msg.reaction_counts, {'👍': 1})
+
+	def test_deletes_outside_toggle_lower_the_counts(self):
+		carol = User.objects.create_user(username='react_carol', password='pass12345')
+		for user in (self.alice, self.bob, carol):
+			self._toggle(user, '👍')
+		self._toggle(self.bob, '❤️')
+		self.msg.refresh_from_db()
+		self.assertEqual(self.msg.reaction_counts, {'👍': 2, '❤️': 1})
+
+		# Account deletion cascades to the user's reactions.
+		with self.captureOnCommitCallbacks(execute=True):
+			self.bob.delete()
+		self.msg.refresh_from_db()
+		self.assertEqual(self.msg.reaction_counts, {'👍': 2})
+
+		with self.captureOnCommitCallbacks(execute=True):
+			MessageReaction.objects.filter(message=self.msg).delete()
+		self.msg.refresh_from_db()
+		self.assertEqual(self.msg.reaction_counts, {})
+
+	def test_handler_renders_from_event_without_queries(self):
+		consumer = ChatroomConsumer()
+		consumer.user = self.bob
+		consumer.chatroom = self.room
+		consumer.send = mock.Mock()
+		event = {'message_id': self.msg.id, 'counts': {'👍': 2}, 'actor_id': self.bob.id, 'emoji': '👍', 'added': '👍'}
+		with self.assertNumQueries(0):
+			consumer.reactions_handler(event)
+		payload = json.loads(consumer.send.call_args.kwargs['text_data'])
+		self.assertEqual(payload['counts'], {'👍': 2})
+		self.assertIn('data-reacted="1"', payload['html'])
+
+		consumer.user = self.alice
+		consumer.reactions_handler(event)
+		payload = json.loads(consumer.send.call_args.kwargs['text_data'])
+		self.assertNotIn('data-reacted', payload['html'])
+
+
+class UserFlagsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.staff = User.objects.create_user(username='flags_staff', password='pass12345', is_staff=True)
+		self.user = User.objects.create_user(username='flags_user', password='pass12345')
+
+	def test_handlers_read_the_snapshot_and_events_replace_it(self):
+		consumer = NotificationsConsumer()
+		consumer.user = self.user
+		consumer.send = mock.Mock()
+		consumer.flags = user_flags.load_flags(self.user)
+		self.assertFalse(consumer._flag('dnd'))
+
+		consumer.profile_flags_changed({'flags': dict(consumer.flags, dnd=True)})
+		event = {'from_username': 'someone', 'chatroom_name': 'public-chat', 'message_id': 1}
+		with self.assertNumQueries(0):
+			consumer.mention_notify_handler(event)
+			consumer.call_invite_notify_handler(event)
+		consumer.send.assert_not_called()
+
+		consumer.profile_flags_changed({'flags': dict(consumer.flags, dnd=False)})
+		consumer.mention_notify_handler(event)
+		self.assertEqual(consumer.send.call_count, 1)
+
+	def test_admin_block_toggle_pushes_fresh_flags(self):
+		layer = get_channel_layer()
+		channel = async_to_sync(layer.new_channel)()
+		async_to_sync(layer.group_add)(user_flags.group_name(self.user.id), channel)
+
+		self.client.force_login(self.staff)
+		url = reverse('admin-user-toggle-block', kwargs={'user_id': self.user.id})
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post(url)
+
+		event = async_to_sync(layer.receive)(channel)
+		self.assertEqual(event['type'], 'profile_flags_changed')
+		self.assertTrue(event['flags']['chat_blocked'])
+		self.assertFalse(event['flags']['staff'])
+
+	def test_any_profile_save_pushes_flags_but_unrelated_updates_do_not(self):
+		layer = get_channel_layer()
+		channel = async_to_sync(layer.new_channel)()
+		async_to_sync(layer.group_add)(user_flags.group_name(self.user.id), channel)
+		profile = self.user.profile
+
+		# What the admin change form does: a plain full save.
+		profile.is_dnd = True
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			profile.save()
+		self.assertTrue(callbacks)
+		event = async_to_sync(layer.receive)(channel)
+		self.assertTrue(event['flags']['dnd'])
+
+		with mock.patch.object(user_flags, 'notify_flags_changed') as notify:
+			profile.save(update_fields=['info'])
+		notify.assert_not_called()
+
+	def test_presence_block_notice_respects_dnd_without_queries(self):
+		consumer = ProfilePresenceConsumer()
+		consumer.user = self.user
+		consumer.send = mock.Mock()
+		consumer.flags = dict(user_flags.load_flags(self.user), dnd=True)
+		with self.assertNumQueries(0):
+			consumer.chat_block_status_notify_handler({'blocked': True})
+		consumer.send.assert_not_called()
+
+
+class MediaPipelineTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='media_user', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='media-room')
+
+	def _photo(self, size=(2400, 1200)):
+		from PIL import Image
+
+		exif = Image.Exif()
+		exif[0x010F] = 'LeakyCam'
+		exif[0x0112] = 6  # rotated 90 degrees
+		buf = io.BytesIO()
+		Image.new('RGB', size, (200, 30, 30)).save(buf, format='JPEG', exif=exif.tobytes())
+		return buf.getvalue()
+
+	def test_analyze_image_orients_downsizes_and_strips_metadata(self):
+		from PIL import Image
+
+		info = media_pipeline.analyze_image(self._photo())
+		self.assertEqual((info['width'], info['height'], info['mime']), (1200, 2400, 'image/jpeg'))
+
+		display = Image.open(io.BytesIO(info['display']))
+		self.assertEqual(display.format, 'WEBP')
+		self.assertEqual(max(display.size), media_pipeline.display_max_px())
+		self.assertEqual(len(display.getexif()), 0)
+		thumb = Image.open(io.BytesIO(info['thumb']))
+		self.assertEqual(thumb.size[0], media_pipeline.thumb_max_px())
+
+		self.assertIsNone(media_pipeline.analyze_image(b'not an image'))
+
+	def test_strip_metadata_keeps_pixels_and_orientation_only(self):
+		from PIL import Image, PngImagePlugin
+
+		exif = Image.Exif()
+		exif[0x010F] = 'LeakyCam'
+		exif[0x0112] = 6
+		exif.get_ifd(0x8825)[2] = (51.0, 30.0, 0.0)  # GPS latitude
+		img = Image.new('RGB', (40, 20), (10, 120, 200))
+		png_info = PngImagePlugin.PngInfo()
+		png_info.add_text('Comment', 'home address')
+		sources = {}
+		for fmt, extra in (('JPEG', {}), ('PNG', {'pnginfo': png_info}), ('WEBP', {'xmp': b'<x:xmpmeta>secret</x:xmpmeta>'})):
+			buf = io.BytesIO()
+			img.save(buf, format=fmt, exif=exif.tobytes(), **extra)
+			sources[fmt] = buf.getvalue()
+
+		for fmt, data in sources.items():
+			cleaned = media_pipeline.strip_metadata(data)
+			self.assertNotIn(b'LeakyCam', cleaned, fmt)
+			self.assertNotIn(b'home address', cleaned, fmt)
+			self.assertNotIn(b'secret', cleaned, fmt)
+			out = Image.open(io.BytesIO(cleaned))
+			self.assertEqual(out.format, fmt)
+			self.assertEqual(dict(out.getexif()), {0x0112: 6}, fmt)
+			self.assertEqual(out.convert('RGB').tobytes(), Image.open(io.BytesIO(data)).convert('RGB').tobytes(), fmt)
+
+		self.assertIsNone(media_pipeline.strip_metadata(b'%PDF-1.4'))
+		self.assertIsNone(media_pipeline.strip_metadata(b'\xff\xd8\xff\xe1'))
+
+	def test_process_message_records_variants_and_refreshes_the_bubble(self):
+		msg = GroupMessage.objects.create(group=self.room, author=self.user, file='files/photo.jpg')
+		layer = get_channel_layer()
+		channel = async_to_sync(layer.new_channel)()
+		async_to_sync(layer.group_add)(f'chatroom.{self.room.id}', channel)
+
+		storage = GroupMessage._meta.get_field('file_display').storage
+		with mock.patch.object(media_pipeline, '_read', return_value=self._photo()), \
+			mock.patch.object(storage, 'save', side_effect=lambda name, content: name) as save:
+			self.assertTrue(media_pipeline.process_message(msg.id))
+			# Claimed: the Celery copy of the job is a no-op.
+			self.assertFalse(media_pipeline.process_message(msg.id))
+		self.assertEqual(save.call_count, 2)
+
+		msg.refresh_from_db()
+		self.assertEqual((msg.media_width, msg.media_height, msg.media_mime), (1200, 2400, 'image/jpeg'))
+		self.assertTrue(msg.file_display.name.endswith('photo_display.webp'))
+		self.assertTrue(msg.file_thumb.name.endswith('photo_thumb.webp'))
+		self.assertEqual(msg.display_width, 800)
+		self.assertEqual(msg.thumb_width, media_pipeline.thumb_max_px())
+
+		event = async_to_sync(layer.receive)(channel)
+		self.assertEqual(event, {'type': 'message_update_handler', 'message_id': msg.id})
+
+	def test_upload_schedules_processing_after_commit(self):
+		self.room = ChatGroup.objects.create(group_name='media-code-room', is_private=True, is_code_room=True, admin=self.user)
+		self.room.members.add(self.user)
+		self.client.force_login(self.user)
+		upload = SimpleUploadedFile('pic.jpg', self._photo((64, 64)), content_type='image/jpeg')
+		with mock.patch('a_rtchat.views.async_to_sync'), \
+			mock.patch.object(media_pipeline, 'get_runtime') as runtime, \
+			mock.patch.object(GroupMessage._meta.get_field('file').storage, 'save', side_effect=lambda name, content, **kw: name) as save, \
+			self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('chat-file-upload', args=[self.room.group_name]), {'file': upload})
+		msg = GroupMessage.objects.get(group=self.room)
+		runtime.return_value.submit.assert_called_once_with(media_pipeline.process_message, msg.id)
+		self.assertEqual((msg.media_kind, msg.media_mime, msg.media_width, msg.media_height), ('image', 'image/jpeg', 64, 64))
+		# The stored original has no camera metadata left.
+		stored = save.call_args[0][1]
+		stored.seek(0)
+		self.assertNotIn(b'LeakyCam', stored.read())
+
+	def test_schedule_uses_celery_instead_of_the_local_pool_when_configured(self):
+		with mock.patch('a_rtchat.views._celery_broker_configured', return_value=True), \
+			mock.patch('a_rtchat.tasks.process_media_task') as task, \
+			mock.patch.object(media_pipeline, 'get_runtime') as runtime, \
+			self.captureOnCommitCallbacks(execute=True):
+			media_pipeline.schedule('message', 7)
+		task.delay.assert_called_once_with('message', 7)
+		runtime.return_value.submit.assert_not_called()
+
+	def test_failed_processing_releases_the_claim(self):
+		msg = GroupMessage.objects.create(group=self.room, author=self.user, file='files/photo.jpg')
+		with mock.patch.object(media_pipeline, '_read', side_effect=OSError('storage down')):
+			with self.assertRaises(OSError):
+				media_pipeline.process_message(msg.id)
+		storage = GroupMessage._meta.get_field('file_display').storage
+		with mock.patch.object(media_pipeline, '_read', return_value=self._photo()), \
+			mock.patch.object(storage, 'save', side_effect=lambda name, content: name):
+			self.assertTrue(media_pipeline.process_message(msg.id))
+
+
+class MediaMetadataTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='meta_user', password='pass12345')
+		self.room = ChatGroup.objects.create(group_name='meta-room')
+
+	def _box(self, kind, payload):
+		import struct
+
+		return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+	def _mp4(self, seconds=12.5, size=(1280, 720), rotated=False):
+		import struct
+
+		mvhd = self._box(b'mvhd', struct.pack('>4xIIII', 0, 0, 1000, int(seconds * 1000)) + bytes(80))
+		a, b = (0, 1 << 16) if rotated else (1 << 16, 0)
+		matrix = struct.pack('>9i', a, b, 0, -b, a, 0, 0, 0, 1 << 30)
+		tkhd = self._box(b'tkhd', bytes(4 + 20 + 16) + matrix + struct.pack('>II', size[0] << 16, size[1] << 16))
+		moov = self._box(b'moov', mvhd + self._box(b'trak', tkhd))
+		return self._box(b'ftyp', b'isom' + bytes(4)) + self._box(b'mdat', bytes(64)) + moov
+
+	def _jpeg(self):
+		from PIL import Image
+
+		buf = io.BytesIO()
+		Image.new('RGB', (30, 20)).save(buf, format='JPEG')
+		return buf.getvalue()
+
+	def test_probe_reads_video_headers(self):
+		info = media_pipeline.probe(io.BytesIO(self._mp4()), 'clip.mp4')
+		self.assertEqual(
+			(info['kind'], info['mime'], info['width'], info['height'], info['duration']),
+			('video', 'video/mp4', 1280, 720, 12.5),
+		)
+		info = media_pipeline.probe(io.BytesIO(self._mp4(rotated=True)), 'clip.mov')
+		self.assertEqual((info['mime'], info['width'], info['height']), ('video/quicktime', 720, 1280))
+
+		info = media_pipeline.probe(io.BytesIO(b'%PDF-1.4'), 'notes.pdf')
+		self.assertEqual((info['kind'], info['mime'], info['size']), ('file', 'application/pdf', 8))
+
+	def test_kind_checks_never_open_the_stored_file(self):
+		probed = GroupMessage.objects.create(group=self.room, author=self.user, file='files/a.bin', media_kind='image')
+		legacy = GroupMessage.objects.create(group=self.room, author=self.user, file='files/b.mov')
+		storage = GroupMessage._meta.get_field('file').storage
+		with mock.patch.object(storage, 'open', side_effect=AssertionError('storage read')):
+			self.assertTrue(probed.is_image)
+			self.assertFalse(probed.is_video)
+			self.assertTrue(legacy.is_video)
+			self.assertEqual(legacy.video_mime_type, 'video/quicktime')
+
+	def test_backfill_probes_unprocessed_rows(self):
+		files = {'files/p.jpg': self._jpeg(), 'files/v.mp4': self._mp4(seconds=3)}
+		photo = GroupMessage.objects.create(group=self.room, author=self.user, file='files/p.jpg')
+		video = GroupMessage.objects.create(group=self.room, author=self.user, file='files/v.mp4')
+		missing = GroupMessage.objects.create(group=self.room, author=self.user, file='files/gone.jpg')
+		GroupMessage.objects.create(group=self.room, author=self.user, body='text only')
+
+		def _open(name, mode='rb'):
+			if name not in files:
+				raise FileNotFoundError(name)
+			return io.BytesIO(files[name])
+
+		storage = GroupMessage._meta.get_field('file').storage
+		with mock.patch.object(storage, 'open', side_effect=_open):
+			result = media_pipeline.backfill_metadata(batch_size=1, workers=2)
+		self.assertEqual(result, {'updated': 2, 'failed': 1})
+
+		photo.refresh_from_db()
+		video.refresh_from_db()
+		missing.refresh_from_db()
+		self.assertEqual((photo.media_kind, photo.media_width, photo.media_height), ('image', 30, 20))
+		self.assertEqual((video.media_kind, video.media_duration, video.media_size), ('video', 3.0, len(files['files/v.mp4'])))
+		self.assertEqual(missing.media_kind, '')
+
+
+class WebSocketMetricsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		ws_metrics.reset()
+		self.user = User.objects.create_user(username='wsm_user', password='pass12345')
+
+	def test_dispatch_records_time_queries_cache_and_bytes_per_event(self):
+		consumer = NotificationsConsumer()
+		consumer.user = self.user
+		consumer.flags = user_flags.load_flags(self.user)
+		consumer.base_send = mock.Mock()
+		event = {'type': 'mention_notify_handler', 'from_username': 'someone', 'chatroom_name': 'public-chat', 'message_id': 1}
+		async_to_sync(consumer.dispatch)(event)
+		async_to_sync(consumer.dispatch)(event)
+
+		sent = len(consumer.base_send.call_args.args[0]['text'].encode('utf-8'))
+		stats = ws_metrics.snapshot()['NotificationsConsumer.mention_notify_handler']
+		self.assertEqual(stats['count'], 2)
+		self.assertEqual(stats['sent_bytes']['avg'], sent)
+		self.assertEqual(stats['queries']['avg'], 0)
+
+		with ws_metrics.measure('Probe', 'work'):
+			User.objects.count()
+			cache.get_many(['a', 'b'])
+			cache.set('a', 1)
+		stats = ws_metrics.snapshot()['Probe.work']
+		self.assertEqual((stats['queries']['avg'], stats['cache_ops']['avg']), (1, 2))
+
+		self.assertEqual(ws_metrics.event_label({'type': 'websocket.receive', 'text': '{"type": "Typing", "x": 1}'}), 'receive.typing')
+		self.assertEqual(ws_metrics.event_label({'type': 'websocket.receive', 'text': '{"body": "hi"}'}), 'receive')
+
+	def test_metrics_endpoint_is_staff_only_prometheus_text(self):
+		with ws_metrics.measure('ChatroomConsumer', 'message_handler'):
+			pass
+		url = reverse('admin-ws-metrics')
+
+		self.client.force_login(self.user)
+		self.assertEqual(self.client.get(url).status_code, 404)
+
+		staff = User.objects.create_user(username='wsm_staff', password='pass12345', is_staff=True)
+		self.client.force_login(staff)
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp['Content-Type'].startswith('text/plain; version=0.0.4'))
+		body = resp.content.decode()
+		self.assertIn('# TYPE vixo_ws_event_duration_seconds histogram', body)
+		self.assertIn('vixo_ws_event_queries_bucket{consumer="ChatroomConsumer",event="message_handler",le="0"} 1', body)
+		self.assertIn('vixo_ws_event_duration_seconds_count{consumer="ChatroomConsumer",event="message_handler"} 1', body)
+
+
+class WebSocketBenchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		ws_metrics.reset()
+
+	def test_chat_send_counts_every_delivery(self):
+		users = ws_bench.bench_users(2, prefix='wsb_chat')
+		result = async_to_sync(ws_bench.chat_send)(users, messages=1, rate=0, timeout=10)
+
+		self.assertTrue(result['complete'])
+		self.assertEqual((result['messages'], result['deliveries']), (2, 4))
+		self.assertEqual(result['echo_ms']['count'], 2)
+		self.assertEqual(result['events']['ChatroomConsumer.receive']['count'], 2)
+
+	def test_history_paging_follows_oldest_id(self):
+		reader = ws_bench.bench_users(1, prefix='wsb_reader')[0]
+		result = ws_bench.history_paging(reader, seed_messages=40, pages=5)
+
+		self.assertGreaterEqual(result['pages'], 1)
+		self.assertGreater(result['queries_per_page']['avg'], 0)
+		self.assertGreater(result['bytes_per_page']['max'], 0)
+
+
+class QueryBudgetTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_repeated_shapes_fail_the_budget(self):
+		self.assertEqual(
+			sql_shape('SELECT * FROM "t" WHERE "t"."id" IN (%s, %s, %s) AND "t"."name" = \'x\' LIMIT 21'),
+			'SELECT * FROM "t" WHERE "t"."id" IN (...) AND "t"."name" = ? LIMIT ?',
+		)
+		users = [User.objects.create(username=f'qbt{i}') for i in range(5)]
+
+		with query_budget(10):
+			list(User.objects.filter(id__in=[u.id for u in users]))
+
+		with self.assertRaisesMessage(QueryBudgetExceeded, 'N+1: 5x'):
+			with query_budget(10, repeat_limit=3):
+				for u in users:
+					User.objects.get(pk=u.pk)
+
+		@query_budget(1)
+		def two_queries():
+			User.objects.count()
+			User.objects.exists()
+
+		with self.assertRaisesMessage(QueryBudgetExceeded, '2 queries, budget is 1'):
+			two_queries()
+
+	def test_hot_views_stay_within_budget_as_data_grows(self):
+		small = budget_fixtures.measure_views(budget_fixtures.seed(members=3, messages=20, prefix='qbs'))
+		large = budget_fixtures.measure_views(budget_fixtures.seed(members=30, messages=150, prefix='qbl'))
+
+		for name, row in large.items():
+			with self.subTest(view=name):
+				self.assertEqual(row['status'], 200)
+				self.assertEqual(row['queries'], small[name]['queries'])
+				self.assertLessEqual(row['queries'], row['budget'])
+				self.assertEqual(row['repeated'], [])
+
+
+@override_settings(GIPHY_API_KEY='test-gif-key')
+class GifSearchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='gif_user', password='pass12345')
+		self.client.force_login(self.user)
+
+	def _giphy_response(self, count=2, total=100):
+		resp = mock.Mock()
+		resp.raise_for_status.return_value = None
+		resp.json.return_value = {
+			'data': [
+				{
+					'id': f'g{i}',
+					'title': f'gif {i}',
+					'images': {
+						'fixed_width': {'url': f'https://media1.giphy.com/media/g{i}/200w.gif?cid=x', 'width': '200', 'height': '150'},
+						'fixed_width_small': {'url': f'https://media1.giphy.com/media/g{i}/100w.gif'},
+					},
+				}
+				for i in range(count)
+			],
+			'pagination': {'total_count': total},
+		}
+		return resp
+
+	def test_results_are_compact_and_cached_per_query_and_offset(self):
+		session = mock.Mock()
+		session.get.return_value = self._giphy_response()
+		with mock.patch.object(gifs, 'get_session', return_value=session):
+			first = self.client.get(reverse('gif-search'), {'q': '  Happy   Cat ', 'offset': 7}).json()
+			again = self.client.get(reverse('gif-search'), {'q': 'happy cat', 'offset': 0}).json()
+
+		self.assertEqual(session.get.call_count, 1)
+		self.assertEqual(session.get.call_args.kwargs['params']['q'], 'happy cat')
+		self.assertEqual(first, again)
+		self.assertEqual((first['offset'], first['next_offset']), (0, 30))
+		self.assertEqual(first['results'][0], {
+			'id': 'g0',
+			'title': 'gif 0',
+			'url': 'https://media1.giphy.com/media/g0/200w.gif?cid=x',
+			'mp4': 'https://media1.giphy.com/media/g0/200w.mp4?cid=x',
+			'still': 'https://media1.giphy.com/media/g0/200w_s.gif?cid=x',
+			'thumb': 'https://media1.giphy.com/media/g0/100w.gif',
+			'width': 200,
+			'height': 150,
+		})
+
+	@override_settings(GIF_SEARCH_RATE_LIMIT=2, GIF_SEARCH_RATE_PERIOD=60)
+	def test_rate_limit_and_upstream_errors(self):
+		session = mock.Mock()
+		session.get.side_effect = gifs.requests.ConnectionError('down')
+		with mock.patch.object(gifs, 'get_session', return_value=session):
+			self.assertEqual(self.client.get(reverse('gif-search'), {'q': 'x'}).status_code, 502)
+			self.client.get(reverse('gif-search'), {'q': 'y'})
+			resp = self.client.get(reverse('gif-search'), {'q': 'z'})
+		self.assertEqual(resp.status_code, 429)
+		self.assertIn('Retry-After', resp.headers)
+
+	def test_upstream_errors_never_carry_the_api_key(self):
+		failed = mock.Mock(status_code=403)
+		url = 'https://api.giphy.com/v1/gifs/search?api_key=test-gif-key&q=x'
+		session = mock.Mock()
+		session.get.side_effect = gifs.requests.HTTPError(f'403 Client Error: Forbidden for url: {url}', response=failed)
+		with mock.patch.object(gifs, 'get_session', return_value=session):
+			with self.assertRaises(gifs.GifSearchError) as ctx:
+				gifs.search('x')
+		self.assertEqual(str(ctx.exception), 'giphy search: HTTP 403')
+		self.assertIsNone(ctx.exception.__cause__)
+
+		with override_settings(GIPHY_API_KEY=''), self.assertRaises(gifs.GifSearchError):
+			gifs.search('y')
+
+	def test_trending_refreshes_ahead_of_expiry(self):
+		session = mock.Mock()
+		session.get.return_value = self._giphy_response()
+		runtime = mock.Mock()
+		with mock.patch.object(gifs, 'get_session', return_value=session), mock.patch.object(gifs, 'get_runtime', return_value=runtime):
+			gifs.search('')
+			runtime.submit.assert_called_once_with(gifs._refresh_trending, 30)
+
+			runtime.submit.reset_mock()
+			cache.delete('gifs:trending:refresh:0')
+			with mock.patch.object(gifs.time, 'time', return_value=time.time() + 290):
+				self.assertTrue(gifs.search('')['cached'])
+			runtime.submit.assert_called_once_with(gifs._refresh_trending, 0)
+		self.assertEqual(session.get.call_count, 1)
+
+	def test_chat_config_does_not_expose_the_api_key(self):
+		data = self.client.get(reverse('chat-config', args=['public-chat'])).json()
+		self.assertEqual(data['gifSearchUrl'], reverse('gif-search'))
+		self.assertNotIn('giphyApiKey', data)
+		self.assertNotIn('test-gif-key', json.dumps(data))
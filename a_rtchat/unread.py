@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+
+# Per-(user, room) unread counters for sidebar badges.
+#
+# Each room keeps a message sequence number in the cache (bumped on every new message)
+# and its newest message id. Each member keeps the sequence number they had caught up
+# to, so a room's unread count is `seq - seen`. Counters are seeded lazily: any room a
+# reader finds without keys is computed from ChatReadState (via a_rtchat.read_state) and
+# the messages table in one grouped query for all such rooms, then cached.
+#
+# Deleted messages are not subtracted; a count can stay one high until the reader next
+# catches up with the room. Badges are a hint, not an audit.
+
+
+def _ttl() -> int:
+    try:
+        return max(60, int(getattr(settings, 'CHAT_UNREAD_TTL', 7 * 24 * 60 * 60)))
+    except Exception:
+        return 7 * 24 * 60 * 60
+
+
+def _seq_key(room_id: int) -> str:
+    return f"chat:unread:{int(room_id)}:seq"
+
+
+def _latest_key(room_id: int) -> str:
+    return f"chat:unread:{int(room_id)}:latest"
+
+
+def _seen_key(user_id: int, room_id: int) -> str:
+    return f"chat:unread:{int(room_id)}:{int(user_id)}:seen"
+
+
+def note_message_created(room_id: int, message_id: int, author_id: int | None) -> None:
+    """Count a new message in its room. Rooms without a counter are left for readers to seed."""
+    if not room_id or not message_id:
+        return
+    try:
+        latest = cache.get(_latest_key(room_id))
+        if latest is None or int(message_id) > int(latest):
+            cache.set(_latest_key(room_id), int(message_id), timeout=_ttl())
+    except Exception:
+        pass
+    try:
+        cache.incr(_seq_key(room_id))
+    except ValueError:
+        return
+    except Exception:
+        return
+    # The author's own message is never unread for them.
+    if author_id:
+        try:
+            cache.incr(_seen_key(author_id, room_id))
+        except Exception:
+            pass
+
+
+def note_read(user_id: int, room_id: int, message_id: int) -> None:
+    """The user read up to message_id: zero their count if that's the newest message."""
+    try:
+        got = cache.get_many([_seq_key(room_id), _latest_key(room_id)])
+    except Exception:
+        got = {}
+    seq = got.get(_seq_key(room_id))
+    latest = got.get(_latest_key(room_id))
+    try:
+        if seq is not None and latest is not None and int(message_id) >= int(latest):
+            cache.set(_seen_key(user_id, room_id), int(seq), timeout=_ttl())
+        else:
+            # Partly read (or counters cold): recount on the next badge read.
+            cache.delete(_seen_key(user_id, room_id))
+    except Exception:
+        pass
+
+
+def _seed(user_id: int, room_ids: list[int], known_seqs: dict[int, int]) -> dict[int, int]:
+    from .models import GroupMessage
+    from .read_state import get_many_last_read
+
+    last_read = get_many_last_read(user_id, room_ids)
+    unread_q = Q()
+    for rid in room_ids:
+        unread_q |= Q(group_id=rid, id__gt=int(last_read.get(rid) or 0))
+    rows = {
+        row['group_id']: row
+        for row in (
+            GroupMessage.objects.filter(group_id__in=room_ids)
+            .values('group_id')
+            .annotate(
+                total=Count('id'),
+                unread=Count('id', filter=unread_q & ~Q(author_id=user_id)),
+                latest=Max('id'),
+            )
+            .order_by()
+        )
+    }
+
+    out = {}
+    to_set = {}
+    for rid in room_ids:
+        row = rows.get(rid) or {'total': 0, 'unread': 0, 'latest': None}
+        unread = int(row['unread'] or 0)
+        seq = known_seqs.get(rid)
+        if seq is None:
+            seq = int(row['total'] or 0)
+            try:
+                if not cache.add(_seq_key(rid), seq, timeout=_ttl()):
+                    seq = int(cache.get(_seq_key(rid)) or seq)
+            except Exception:
+                pass
+            if row['latest']:
+                try:
+                    cache.add(_latest_key(rid), int(row['latest']), timeout=_ttl())
+                except Exception:
+                    pass
+        to_set[_seen_key(user_id, rid)] = max(0, int(seq) - unread)
+        out[rid] = unread
+    try:
+        cache.set_many(to_set, timeout=_ttl())
+    except Exception:
+        pass
+    return out
+
+
+def unread_counts(user_id: int, room_ids) -> dict[int, int]:
+    """Unread message counts for the user's rooms: {room_id: count}.
+
+    One cache round-trip when warm; rooms that need seeding cost one grouped query
+    (plus one ChatReadState lookup) between them, however many there are.
+    """
+    room_ids = [int(r) for r in room_ids if r]
+    if not user_id or not room_ids:
+        return {}
+    keys = []
+    for rid in room_ids:
+        keys.append(_seq_key(rid))
+        keys.append(_seen_key(user_id, rid))
+    try:
+        got = cache.get_many(keys)
+    except Exception:
+        got = {}
+
+    out = {}
+    missing = []
+    known_seqs = {}
+    for rid in room_ids:
+        seq = got.get(_seq_key(rid))
+        seen = got.get(_seen_key(user_id, rid))
+        if seq is not None:
+            known_seqs[rid] = int(seq)
+        if seq is not None and seen is not None:
+            out[rid] = max(0, int(seq) - int(seen))
+        else:
+            missing.append(rid)
+    if missing:
+        try:
+            out.update(_seed(user_id, missing, known_seqs))
+        except Exception:
+            for rid in missing:
+                out.setdefault(rid, 0)
+    return out
+
+
+def attach_unread_counts(user, rooms, *, exclude_room_id: int | None = None) -> list:
+    """Set `room.unread_count` on each room for templates; returns the rooms as a list."""
+    rooms = list(rooms)
+    user_id = int(getattr(user, 'id', 0) or 0)
+    counts = unread_counts(user_id, [r.id for r in rooms if r.id != exclude_room_id]) if user_id else {}
+    for room in rooms:
+        room.unread_count = int(counts.get(room.id) or 0)
+    return rooms
@@ -10,6 +10,7 @@ urlpatterns = [
     path('chat/poll/<chatroom_name>', chat_poll_view, name="chat-poll"),
     path('chat/older/<chatroom_name>', chat_older_view, name="chat-older"),
     path('chat/mentions/', mention_user_search, name='mention-search'),
+    path('chat/gifs/', gif_search_view, name='gif-search'),
     path('chat/push/register/', push_register, name='push-register'),
     path('chat/push/config/', push_config, name='push-config'),
     path('chat/push/unregister/', push_unregister, name='push-unregister'),
@@ -52,4 +53,5 @@ urlpatterns = [
 
     path('chat/admin/analytics/', admin_analytics_view, name='admin-analytics'),
     path('chat/admin/analytics/live/', admin_analytics_live_view, name='admin-analytics-live'),
+    path('chat/admin/metrics/ws/', admin_ws_metrics_view, name='admin-ws-metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from django.db import transaction
+
+
+# Per-connection snapshot of the connected user's own flags.
+#
+# Consumers load the flags once at connect (one query) and join the user's flags
+# group. Every Profile save that can touch a flag (views, admin, shell) calls
+# notify_flags_changed() from a post_save receiver in a_users.signals, which sends the
+# fresh values in a `profile_flags_changed` event, so per-event checks (DND on
+# call/mention delivery, chat_blocked on every frame) are attribute reads. Queryset
+# .update() calls skip signals and must notify themselves.
+
+# Profile fields the snapshot is built from.
+FLAG_FIELDS = ('is_dnd', 'is_stealth', 'chat_blocked', 'is_founder_club')
+
+
+def group_name(user_id: int) -> str:
+    return f"user_flags_{int(user_id)}"
+
+
+def load_flags(user) -> dict:
+    from a_users.models import Profile
+
+    row = (
+        Profile.objects.filter(user_id=getattr(user, 'id', None))
+        .values(*FLAG_FIELDS)
+        .first()
+    ) or {}
+    return {
+        'dnd': bool(row.get('is_dnd')),
+        'stealth': bool(row.get('is_stealth')),
+        'chat_blocked': bool(row.get('chat_blocked')),
+        'staff': bool(getattr(user, 'is_staff', False)),
+        'founder': bool(row.get('is_founder_club')),
+    }
+
+
+def _send(user_ids) -> None:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from django.contrib.auth import get_user_model
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for user in get_user_model().objects.filter(id__in=list(user_ids)).only('id', 'is_staff'):
+        try:
+            async_to_sync(channel_layer.group_send)(
+                group_name(user.id),
+                {'type': 'profile_flags_changed', 'flags': load_flags(user)},
+            )
+        except Exception:
+            continue
+
+
+def notify_flags_changed(*user_ids: int) -> None:
+    """Push the users' current flags to their open sockets once the transaction commits."""
+    ids = {int(u) for u in user_ids if u}
+    if not ids:
+        return
+
+    def _run():
+        try:
+            _send(ids)
+        except Exception:
+            pass
+
+    transaction.on_commit(_run)
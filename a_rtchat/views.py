@@ -1,4 +1,3 @@
-import csv
 import json
 from datetime import timedelta
 from urllib.parse import urlparse
@@ -9,7 +8,7 @@ from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
 from django.http import JsonResponse
 from django.utils import timezone
 from django.contrib import messages
@@ -20,8 +19,8 @@ from django.conf import settings
 from django.urls import reverse
 from django.db import transaction
 from django.db.models import Q
-from django.db.models import Count
-from django.db.models.functions import TruncDate, TruncHour
+from django.db.models import Count, F, Sum
+from django.utils.cache import patch_cache_control
 from django.utils.http import url_has_allowed_host_and_scheme
 from a_users.badges import get_verified_user_ids
 from a_users.models import Profile
@@ -34,8 +33,11 @@ from .forms import *
 from .agora import build_rtc_token
 from .moderation import moderate_message
 from .channels_utils import chatroom_channel_group_name
-from .mentions import extract_mention_usernames, resolve_mentioned_users
+from .mentions import extract_mention_usernames, is_cacheable_prefix, resolve_mentioned_users, search_cache_seconds, search_mention_candidates
+from .reactions import reaction_pills, toggle_reaction
+from .media_pipeline import probe_upload, sanitize_upload, schedule as schedule_media
 from a_rtchat.link_policy import contains_link
+from a_users.avatars import avatar_urls
 from .room_policy import room_allows_links, room_allows_uploads, is_free_promotion_room
 from .challenges import (
     get_active_challenge,
@@ -43,9 +45,16 @@ from .challenges import (
     end_if_expired as challenge_end_if_expired,
     end_challenge as challenge_end,
     challenge_public_state,
+    announce_challenge_end,
+    live_meta as challenge_live_meta,
     get_win_loss_totals,
 )
 from .auto_badges import attach_auto_badges
+from .analytics import daily_totals, window_totals
+from .exports import astream_users_csv, parse_export_columns
+from . import gifs, read_state, recent_messages, ws_metrics
+from .unread import attach_unread_counts
+from .live_metrics import get_snapshot as get_live_metrics_snapshot, public_payload as live_metrics_payload
 from .natasha_bot import trigger_natasha_reply_after_commit, NATASHA_USERNAME
 
 
@@ -201,35 +210,25 @@ def _uploads_used_today(chat_group, user) -> int:
 
 
 def _attach_reaction_pills(messages, user):
-    """Attach `reaction_pills` attribute to each message for template rendering."""
+    """Attach `reaction_pills` attribute to each message for template rendering.
+
+    Counts are read from GroupMessage.reaction_counts; the only query is the viewer's
+    own reactions, limited to messages that have any.
+    """
     if not messages:
         return
-    message_ids = [m.id for m in messages if getattr(m, 'id', None)]
-    if not message_ids:
-        return
+    message_ids = [m.id for m in messages if getattr(m, 'id', None) and getattr(m, 'reaction_counts', None)]
 
-    counts = {}
-    for row in (
-        MessageReaction.objects.filter(message_id__in=message_ids, emoji__in=CHAT_REACTION_EMOJIS)
-        .values('message_id', 'emoji')
-        # Enforce counts as "number of users" per emoji; this also protects against any legacy
-        # duplicate reactions where a user may have reacted with multiple emojis.
-        .annotate(count=Count('user_id', distinct=True))
-    ):
-        counts[(row['message_id'], row['emoji'])] = int(row['count'] or 0)
-
-    reacted = set(
-        MessageReaction.objects.filter(message_id__in=message_ids, user=user, emoji__in=CHAT_REACTION_EMOJIS)
-        .values_list('message_id', 'emoji')
-    )
+    reacted = {}
+    if message_ids:
+        for message_id, emoji in (
+            MessageReaction.objects.filter(message_id__in=message_ids, user=user, emoji__in=CHAT_REACTION_EMOJIS)
+            .values_list('message_id', 'emoji')
+        ):
+            reacted.setdefault(message_id, set()).add(emoji)
 
     for m in messages:
-        pills = []
-        for emoji in CHAT_REACTION_EMOJIS:
-            c = counts.get((m.id, emoji), 0)
-            if c:
-                pills.append({'emoji': emoji, 'count': c, 'reacted': (m.id, emoji) in reacted})
-        m.reaction_pills = pills
+        m.reaction_pills = reaction_pills(getattr(m, 'reaction_counts', None), reacted.get(m.id, ()))
 
 
 def _attach_one_time_view_flags(messages, user):
@@ -389,7 +388,7 @@ def _build_groupchat_sections(groupchats):
 def mention_user_search(request):
     """Return a small list of users for @mention autocomplete.
 
-    Query param: q (without @)
+    Query params: q (without @), room (optional group_name, ranks its members first)
     Response: { results: [{username, display, avatar}] }
     """
     q = (request.GET.get('q') or '').strip()
@@ -407,28 +406,49 @@ def mention_user_search(request):
     if not q:
         return JsonResponse({'results': []})
 
-    qs = (
-        User.objects
-        .filter(is_active=True)
-        .filter(Q(username__istartswith=q) | Q(profile__displayname__istartswith=q))
-        .select_related('profile')
-        .order_by('username')
-    )[:8]
-
-    results = []
-    for u in qs:
-        try:
-            profile = getattr(u, 'profile', None)
-        except Exception:
-            profile = None
-        display = (getattr(profile, 'name', None) or u.username)
-        try:
-            avatar = getattr(profile, 'avatar', '') if profile else ''
-        except Exception:
-            avatar = ''
-        results.append({'username': u.username, 'display': display, 'avatar': avatar})
+    # Optional room (group_name): rank that room's recent authors and members first.
+    room_id = None
+    room = (request.GET.get('room') or '').strip()[:128]
+    if room:
+        row = ChatGroup.objects.filter(group_name=room).values_list('id', 'is_private').first()
+        if row:
+            rid, is_private = row
+            if not is_private or ChatGroup.members.through.objects.filter(chatgroup_id=rid, user_id=request.user.id).exists():
+                room_id = rid
+
+    results = search_mention_candidates(q, room_id=room_id)
+    response = JsonResponse({'results': results})
+    if is_cacheable_prefix(q):
+        patch_cache_control(response, private=True, max_age=search_cache_seconds())
+    return response
 
-    return JsonResponse({'results': results})
+
+@login_required
+def gif_search_view(request):
+    """Giphy search/trending for the GIF picker, proxied and cached server-side.
+
+    Query params: q (empty = trending), offset
+    Response: { query, offset, next_offset, results: [{id, title, url, mp4, still, thumb, width, height}] }
+    """
+    rl = check_rate_limit(
+        make_key('gif_search', request.user.id),
+        limit=int(getattr(settings, 'GIF_SEARCH_RATE_LIMIT', 40)),
+        period_seconds=int(getattr(settings, 'GIF_SEARCH_RATE_PERIOD', 60)),
+    )
+    if not rl.allowed:
+        resp = JsonResponse({'error': 'rate_limited'}, status=429)
+        resp.headers['Retry-After'] = str(rl.retry_after)
+        return resp
+
+    try:
+        data = gifs.search(request.GET.get('q') or '', request.GET.get('offset'))
+    except gifs.GifSearchError:
+        return JsonResponse({'error': 'unavailable', 'results': []}, status=502)
+
+    data.pop('cached', None)
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, max_age=60)
+    return response
 
 @login_required
 def chat_view(request, chatroom_name='public-chat'):
@@ -456,7 +476,7 @@ def chat_view(request, chatroom_name='public-chat'):
     initial_limit = max(10, min(initial_limit, 200))
 
     # Fetch latest by id (fast, stable chronological order) then reverse.
-    latest_messages = list(chat_group.chat_messages.order_by('-id')[:initial_limit])
+    latest_messages = list(chat_group.chat_messages.select_related('author__profile').order_by('-id')[:initial_limit])
     latest_messages.reverse()
     chat_messages = latest_messages
 
@@ -465,7 +485,9 @@ def chat_view(request, chatroom_name='public-chat'):
         if chat_messages:
             oldest_id = int(getattr(chat_messages[0], 'id', 0) or 0)
             if oldest_id:
-                has_older_messages = chat_group.chat_messages.filter(id__lt=oldest_id).exists()
+                has_older_messages = recent_messages.has_older_than(chat_group.id, oldest_id)
+                if has_older_messages is None:
+                    has_older_messages = chat_group.chat_messages.filter(id__lt=oldest_id).exists()
     except Exception:
         has_older_messages = False
 
@@ -510,14 +532,7 @@ def chat_view(request, chatroom_name='public-chat'):
     other_last_read_id = 0
     if other_user and getattr(chat_group, 'is_private', False):
         try:
-            from .models import ChatReadState
-
-            other_last_read_id = int(
-                ChatReadState.objects.filter(user=other_user, group=chat_group)
-                .values_list('last_read_message_id', flat=True)
-                .first()
-                or 0
-            )
+            other_last_read_id = read_state.get_last_read(other_user.id, chat_group.id)
         except Exception:
             other_last_read_id = 0
 
@@ -657,13 +672,17 @@ def chat_view(request, chatroom_name='public-chat'):
                     status=400,
                 )
 
+            if content_type.startswith('image/'):
+                upload = sanitize_upload(upload)
             message = GroupMessage.objects.create(
                 file=upload,
                 file_caption=caption or None,
                 one_time_view_seconds=one_time_seconds,
                 author=request.user,
                 group=chat_group,
+                **probe_upload(upload),
             )
+            schedule_media('message', message.id)
 
             # Retention: keep only the newest messages per room (best-effort)
             # Apply only to public/group chats, not private chats.
@@ -880,28 +899,7 @@ def chat_view(request, chatroom_name='public-chat'):
                         except Exception:
                             pass
 
-                        if getattr(active, 'status', '') != ChatChallenge.STATUS_ACTIVE:
-                            meta = dict(getattr(active, 'meta', None) or {})
-                            if not meta.get('ended_notified'):
-                                meta['ended_notified'] = True
-                                active.meta = meta
-                                active.save(update_fields=['meta'])
-
-                                winners = meta.get('winners') or []
-                                losers = meta.get('losers') or []
-                                html = render_to_string('a_rtchat/partials/challenge_event.html', {
-                                    'title': 'Challenge ended',
-                                    'body': f"Winners: {len(winners)} • Losers: {len(losers)}",
-                                })
-                                channel_layer = get_channel_layer()
-                                async_to_sync(channel_layer.group_send)(
-                                    chatroom_channel_group_name(chat_group),
-                                    {
-                                        'type': 'challenge_event_handler',
-                                        'html': html,
-                                        'state': challenge_public_state(active),
-                                    },
-                                )
+                        announce_challenge_end(active)
                     else:
                         res = check_challenge_message(active, getattr(request.user, 'id', 0), raw_body)
                         if not res.allowed:
@@ -927,29 +925,9 @@ def chat_view(request, chatroom_name='public-chat'):
                             # If everyone lost, end early.
                             try:
                                 member_ids = list(chat_group.members.values_list('id', flat=True))
-                                losers = set((active.meta or {}).get('losers') or [])
+                                losers = set(challenge_live_meta(active).get('losers') or [])
                                 if member_ids and losers.issuperset(set(member_ids)):
-                                    ended = challenge_end(active)
-                                    meta = dict(getattr(ended, 'meta', None) or {})
-                                    if not meta.get('ended_notified'):
-                                        meta['ended_notified'] = True
-                                        ended.meta = meta
-                                        ended.save(update_fields=['meta'])
-
-                                        winners2 = meta.get('winners') or []
-                                        losers2 = meta.get('losers') or []
-                                        end_html = render_to_string('a_rtchat/partials/challenge_event.html', {
-                                            'title': 'Challenge ended',
-                                            'body': f"Winners: {len(winners2)} • Losers: {len(losers2)}",
-                                        })
-                                        async_to_sync(channel_layer.group_send)(
-                                            chatroom_channel_group_name(chat_group),
-                                            {
-                                                'type': 'challenge_event_handler',
-                                                'html': end_html,
-                                                'state': challenge_public_state(ended),
-                                            },
-                                        )
+                                    announce_challenge_end(challenge_end(active))
                             except Exception:
                                 pass
 
@@ -961,28 +939,7 @@ def chat_view(request, chatroom_name='public-chat'):
                             except Exception:
                                 pass
 
-                            if getattr(active, 'status', '') != ChatChallenge.STATUS_ACTIVE:
-                                meta = dict(getattr(active, 'meta', None) or {})
-                                if not meta.get('ended_notified'):
-                                    meta['ended_notified'] = True
-                                    active.meta = meta
-                                    active.save(update_fields=['meta'])
-
-                                    winners3 = meta.get('winners') or []
-                                    losers3 = meta.get('losers') or []
-                                    end_html = render_to_string('a_rtchat/partials/challenge_event.html', {
-                                        'title': 'Challenge ended',
-                                        'body': f"Winners: {len(winners3)} • Losers: {len(losers3)}",
-                                    })
-                                    channel_layer = get_channel_layer()
-                                    async_to_sync(channel_layer.group_send)(
-                                        chatroom_channel_group_name(chat_group),
-                                        {
-                                            'type': 'challenge_event_handler',
-                                            'html': end_html,
-                                            'state': challenge_public_state(active),
-                                        },
-                                    )
+                            announce_challenge_end(active)
         except Exception:
             pass
 
@@ -1190,20 +1147,24 @@ def chat_view(request, chatroom_name='public-chat'):
         # Default is OFF for performance unless explicitly enabled.
         pending_moderation = None
         if raw_body and int(getattr(settings, 'AI_MODERATION_ENABLED', 0)):
-            last_user_msgs = list(
-                chat_group.chat_messages.filter(author=request.user)
-                .exclude(body__isnull=True)
-                .exclude(body='')
-                .order_by('-created')
-                .values_list('body', flat=True)[:3]
-            )
-            last_room_msgs = list(
-                chat_group.chat_messages
-                .exclude(body__isnull=True)
-                .exclude(body='')
-                .order_by('-created')
-                .values_list('body', flat=True)[:3]
-            )
+            last_user_msgs = recent_messages.recent_bodies(chat_group.id, author_id=request.user.id, limit=3)
+            if last_user_msgs is None:
+                last_user_msgs = list(
+                    chat_group.chat_messages.filter(author=request.user)
+                    .exclude(body__isnull=True)
+                    .exclude(body='')
+                    .order_by('-created')
+                    .values_list('body', flat=True)[:3]
+                )
+            last_room_msgs = recent_messages.recent_bodies(chat_group.id, limit=3)
+            if last_room_msgs is None:
+                last_room_msgs = list(
+                    chat_group.chat_messages
+                    .exclude(body__isnull=True)
+                    .exclude(body='')
+                    .order_by('-created')
+                    .values_list('body', flat=True)[:3]
+                )
 
             ctx = {
                 'room': chat_group.group_name,
@@ -1386,7 +1347,12 @@ def chat_view(request, chatroom_name='public-chat'):
             try:
                 if (getattr(chat_group, 'group_name', '') == 'public-chat'
                         and getattr(request.user, 'username', '') != NATASHA_USERNAME):
-                    trigger_natasha_reply_after_commit(chat_group.id, message.id)
+                    trigger_natasha_reply_after_commit(
+                        chat_group.id,
+                        message.id,
+                        body=message.body or '',
+                        reply_to_author_id=getattr(getattr(message, 'reply_to', None), 'author_id', None),
+                    )
             except Exception:
                 pass
 
@@ -1583,6 +1549,18 @@ def chat_view(request, chatroom_name='public-chat'):
     except Exception:
         needs_email_verification_for_chat = False
 
+    sidebar_privatechats = []
+    sidebar_code_rooms = []
+    if not chat_blocked:
+        # One bulk lookup for every sidebar badge; the open room is being read right now.
+        sidebar_private_rooms = attach_unread_counts(
+            request.user,
+            request.user.chat_groups.filter(is_private=True).exclude(group_name='online-status'),
+            exclude_room_id=chat_group.id,
+        )
+        sidebar_privatechats = [r for r in sidebar_private_rooms if not r.is_code_room]
+        sidebar_code_rooms = [r for r in sidebar_private_rooms if r.is_code_room]
+
     context = {
         'chat_messages' : chat_messages, 
         'has_older_messages': has_older_messages,
@@ -1599,8 +1577,8 @@ def chat_view(request, chatroom_name='public-chat'):
         'sidebar_groupchats': sidebar_groupchats,
         'sidebar_groupchat_sections': sidebar_groupchat_sections,
         'sidebar_groupchats_remaining': sidebar_groupchats_remaining,
-        'sidebar_privatechats': [] if chat_blocked else request.user.chat_groups.filter(is_private=True, is_code_room=False).exclude(group_name='online-status'),
-        'sidebar_code_rooms': [] if chat_blocked else request.user.chat_groups.filter(is_private=True, is_code_room=True).exclude(group_name='online-status'),
+        'sidebar_privatechats': sidebar_privatechats,
+        'sidebar_code_rooms': sidebar_code_rooms,
         'private_room_create_form': PrivateRoomCreateForm(),
         'room_code_join_form': RoomCodeJoinForm(),
         'uploads_used': uploads_used,
@@ -1685,8 +1663,7 @@ def chat_view(request, chatroom_name='public-chat'):
         'otherAvatarUrl': _safe_avatar(other_profile),
         'linksAllowed': bool(links_allowed),
         'gifsAllowed': bool(gifs_allowed),
-        'giphyApiKey': 'mA2NToNf2QW36bSdNgOVfdmUj7w6W7sz',
-        'giphyLimit': 30,
+        'gifSearchUrl': reverse('gif-search'),
         'chatBlocked': bool(chat_blocked),
     }
 
@@ -1724,14 +1701,7 @@ def chat_config_view(request, chatroom_name):
     other_last_read_id = 0
     if other_user and getattr(chat_group, 'is_private', False):
         try:
-            from .models import ChatReadState
-
-            other_last_read_id = int(
-                ChatReadState.objects.filter(user=other_user, group=chat_group)
-                .values_list('last_read_message_id', flat=True)
-                .first()
-                or 0
-            )
+            other_last_read_id = read_state.get_last_read(other_user.id, chat_group.id)
         except Exception:
             other_last_read_id = 0
 
@@ -1794,8 +1764,7 @@ def chat_config_view(request, chatroom_name):
         'otherAvatarUrl': _safe_avatar(other_profile),
         'linksAllowed': bool(links_allowed),
         'gifsAllowed': bool(gifs_allowed),
-        'giphyApiKey': 'mA2NToNf2QW36bSdNgOVfdmUj7w6W7sz',
-        'giphyLimit': 30,
+        'gifSearchUrl': reverse('gif-search'),
     }
     return JsonResponse(data)
 
@@ -1851,7 +1820,7 @@ def chat_older_view(request, chatroom_name):
         page_size = 50
     page_size = max(10, min(page_size, 200))
 
-    qs = chat_group.chat_messages.filter(id__lt=before_id).order_by('-id')
+    qs = chat_group.chat_messages.filter(id__lt=before_id).select_related('author__profile').order_by('-id')
     batch = list(qs[:page_size])
     if not batch:
         return JsonResponse({'messages_html': '', 'oldest_id': before_id, 'has_more': False})
@@ -1869,24 +1838,18 @@ def chat_older_view(request, chatroom_name):
     except Exception:
         verified_user_ids = set()
 
-    parts = []
-    prev = None
-    for message in batch:
-        parts.append(
-            render(
-                request,
-                'a_rtchat/chat_message.html',
-                {
-                    'message': message,
-                    'user': request.user,
-                    'chat_group': chat_group,
-                    'reaction_emojis': CHAT_REACTION_EMOJIS,
-                    'verified_user_ids': verified_user_ids,
-                    'prev_message': prev,
-                },
-            ).content.decode('utf-8')
-        )
-        prev = message
+    # One template pass for the page (see chat_poll_view).
+    messages_html = render_to_string(
+        'a_rtchat/partials/chat_message_batch.html',
+        {
+            'message_pairs': list(zip(batch, [None, *batch[:-1]])),
+            'user': request.user,
+            'chat_group': chat_group,
+            'reaction_emojis': CHAT_REACTION_EMOJIS,
+            'verified_user_ids': verified_user_ids,
+        },
+        request=request,
+    )
 
     oldest_id = int(getattr(batch[0], 'id', 0) or 0)
     has_more = False
@@ -1896,7 +1859,7 @@ def chat_older_view(request, chatroom_name):
     except Exception:
         has_more = False
 
-    return JsonResponse({'messages_html': ''.join(parts), 'oldest_id': oldest_id, 'has_more': has_more})
+    return JsonResponse({'messages_html': messages_html, 'oldest_id': oldest_id, 'has_more': has_more})
 
 
 @login_required
@@ -2041,30 +2004,20 @@ def code_room_waiting_list(request, chatroom_name):
     qs = (
         CodeRoomJoinRequest.objects.filter(room=chat_group, admitted_at__isnull=True, last_seen_at__gte=cutoff)
         .select_related('user')
+        .annotate(displayname=F('user__profile__displayname'))
         .order_by('created_at')
     )
 
+    requests_list = list(qs)
+    avatars = avatar_urls(jr.user_id for jr in requests_list)
     pending = []
-    for jr in qs:
+    for jr in requests_list:
         u = jr.user
-        try:
-            profile = getattr(u, 'profile', None)
-        except Exception:
-            profile = None
-        try:
-            display = (getattr(profile, 'name', None) or u.username)
-        except Exception:
-            display = u.username
-        try:
-            avatar = getattr(profile, 'avatar', '') if profile else ''
-        except Exception:
-            avatar = ''
-
         pending.append({
             'id': u.id,
             'username': u.username,
-            'display': display,
-            'avatar': avatar,
+            'display': jr.displayname or u.username,
+            'avatar': avatars.get(u.id, ''),
         })
 
     return JsonResponse({'ok': True, 'count': len(pending), 'pending': pending})
@@ -2412,13 +2365,17 @@ def chat_file_upload(request, chatroom_name):
             status=400,
         )
 
+    if content_type.startswith('image/'):
+        upload = sanitize_upload(upload)
     message = GroupMessage.objects.create(
         file=upload,
         file_caption=caption or None,
         one_time_view_seconds=one_time_seconds,
         author=request.user,
         group=chat_group,
+        **probe_upload(upload),
     )
+    schedule_media('message', message.id)
 
     # Retention: keep only the newest messages per room (best-effort)
     # Apply only to public/group chats, not private chats.
@@ -2555,6 +2512,8 @@ def message_info_view(request, message_id: int):
 
     readers = []
     try:
+        # Marks from this process may still be buffered.
+        read_state.flush_read_states(room_id=chat_group.id)
         readers = list(
             ChatReadState.objects.filter(group=chat_group, last_read_message_id__gte=message.id)
             .select_related('user', 'user__profile')
@@ -2630,7 +2589,12 @@ def chat_poll_view(request, chatroom_name):
 
     online_count = chat_group.users_online.count()
 
-    new_messages_qs = chat_group.chat_messages.filter(id__gt=after_id).order_by('created', 'id')
+    # Most polls find nothing new: answer those from the recent-message buffer.
+    newest_id = recent_messages.latest_message_id(chat_group.id)
+    if newest_id is not None and newest_id <= after_id:
+        return JsonResponse({'messages_html': '', 'last_id': after_id, 'online_count': online_count})
+
+    new_messages_qs = chat_group.chat_messages.filter(id__gt=after_id).select_related('author__profile').order_by('created', 'id')
     new_messages = list(new_messages_qs[:50])
     if not new_messages:
         return JsonResponse({'messages_html': '', 'last_id': after_id, 'online_count': online_count})
@@ -2647,19 +2611,18 @@ def chat_poll_view(request, chatroom_name):
     except Exception:
         verified_user_ids = set()
 
-    # Render a batch of messages using the same bubble template
-    parts = []
-    for message in new_messages:
-        parts.append(render(request, 'a_rtchat/chat_message.html', {
-            'message': message,
-            'user': request.user,
-            'chat_group': chat_group,
-            'reaction_emojis': CHAT_REACTION_EMOJIS,
-            'verified_user_ids': verified_user_ids,
-        }).content.decode('utf-8'))
+    # Render the batch in one template pass: context processors (badge counts etc.)
+    # then run once per response instead of once per message.
+    messages_html = render_to_string('a_rtchat/partials/chat_message_batch.html', {
+        'message_pairs': [(message, None) for message in new_messages],
+        'user': request.user,
+        'chat_group': chat_group,
+        'reaction_emojis': CHAT_REACTION_EMOJIS,
+        'verified_user_ids': verified_user_ids,
+    }, request=request)
 
     last_id = new_messages[-1].id
-    return JsonResponse({'messages_html': ''.join(parts), 'last_id': last_id, 'online_count': online_count})
+    return JsonResponse({'messages_html': messages_html, 'last_id': last_id, 'online_count': online_count})
 
 
 @login_required
@@ -2798,19 +2761,19 @@ def message_react_toggle(request, message_id: int):
     # Only allow one reaction per user per message.
     # - If user taps the same emoji again: remove (toggle off)
     # - If user picks a different emoji: replace previous reaction with the new emoji
-    qs = MessageReaction.objects.filter(message=message, user=request.user)
-    if qs.filter(emoji=emoji).exists():
-        qs.filter(emoji=emoji).delete()
-    else:
-        qs.delete()
-        MessageReaction.objects.create(message=message, user=request.user, emoji=emoji)
+    result = toggle_reaction(message.id, request.user, emoji)
 
+    # Recipients render the new counts straight from the event.
     channel_layer = get_channel_layer()
     async_to_sync(channel_layer.group_send)(
         chatroom_channel_group_name(chat_group),
         {
             'type': 'reactions_handler',
             'message_id': message.id,
+            'counts': result['counts'],
+            'actor_id': request.user.id,
+            'emoji': emoji,
+            'added': result['added'],
         },
     )
 
@@ -2890,19 +2853,18 @@ def admin_users_export_view(request):
         )
 
     limit = int(getattr(settings, 'ADMIN_USERS_EXPORT_LIMIT', 50000))
-    users = users[: max(1, limit)]
-
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    batch_size = int(getattr(settings, 'ADMIN_USERS_EXPORT_BATCH_SIZE', 2000))
+    columns = parse_export_columns(request.GET.get('columns') or '')
+
+    # Streamed: rows are fetched with keyset pagination and sent batch by batch,
+    # so the export never holds the whole CSV in memory. An async iterator, because
+    # Daphne would buffer a sync one in full before sending.
+    response = StreamingHttpResponse(
+        astream_users_csv(users, limit=max(1, limit), batch_size=max(1, batch_size), columns=columns),
+        content_type='text/csv; charset=utf-8',
+    )
     response['Content-Disposition'] = 'attachment; filename="users.csv"'
     response['Cache-Control'] = 'no-store'
-
-    # Excel compatibility for UTF-8.
-    response.write('\ufeff')
-
-    writer = csv.writer(response)
-    writer.writerow(['username', 'email'])
-    for username, email in users.values_list('username', 'email').iterator(chunk_size=2000):
-        writer.writerow([username or '', email or ''])
     return response
 
 
@@ -3288,65 +3250,43 @@ def _today_localdate():
         return timezone.now().date()
 
 
-def _global_online_user_count() -> int:
-    """Best-effort global online users count.
+@login_required
+def admin_analytics_live_view(request):
+    """Lightweight live metrics for polling (staff only).
 
-    Presence is driven by websockets updating ChatGroup.users_online.
+    Returns the shared snapshot maintained by a_rtchat.live_metrics, so the cost
+    of polling does not grow with the number of staff tabs. Clients revalidate
+    with If-None-Match and get a 304 while nothing changed.
     """
-    try:
-        through = ChatGroup.users_online.through
-        return int(through.objects.values('user_id').distinct().count())
-    except Exception:
-        try:
-            User = get_user_model()
-            return int(User.objects.filter(online_in_groups__isnull=False).distinct().count())
-        except Exception:
-            return 0
+    if not request.user.is_staff:
+        raise Http404()
 
+    snapshot = get_live_metrics_snapshot()
+    etag = f'"{snapshot.get("etag") or ""}"'
 
-def _get_and_update_peak_today(current: int) -> int:
-    today = _today_localdate().isoformat()
-    key = f"admin:online_peak:{today}"
-    try:
-        prev = int(cache.get(key) or 0)
-    except Exception:
-        prev = 0
-    peak = max(prev, int(current or 0))
-    try:
-        cache.set(key, peak, timeout=60 * 60 * 48)
-    except Exception:
-        pass
-    return peak
+    if_none_match = (request.META.get('HTTP_IF_NONE_MATCH') or '').strip()
+    if if_none_match and etag in {t.strip() for t in if_none_match.split(',')}:
+        resp = HttpResponseNotModified()
+    else:
+        resp = JsonResponse({'ok': True, **live_metrics_payload(snapshot)})
+
+    resp['ETag'] = etag
+    resp['Cache-Control'] = 'private, no-cache'
+    return resp
 
 
 @login_required
-def admin_analytics_live_view(request):
-    """Lightweight live metrics for polling (staff only)."""
+def admin_ws_metrics_view(request):
+    """Per-event WebSocket consumer histograms in Prometheus text format (staff only).
+
+    Numbers are for the process that serves the request (see a_rtchat.ws_metrics).
+    """
     if not request.user.is_staff:
         raise Http404()
 
-    today = _today_localdate()
-    now = timezone.now()
-
-    online_now = _global_online_user_count()
-    peak_today = _get_and_update_peak_today(online_now)
-
-    # Today's counts used for quick refresh without reloading whole page.
-    messages_today = GroupMessage.objects.filter(created__date=today).count()
-    blocked_today = BlockedMessageEvent.objects.filter(created__date=today).count()
-    reports_open = UserReport.objects.filter(status=UserReport.STATUS_OPEN).count()
-    enquiries_open = SupportEnquiry.objects.filter(status=SupportEnquiry.STATUS_OPEN).count()
-
-    return JsonResponse({
-        'ok': True,
-        'ts': now.isoformat(),
-        'online_now': int(online_now),
-        'peak_today': int(peak_today),
-        'messages_today': int(messages_today),
-        'blocked_today': int(blocked_today),
-        'open_reports': int(reports_open),
-        'open_enquiries': int(enquiries_open),
-    })
+    resp = HttpResponse(ws_metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    resp['Cache-Control'] = 'no-store'
+    return resp
 
 
 @login_required
@@ -3364,15 +3304,23 @@ def admin_analytics_view(request):
     total_users = User.objects.count()
     new_users_24h = User.objects.filter(date_joined__gte=last_24h).count()
 
-    online_now = _global_online_user_count()
-    peak_today = _get_and_update_peak_today(online_now)
+    live = get_live_metrics_snapshot()
+    online_now = int(live.get('online_now') or 0)
+    peak_today = int(live.get('peak_today') or 0)
 
-    messages_today = GroupMessage.objects.filter(created__date=today).count()
-    messages_7d = GroupMessage.objects.filter(created__gte=last_7d).count()
-
-    blocked_today = BlockedMessageEvent.objects.filter(created__date=today).count()
+    # Message/blocked/moderation metrics come from the pre-aggregated rollups
+    # (a_rtchat.analytics), never from the raw event tables.
+    start_day = today - timedelta(days=6)
     yesterday = today - timedelta(days=1)
-    blocked_yesterday = BlockedMessageEvent.objects.filter(created__date=yesterday).count()
+    by_day = daily_totals(start=start_day)
+    today_totals = by_day.get(today, {})
+    window_7d = window_totals(since=last_7d)
+
+    messages_today = int(today_totals.get('messages', 0))
+    messages_7d = int(window_7d['messages'])
+
+    blocked_today = int(today_totals.get('blocked', 0))
+    blocked_yesterday = int(by_day.get(yesterday, {}).get('blocked', 0))
     blocked_pct_vs_yesterday = None
     try:
         if blocked_yesterday > 0:
@@ -3385,29 +3333,19 @@ def admin_analytics_view(request):
         blocked_pct_vs_yesterday = None
 
     # ---- Activity graph (daily last 7 days) ----
-    start_day = today - timedelta(days=6)
-    daily = (
-        GroupMessage.objects
-        .filter(created__date__gte=start_day)
-        .annotate(day=TruncDate('created'))
-        .values('day')
-        .annotate(count=Count('id'))
-        .order_by('day')
-    )
-    daily_map = {row['day']: int(row['count']) for row in daily}
     daily_labels = []
     daily_counts = []
     for i in range(7):
         d = start_day + timedelta(days=i)
         daily_labels.append(d.strftime('%b %d'))
-        daily_counts.append(int(daily_map.get(d, 0)))
+        daily_counts.append(int(by_day.get(d, {}).get('messages', 0)))
 
     # ---- Message quality split (last 7d, best-effort) ----
     # Note: AI moderation can be disabled; in that case allow/flag will be 0.
-    allow_7d = ModerationEvent.objects.filter(created__gte=last_7d, action='allow', message__isnull=False).count()
-    flag_7d = ModerationEvent.objects.filter(created__gte=last_7d, action='flag', message__isnull=False).count()
-    block_ai_7d = ModerationEvent.objects.filter(created__gte=last_7d, action='block').count()
-    block_other_7d = BlockedMessageEvent.objects.filter(created__gte=last_7d).exclude(scope='ai_block').count()
+    allow_7d = int(window_7d['mod_allow'])
+    flag_7d = int(window_7d['mod_flag'])
+    block_ai_7d = int(window_7d['mod_block'])
+    block_other_7d = int(window_7d['blocked'] - window_7d['blocked_ai_scope'])
     blocked_total_7d = int(block_ai_7d + block_other_7d)
 
     quality_total = int(allow_7d + flag_7d + blocked_total_7d)
@@ -3418,41 +3356,31 @@ def admin_analytics_view(request):
         'total': int(quality_total),
     }
 
-    # ---- Top lists ----
+    # ---- Top lists (last 7 days, per-user daily rollups) ----
+    user_7d = (
+        ChatStatsDaily.objects
+        .filter(date__gte=start_day)
+        .values('user_id', 'user__username')
+    )
     most_active = list(
-        GroupMessage.objects
-        .filter(created__gte=last_7d)
-        .values('author_id', 'author__username')
-        .annotate(messages=Count('id'))
-        .order_by('-messages')[:10]
+        user_7d
+        .annotate(sent=Sum('messages'), allow=Sum('mod_allow'), flag=Sum('mod_flag'))
+        .filter(sent__gt=0)
+        .order_by('-sent')[:10]
     )
-    active_user_ids = [row['author_id'] for row in most_active]
-
-    quality_by_user = {
-        row['user_id']: row
-        for row in (
-            ModerationEvent.objects
-            .filter(created__gte=last_7d, user_id__in=active_user_ids, message__isnull=False)
-            .values('user_id')
-            .annotate(
-                allow=Count('id', filter=Q(action='allow')),
-                flag=Count('id', filter=Q(action='flag')),
-            )
-        )
-    }
-
     for row in most_active:
-        qrow = quality_by_user.get(row['author_id'])
-        allow_c = int((qrow or {}).get('allow') or 0)
-        flag_c = int((qrow or {}).get('flag') or 0)
+        row['messages'] = int(row.pop('sent') or 0)
+        allow_c = int(row.pop('allow') or 0)
+        flag_c = int(row.pop('flag') or 0)
+        row['author_id'] = row.pop('user_id')
+        row['author__username'] = row.pop('user__username')
         denom = allow_c + flag_c
         row['quality_score'] = round((allow_c / denom) * 100, 1) if denom > 0 else None
 
     top_spammers = list(
-        BlockedMessageEvent.objects
-        .filter(created__gte=last_7d)
-        .values('user_id', 'user__username')
-        .annotate(spam=Count('id'))
+        user_7d
+        .annotate(spam=Sum('blocked'))
+        .filter(spam__gt=0)
         .order_by('-spam')[:10]
     )
 
@@ -3466,47 +3394,42 @@ def admin_analytics_view(request):
         row['auto_action'] = 'Blocked from chat' if blocked_profiles.get(row['user_id']) else '—'
 
     # ---- Room stats (today) ----
-    msgs_by_room = {
-        row['group_id']: row
+    stats_by_room = {
+        row['room_id']: row
         for row in (
-            GroupMessage.objects
-            .filter(created__date=today)
-            .values('group_id')
-            .annotate(messages=Count('id'), active_users=Count('author_id', distinct=True))
-        )
-    }
-
-    blocked_by_room = {
-        row['room_id']: int(row['blocked'])
-        for row in (
-            BlockedMessageEvent.objects
-            .filter(created__date=today)
-            .values('room_id')
-            .annotate(blocked=Count('id'))
-        )
-    }
-    blocked_ai_by_room = {
-        row['room_id']: int(row['blocked'])
-        for row in (
-            ModerationEvent.objects
-            .filter(created__date=today, action='block')
+            ChatStatsDaily.objects
+            .filter(date=today, room__isnull=False)
             .values('room_id')
-            .annotate(blocked=Count('id'))
+            .annotate(
+                sent=Sum('messages'),
+                active_users=Count('id', filter=Q(messages__gt=0)),
+                blocked_events=Sum('blocked'),
+                blocked_ai=Sum('mod_block'),
+            )
         )
     }
 
+    room_limit = 20
     rooms = list(
         ChatGroup.objects
+        .filter(id__in=list(stats_by_room.keys()))
         .exclude(group_name='online-status')
-        .order_by('groupchat_name', 'group_name')
     )
+    if len(rooms) < room_limit:
+        # Pad with idle rooms so the table doesn't look empty early in the day.
+        rooms += list(
+            ChatGroup.objects
+            .exclude(group_name='online-status')
+            .exclude(id__in=list(stats_by_room.keys()))
+            .order_by('groupchat_name', 'group_name')[:room_limit - len(rooms)]
+        )
 
     room_rows = []
     for room in rooms:
-        m = msgs_by_room.get(room.id, {})
-        msg_c = int(m.get('messages') or 0)
+        m = stats_by_room.get(room.id, {})
+        msg_c = int(m.get('sent') or 0)
         act_u = int(m.get('active_users') or 0)
-        blocked_c = int(blocked_by_room.get(room.id, 0) + blocked_ai_by_room.get(room.id, 0))
+        blocked_c = int((m.get('blocked_events') or 0) + (m.get('blocked_ai') or 0))
         denom = msg_c + blocked_c
         spam_ratio = round((blocked_c / denom) * 100, 1) if denom > 0 else 0.0
 
@@ -3522,7 +3445,7 @@ def admin_analytics_view(request):
 
     # Sort rooms: most messages today first, then blocked.
     room_rows.sort(key=lambda r: (r['messages'], r['blocked']), reverse=True)
-    room_rows = room_rows[:20]
+    room_rows = room_rows[:room_limit]
 
     # ---- Reports & moderation ----
     reports_today = UserReport.objects.filter(created_at__date=today).count()
@@ -3530,7 +3453,7 @@ def admin_analytics_view(request):
     enquiries_today = SupportEnquiry.objects.filter(created_at__date=today).count()
     enquiries_open = SupportEnquiry.objects.filter(status=SupportEnquiry.STATUS_OPEN).count()
 
-    auto_actions_today = BlockedMessageEvent.objects.filter(created__date=today, auto_muted_seconds__gt=0).count()
+    auto_actions_today = int(today_totals.get('auto_actions', 0))
     pending_actions = int(reports_open + enquiries_open)
 
     context = {
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import ws_metrics
+from .llm_client import percentile
+from .models import ChatGroup, GroupMessage
+from .reactions import reaction_emojis
+from .routing import websocket_urlpatterns
+
+
+# WebSocket load scenarios for the chat stack, run in-process: clients are
+# channels.testing.WebsocketCommunicator instances talking to the real consumers over
+# the configured (in-memory) channel layer, and HTTP steps go through the Django test
+# client. Sync consumer code runs on one thread, as it does inside a Daphne worker, so
+# the numbers approximate one worker's capacity.
+#
+# Scenarios work against whatever database is configured; the bench_chat_ws command
+# runs them in a throwaway test database. Per-event queries/time come from ws_metrics.
+
+BENCH_ROOM = 'public-chat'
+_TOKEN_RE = re.compile(r'bench-\d+-\d+')
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 2)
+
+
+def _summary(samples_s: list[float]) -> dict:
+    if not samples_s:
+        return {'count': 0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {
+        'count': len(samples_s),
+        'p50': _ms(percentile(samples_s, 50)),
+        'p95': _ms(percentile(samples_s, 95)),
+        'p99': _ms(percentile(samples_s, 99)),
+        'max': _ms(max(samples_s)),
+    }
+
+
+def _events() -> dict:
+    """Per-event stats from ws_metrics, trimmed to what a release comparison needs."""
+    out = {}
+    for key, row in ws_metrics.snapshot().items():
+        out[key] = {
+            'count': row['count'],
+            'ms_p50': _ms(row['duration_seconds']['p50']),
+            'ms_p95': _ms(row['duration_seconds']['p95']),
+            'ms_p99': _ms(row['duration_seconds']['p99']),
+            'queries_avg': round(row['queries']['avg'], 2),
+            'cache_ops_avg': round(row['cache_ops']['avg'], 2),
+            'sent_bytes_avg': round(row['sent_bytes']['avg'], 1),
+        }
+    return out
+
+
+def bench_users(count: int, *, prefix: str = 'wsbench') -> list:
+    """Active users with a verified email (so the unverified-sender limit doesn't apply)."""
+    from allauth.account.models import EmailAddress
+
+    User = get_user_model()
+    users = []
+    for i in range(count):
+        user, _ = User.objects.get_or_create(username=f"{prefix}{i}", defaults={'email': f"{prefix}{i}@example.com"})
+        EmailAddress.objects.get_or_create(user=user, email=user.email or f"{prefix}{i}@example.com", defaults={'verified': True, 'primary': True})
+        users.append(user)
+    return users
+
+
+class BenchClient:
+    """A connected socket whose frames are drained in the background and timestamped."""
+
+    def __init__(self, user, path: str, on_frame=None):
+        self.user = user
+        self.path = path
+        self.on_frame = on_frame
+        self.frames = 0
+        self.bytes = 0
+        self._communicator = None
+        self._drain = None
+
+    async def connect(self, timeout: float = 10) -> float:
+        self._communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), self.path)
+        self._communicator.scope['user'] = self.user
+        started = time.perf_counter()
+        connected, _code = await self._communicator.connect(timeout=timeout)
+        elapsed = time.perf_counter() - started
+        if not connected:
+            raise RuntimeError(f"{self.path} refused {self.user}")
+        self._drain = asyncio.ensure_future(self._drain_frames())
+        return elapsed
+
+    async def _drain_frames(self):
+        # Read the communicator's queue directly: receive_from() cancels the app on timeout.
+        queue = self._communicator.output_queue
+        while True:
+            message = await queue.get()
+            text = message.get('text')
+            if text is None:
+                continue
+            self.frames += 1
+            self.bytes += len(text.encode('utf-8'))
+            if self.on_frame is not None:
+                self.on_frame(self, text, time.perf_counter())
+
+    async def send(self, payload: dict) -> None:
+        await self._communicator.send_to(text_data=json.dumps(payload))
+
+    async def disconnect(self, timeout: float = 10) -> float:
+        started = time.perf_counter()
+        await self._communicator.disconnect(timeout=timeout)
+        elapsed = time.perf_counter() - started
+        if self._drain is not None:
+            self._drain.cancel()
+            try:
+                await self._drain
+            except asyncio.CancelledError:
+                pass
+        return elapsed
+
+
+async def _wait_for(predicate, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.002)
+    return True
+
+
+def _quiet_room(room: ChatGroup) -> None:
+    # Natasha's random interjections would add LLM work to the numbers.
+    cache.set(f"natasha:disable_replies:{room.id}", 1, timeout=None)
+
+
+# Scenarios ------------------------------------------------------------------------
+
+async def chat_send(users, *, messages: int, rate: float, timeout: float = 60) -> dict:
+    """Every user sends `messages` messages to public chat at `rate`/s (0 = as fast as possible)."""
+    room, _ = await sync_to_async(ChatGroup.objects.get_or_create)(group_name=BENCH_ROOM)
+    await sync_to_async(_quiet_room)(room)
+
+    sent_at: dict[str, float] = {}
+    delivery: list[float] = []
+    echo: list[float] = []
+    owner: dict[str, int] = {}
+    seen: set[tuple[int, str]] = set()
+
+    def on_frame(client, text, now):
+        # The rendered message can carry its body more than once; count one delivery each.
+        for token in set(_TOKEN_RE.findall(text)):
+            started = sent_at.get(token)
+            if started is None or (client.user.id, token) in seen:
+                continue
+            seen.add((client.user.id, token))
+            delivery.append(now - started)
+            if owner.get(token) == client.user.id:
+                echo.append(now - started)
+
+    clients = [BenchClient(u, f"/ws/chatroom/{BENCH_ROOM}", on_frame) for u in users]
+    for c in clients:
+        await c.connect()
+    await asyncio.sleep(0.05)
+    ws_metrics.reset()
+
+    async def sender(index: int, client: BenchClient):
+        interval = (1.0 / rate) if rate > 0 else 0.0
+        for n in range(messages):
+            token = f"bench-{index}-{n}"
+            owner[token] = client.user.id
+            sent_at[token] = time.perf_counter()
+            await client.send({'body': f"{token} hello from the load test"})
+            await asyncio.sleep(interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(i, c) for i, c in enumerate(clients)))
+    expected = len(clients) * len(clients) * messages
+    complete = await _wait_for(lambda: len(delivery) >= expected, timeout)
+    elapsed = time.perf_counter() - started
+
+    events = _events()
+    for c in clients:
+        await c.disconnect()
+
+    total = len(clients) * messages
+    return {
+        'clients': len(clients),
+        'messages': total,
+        'deliveries': len(delivery),
+        'expected_deliveries': expected,
+        'complete': complete,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(total / elapsed, 2) if elapsed else 0.0,
+        'deliveries_per_s': round(len(delivery) / elapsed, 2) if elapsed else 0.0,
+        'echo_ms': _summary(echo),
+        'delivery_ms': _summary(delivery),
+        'events': events,
+    }
+
+
+async def presence_churn(users, *, cycles: int) -> dict:
+    """All users connect to ws/online-status/, then disconnect, `cycles` times."""
+    ws_metrics.reset()
+    connects: list[float] = []
+    disconnects: list[float] = []
+    frames = 0
+    started = time.perf_counter()
+    for _cycle in range(cycles):
+        clients = [BenchClient(u, '/ws/online-status/') for u in users]
+        for c in clients:
+            connects.append(await c.connect())
+        await asyncio.sleep(0.01)
+        for c in clients:
+            disconnects.append(await c.disconnect())
+        frames += sum(c.frames for c in clients)
+    elapsed = time.perf_counter() - started
+
+    ops = len(connects) + len(disconnects)
+    return {
+        'clients': len(users),
+        'cycles': cycles,
+        'elapsed_s': round(elapsed, 3),
+        'ops_per_s': round(ops / elapsed, 2) if elapsed else 0.0,
+        'frames_received': frames,
+        'connect_ms': _summary(connects),
+        'disconnect_ms': _summary(disconnects),
+        'events': _events(),
+    }
+
+
+async def reaction_storm(listeners, reactors, *, toggles: int, timeout: float = 30) -> dict:
+    """`reactors` toggle reactions over HTTP while `listeners` watch the room fan-out."""
+    room, _ = await sync_to_async(ChatGroup.objects.get_or_create)(group_name=BENCH_ROOM)
+    await sync_to_async(_quiet_room)(room)
+    target = await sync_to_async(GroupMessage.objects.create)(group=room, author=listeners[0], body='react to me')
+    emojis = list(reaction_emojis())[:4]
+
+    received = {'n': 0}
+
+    def on_frame(client, text, now):
+        if text.startswith('{"type": "reactions"'):
+            received['n'] += 1
+
+    clients = [BenchClient(u, f"/ws/chatroom/{BENCH_ROOM}", on_frame) for u in listeners]
+    for c in clients:
+        await c.connect()
+    await asyncio.sleep(0.05)
+    received['n'] = 0
+    ws_metrics.reset()
+
+    http = []
+    for user in reactors:
+        client = Client()
+        await sync_to_async(client.force_login)(user)
+        http.append(client)
+
+    url = reverse('message-react', args=[target.id])
+
+    def _toggle(client, emoji):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.post(url, {'emoji': emoji})
+        return resp.status_code, len(ctx.captured_queries)
+
+    request_s: list[float] = []
+    fanout_s: list[float] = []
+    queries: list[int] = []
+    failures = 0
+    emoji_cycle = itertools.cycle(emojis)
+    started = time.perf_counter()
+    for _round in range(toggles):
+        for client in http:
+            before = received['n']
+            t0 = time.perf_counter()
+            status, n_queries = await sync_to_async(_toggle)(client, next(emoji_cycle))
+            request_s.append(time.perf_counter() - t0)
+            queries.append(n_queries)
+            if status != 204:
+                failures += 1
+                continue
+            if await _wait_for(lambda: received['n'] >= before + len(clients), timeout):
+                fanout_s.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    events = _events()
+    for c in clients:
+        await c.disconnect()
+
+    total = len(request_s)
+    return {
+        'listeners': len(clients),
+        'reactors': len(http),
+        'toggles': total,
+        'failures': failures,
+        'elapsed_s': round(elapsed, 3),
+        'toggles_per_s': round(total / elapsed, 2) if elapsed else 0.0,
+        'request_ms': _summary(request_s),
+        'fanout_ms': _summary(fanout_s),
+        'queries_per_toggle': {'avg': round(sum(queries) / len(queries), 2) if queries else 0, 'max': max(queries or [0])},
+        'events': events,
+    }
+
+
+def history_paging(user, *, seed_messages: int, pages: int) -> dict:
+    """Seed public chat with messages, then page back through chat_older_view."""
+    room, _ = ChatGroup.objects.get_or_create(group_name=BENCH_ROOM)
+    authors = bench_users(5, prefix='wsbench-author')
+    GroupMessage.objects.bulk_create(
+        [GroupMessage(group=room, author=authors[i % len(authors)], body=f"history message {i}") for i in range(seed_messages)],
+        batch_size=500,
+    )
+    newest = GroupMessage.objects.filter(group=room).order_by('-id').values_list('id', flat=True).first() or 0
+
+    client = Client()
+    client.force_login(user)
+    url = reverse('chat-older', args=[BENCH_ROOM])
+
+    durations: list[float] = []
+    queries: list[int] = []
+    sizes: list[int] = []
+    before = newest + 1
+    for _page in range(pages):
+        t0 = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.get(url, {'before': before})
+        durations.append(time.perf_counter() - t0)
+        queries.append(len(ctx.captured_queries))
+        sizes.append(len(resp.content))
+        data = resp.json()
+        if resp.status_code != 200 or not data.get('has_more'):
+            break
+        before = int(data.get('oldest_id') or 0)
+
+    return {
+        'seed_messages': seed_messages,
+        'pages': len(durations),
+        'page_ms': _summary(durations),
+        'queries_per_page': {'avg': round(sum(queries) / len(queries), 2) if queries else 0, 'max': max(queries or [0])},
+        'bytes_per_page': {'avg': round(sum(sizes) / len(sizes), 1) if sizes else 0, 'max': max(sizes or [0])},
+    }
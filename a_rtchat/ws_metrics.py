@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from channels.consumer import get_handler_name
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+
+# Per-event instrumentation for WebSocket consumers (process-local).
+#
+# InstrumentedConsumerMixin wraps consumer dispatch, so every websocket.connect /
+# receive / disconnect and every channel-layer *_handler is measured as one event:
+# wall time, DB queries (a connection execute wrapper), cache calls (counting
+# wrappers on the thread's cache backend) and bytes sent back on the socket.
+# Each goes into a fixed-bucket histogram keyed by (consumer, event), so recording
+# is a few integer increments under one lock; percentiles are estimated from the
+# buckets on read. Receives are labelled by the client's "type" field
+# ("receive.typing"), read with a regex instead of a second JSON parse.
+#
+# render_prometheus() backs the staff-only metrics endpoint; snapshot() gives the same
+# data with p50/p95/p99 for benchmarks. Each worker process reports its own numbers.
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# (metric suffix, buckets, help text)
+SERIES = (
+    ('duration_seconds', DURATION_BUCKETS, 'Time spent handling one WebSocket event.'),
+    ('queries', COUNT_BUCKETS, 'Database queries issued while handling one WebSocket event.'),
+    ('cache_ops', COUNT_BUCKETS, 'Cache calls made while handling one WebSocket event.'),
+    ('sent_bytes', BYTES_BUCKETS, 'Bytes sent to the socket while handling one WebSocket event.'),
+)
+PREFIX = 'vixo_ws_event'
+
+# Client-chosen receive types are capped so a misbehaving client can't grow the table.
+MAX_EVENT_LABELS = 200
+_RECEIVE_TYPE_RE = re.compile(r'"type"\s*:\s*"([A-Za-z0-9_\-]{1,32})"')
+
+_CACHE_OPS = (
+    'get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many',
+    'incr', 'decr', 'touch', 'has_key', 'get_or_set', 'clear',
+)
+
+_lock = threading.Lock()
+# (consumer, event) -> {'count', 'errors', series: [bucket counts..., +Inf], series_sum}
+_histograms: dict[tuple[str, str], dict] = {}
+_local = threading.local()
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, 'WS_METRICS_ENABLED', True))
+
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+
+
+# Recording ----------------------------------------------------------------------
+
+class _Sample:
+    __slots__ = ('queries', 'cache_ops', 'sent_bytes', 'in_cache')
+
+    def __init__(self):
+        self.queries = 0
+        self.cache_ops = 0
+        self.sent_bytes = 0
+        self.in_cache = False
+
+
+def _count_query(execute, sql, params, many, context):
+    sample = getattr(_local, 'sample', None)
+    if sample is not None:
+        sample.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _wrap_cache_op(original):
+    def op(*args, **kwargs):
+        sample = getattr(_local, 'sample', None)
+        if sample is None or sample.in_cache:
+            return original(*args, **kwargs)
+        # Backends implement get_many & co. on top of get(); count the outer call only.
+        sample.cache_ops += 1
+        sample.in_cache = True
+        try:
+            return original(*args, **kwargs)
+        finally:
+            sample.in_cache = False
+    return op
+
+
+def _instrument_cache() -> None:
+    backend = caches['default']
+    if getattr(backend, '_ws_metrics_wrapped', False):
+        return
+    for name in _CACHE_OPS:
+        original = getattr(backend, name, None)
+        if original is not None:
+            setattr(backend, name, _wrap_cache_op(original))
+    backend._ws_metrics_wrapped = True
+
+
+def note_sent(text_data=None, bytes_data=None) -> None:
+    sample = getattr(_local, 'sample', None)
+    if sample is None:
+        return
+    if text_data:
+        sample.sent_bytes += len(text_data.encode('utf-8'))
+    if bytes_data:
+        sample.sent_bytes += len(bytes_data)
+
+
+def _observe(key: tuple[str, str], values: dict, error: bool) -> None:
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            if len(_histograms) >= MAX_EVENT_LABELS:
+                key = (key[0], 'other')
+                h = _histograms.get(key)
+            if h is None:
+                h = {'count': 0, 'errors': 0}
+                for name, buckets, _help in SERIES:
+                    h[name] = [0] * (len(buckets) + 1)
+                    h[f"{name}_sum"] = 0.0
+                _histograms[key] = h
+        h['count'] += 1
+        if error:
+            h['errors'] += 1
+        for name, buckets, _help in SERIES:
+            value = values[name]
+            h[name][bisect_left(buckets, value)] += 1
+            h[f"{name}_sum"] += value
+
+
+@contextmanager
+def measure(consumer: str, event: str):
+    """Record the enclosed block as one (consumer, event) observation."""
+    if getattr(_local, 'sample', None) is not None:
+        # Nested dispatch (shouldn't happen): the outer event owns the numbers.
+        yield
+        return
+    try:
+        _instrument_cache()
+    except Exception:
+        pass
+    sample = _local.sample = _Sample()
+    error = False
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(_count_query):
+            yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _local.sample = None
+        _observe(
+            (consumer, event),
+            {
+                'duration_seconds': elapsed,
+                'queries': sample.queries,
+                'cache_ops': sample.cache_ops,
+                'sent_bytes': sample.sent_bytes,
+            },
+            error,
+        )
+
+
+def event_label(message: dict) -> str:
+    kind = str(message.get('type') or 'unknown')
+    if kind == 'websocket.receive':
+        text = message.get('text') or ''
+        match = _RECEIVE_TYPE_RE.search(text[:256])
+        return f"receive.{match.group(1).lower()}" if match else 'receive'
+    if kind.startswith('websocket.'):
+        return kind[len('websocket.'):]
+    return kind
+
+
+class InstrumentedConsumerMixin:
+    """Measure every dispatched event of a sync consumer (see module notes)."""
+
+    @database_sync_to_async
+    def dispatch(self, message):
+        handler = getattr(self, get_handler_name(message), None)
+        if not handler:
+            raise ValueError("No handler for message type %s" % message["type"])
+        if not enabled():
+            handler(message)
+            return
+        with measure(type(self).__name__, event_label(message)):
+            handler(message)
+
+    def send(self, text_data=None, bytes_data=None, close=False):
+        note_sent(text_data, bytes_data)
+        super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+
+# Reading ------------------------------------------------------------------------
+
+def _quantile(buckets: tuple, counts: list[int], q: float) -> float:
+    """Estimate a quantile from bucket counts, interpolating inside the bucket."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        if seen + n >= rank and n:
+            if i >= len(buckets):
+                return float(buckets[-1])
+            lower = float(buckets[i - 1]) if i else 0.0
+            return lower + (float(buckets[i]) - lower) * ((rank - seen) / n)
+        seen += n
+    return float(buckets[-1])
+
+
+def snapshot() -> dict:
+    """{"Consumer.event": {count, errors, <series>: {p50, p95, p99, avg}}}."""
+    with _lock:
+        rows = {key: {k: (list(v) if isinstance(v, list) else v) for k, v in h.items()} for key, h in _histograms.items()}
+    out = {}
+    for (consumer, event), h in sorted(rows.items()):
+        entry = {'count': h['count'], 'errors': h['errors']}
+        for name, buckets, _help in SERIES:
+            entry[name] = {
+                'p50': round(_quantile(buckets, h[name], 0.50), 6),
+                'p95': round(_quantile(buckets, h[name], 0.95), 6),
+                'p99': round(_quantile(buckets, h[name], 0.99), 6),
+                'avg': round(h[f"{name}_sum"] / h['count'], 6) if h['count'] else 0.0,
+            }
+        out[f"{consumer}.{event}"] = entry
+    return out
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """All histograms in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        rows = {key: {k: (list(v) if isinstance(v, list) else v) for k, v in h.items()} for key, h in _histograms.items()}
+    keys = sorted(rows)
+
+    lines = []
+    for name, buckets, help_text in SERIES:
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for consumer, event in keys:
+            h = rows[(consumer, event)]
+            labels = f'consumer="{consumer}",event="{event}"'
+            cumulative = 0
+            for bound, n in zip(buckets, h[name]):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{labels},le="{_fmt(bound)}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h["count"]}')
+            lines.append(f"{metric}_sum{{{labels}}} {_fmt(h[f'{name}_sum'])}")
+            lines.append(f"{metric}_count{{{labels}}} {h['count']}")
+
+    metric = f"{PREFIX}_errors_total"
+    lines.append(f"# HELP {metric} WebSocket events whose handler raised.")
+    lines.append(f"# TYPE {metric} counter")
+    for consumer, event in keys:
+        lines.append(f'{metric}{{consumer="{consumer}",event="{event}"}} {rows[(consumer, event)]["errors"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import atexit
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# Buffered DailyUserActivity accumulation.
+#
+# Session time is added to per-(user, day) counters in the cache (cache.incr, so every
+# worker process adds into the same counter). The first session for a (user, day) since
+# the last flush wins a cache.add marker and appends the pair to a shared index: an
+# incr'd slot counter plus one key per slot, so registering never waits on a lock.
+# flush_activity() reads the slots added since the previous flush, clears their markers,
+# moves the counters into DailyUserActivity with one bulk insert and one bulk update,
+# then subtracts exactly what it wrote, so seconds added while a flush is running carry
+# over to the next one. A ticker thread flushes every USER_ACTIVITY_FLUSH_SECONDS, and
+# once more at interpreter exit; a flush already running elsewhere makes a tick a no-op.
+
+_INDEX_COUNT_KEY = 'activity:dirty:n'
+_INDEX_DONE_KEY = 'activity:dirty:done'
+_INDEX_STALL_KEY = 'activity:dirty:stall'
+_FLUSH_LOCK_KEY = 'activity:flush:lock'
+_COUNTER_TTL = 3 * 24 * 60 * 60
+
+_ticker: threading.Thread | None = None
+_ticker_lock = threading.Lock()
+
+
+def _flush_seconds() -> float:
+    try:
+        return max(1.0, float(getattr(settings, 'USER_ACTIVITY_FLUSH_SECONDS', 30)))
+    except Exception:
+        return 30.0
+
+
+def _counter_key(user_id: int, day: datetime.date) -> str:
+    return f"activity:secs:{int(user_id)}:{day.isoformat()}"
+
+
+def _marker_key(user_id: int, day: str) -> str:
+    return f"activity:dirty:{int(user_id)}:{day}"
+
+
+def _slot_key(slot: int) -> str:
+    return f"activity:dirty:slot:{int(slot)}"
+
+
+def _marker_ttl() -> int:
+    # Short, so a registration whose slot never got written heals on the next session.
+    return max(60, int(_flush_seconds() * 4))
+
+
+def split_by_day(start_ts: int, end_ts: int) -> list[tuple[datetime.date, int]]:
+    """Split [start_ts, end_ts) into (local date, seconds) pieces."""
+    if not start_ts or not end_ts or end_ts <= start_ts:
+        return []
+    start_dt = timezone.localtime(datetime.datetime.fromtimestamp(start_ts, tz=datetime.timezone.utc))
+    end_dt = timezone.localtime(datetime.datetime.fromtimestamp(end_ts, tz=datetime.timezone.utc))
+
+    out = []
+    cur = start_dt
+    while cur.date() < end_dt.date():
+        next_midnight = (cur + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        secs = int((next_midnight - cur).total_seconds())
+        if secs > 0:
+            out.append((cur.date(), secs))
+        cur = next_midnight
+    secs = int((end_dt - cur).total_seconds())
+    if secs > 0:
+        out.append((cur.date(), secs))
+    return out
+
+
+def add_active_seconds(user_id: int, start_ts: int, end_ts: int) -> None:
+    """Buffer a session's active time for user_id (best-effort)."""
+    if not user_id:
+        return
+    pieces = split_by_day(int(start_ts or 0), int(end_ts or 0))
+    if not pieces:
+        return
+
+    pairs = set()
+    for day, secs in pieces:
+        key = _counter_key(user_id, day)
+        try:
+            cache.add(key, 0, timeout=_COUNTER_TTL)
+            cache.incr(key, secs)
+            pairs.add((int(user_id), day.isoformat()))
+        except Exception:
+            continue
+    _register(pairs)
+
+
+def _register(pairs: set) -> None:
+    """Add (user_id, 'YYYY-MM-DD') pairs to the flush index, once per pair per flush."""
+    for uid, day in pairs:
+        try:
+            if not cache.add(_marker_key(uid, day), 1, timeout=_marker_ttl()):
+                continue
+            cache.add(_INDEX_COUNT_KEY, 0, timeout=None)
+            slot = cache.incr(_INDEX_COUNT_KEY)
+            cache.set(_slot_key(slot), (int(uid), day), timeout=_COUNTER_TTL)
+        except Exception:
+            continue
+
+
+def _take_dirty() -> set:
+    """Pairs registered since the previous flush; their markers are cleared first, so
+    sessions that land from here on register again for the next flush."""
+    try:
+        count = int(cache.get(_INDEX_COUNT_KEY) or 0)
+        done = int(cache.get(_INDEX_DONE_KEY) or 0)
+    except Exception:
+        return set()
+    if done > count:  # the counter was evicted and started over
+        done = 0
+    if count <= done:
+        return set()
+
+    slots = range(done + 1, count + 1)
+    try:
+        values = cache.get_many([_slot_key(i) for i in slots])
+    except Exception:
+        return set()
+    taken = set()
+    missing = []
+    for i in slots:
+        pair = values.get(_slot_key(i))
+        if pair is None:
+            missing.append(i)
+        else:
+            taken.add(tuple(pair))
+
+    # A missing slot is usually a registration between its incr and set: give it one
+    # tick before moving past it. Re-reading later slots is harmless.
+    new_done = count
+    try:
+        if missing and cache.get(_INDEX_STALL_KEY) != missing[0]:
+            cache.set(_INDEX_STALL_KEY, missing[0], timeout=_COUNTER_TTL)
+            new_done = missing[0] - 1
+        cache.delete_many([_marker_key(uid, day) for uid, day in taken])
+        cache.delete_many([_slot_key(i) for i in range(done + 1, new_done + 1)])
+        cache.set(_INDEX_DONE_KEY, new_done, timeout=None)
+    except Exception:
+        pass
+    return taken
+
+
+def _write(totals: dict[tuple[int, datetime.date], int]) -> None:
+    from a_users.models import DailyUserActivity
+
+    user_ids = {u for u, _d in totals}
+    days = {d for _u, d in totals}
+    existing = {
+        (row.user_id, row.date): row
+        for row in DailyUserActivity.objects.filter(user_id__in=user_ids, date__in=days).only('id', 'user_id', 'date')
+    }
+
+    to_update = []
+    to_create = []
+    for (user_id, day), secs in totals.items():
+        row = existing.get((user_id, day))
+        if row is None:
+            to_create.append(DailyUserActivity(user_id=user_id, date=day, active_seconds=secs))
+        else:
+            row.active_seconds = F('active_seconds') + secs
+            to_update.append(row)
+
+    try:
+        with transaction.atomic():
+            if to_update:
+                DailyUserActivity.objects.bulk_update(to_update, ['active_seconds'], batch_size=500)
+            if to_create:
+                DailyUserActivity.objects.bulk_create(to_create, batch_size=500)
+    except IntegrityError:
+        # Lost an insert race (or the user is gone): fall back to one upsert per row.
+        from a_rtchat.analytics import bump_counters
+
+        for row in to_create:
+            try:
+                with transaction.atomic():
+                    bump_counters(
+                        DailyUserActivity,
+                        {'user_id': row.user_id, 'date': row.date},
+                        {'active_seconds': row.active_seconds},
+                    )
+            except IntegrityError:
+                continue
+        if to_update:
+            with transaction.atomic():
+                DailyUserActivity.objects.bulk_update(to_update, ['active_seconds'], batch_size=500)
+
+
+def flush_activity() -> int:
+    """Move buffered seconds into DailyUserActivity. Returns the number of (user, day) rows touched."""
+    try:
+        if not cache.add(_FLUSH_LOCK_KEY, 1, timeout=60):
+            return 0
+    except Exception:
+        return 0
+    try:
+        return _flush()
+    finally:
+        try:
+            cache.delete(_FLUSH_LOCK_KEY)
+        except Exception:
+            pass
+
+
+def _flush() -> int:
+    taken = _take_dirty()
+    if not taken:
+        return 0
+
+    keys = {_counter_key(uid, datetime.date.fromisoformat(day)): (uid, day) for uid, day in taken}
+    try:
+        values = cache.get_many(list(keys))
+    except Exception:
+        values = {}
+    totals = {}
+    for key, (uid, day) in keys.items():
+        secs = int(values.get(key) or 0)
+        if secs > 0:
+            totals[(uid, datetime.date.fromisoformat(day))] = secs
+    if not totals:
+        return 0
+
+    try:
+        _write(totals)
+    except Exception:
+        _register(taken)
+        return 0
+
+    for (uid, day), secs in totals.items():
+        try:
+            cache.decr(_counter_key(uid, day), secs)
+        except Exception:
+            continue
+    return len(totals)
+
+
+def buffered_seconds(user_id: int, day: datetime.date) -> int:
+    """Seconds for (user, day) not yet written to DailyUserActivity."""
+    try:
+        return int(cache.get(_counter_key(user_id, day)) or 0)
+    except Exception:
+        return 0
+
+
+def _ticker_loop() -> None:
+    while True:
+        time.sleep(_flush_seconds())
+        try:
+            flush_activity()
+        except Exception:
+            pass
+        finally:
+            connection.close()
+
+
+def ensure_flusher() -> None:
+    """Start this process's flush thread (idempotent) and flush on interpreter exit."""
+    global _ticker
+    if _ticker is not None and _ticker.is_alive():
+        return
+    with _ticker_lock:
+        if _ticker is not None and _ticker.is_alive():
+            return
+        first_start = _ticker is None
+        _ticker = threading.Thread(target=_ticker_loop, name='activity-flush', daemon=True)
+        _ticker.start()
+    if first_start:
+        atexit.register(flush_activity)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Precomputed avatar URLs.
+#
+# Profile.avatar_url is built once when the image changes (Profile.save), as a
+# face-cropped AVATAR_THUMB_PX square when media lives on Cloudinary, so rendering an
+# avatar is an attribute read instead of a storage URL build. avatar_urls() serves
+# many users at once from per-user cache entries, falling back to one query for misses;
+# the entry is dropped whenever the profile is saved (see a_users.signals).
+
+NATASHA_USERNAMES = {'natasha', 'natasha-bot'}
+_CLOUDINARY_UPLOAD = '/image/upload/'
+
+
+def _thumb_px() -> int:
+    try:
+        return max(16, int(getattr(settings, 'AVATAR_THUMB_PX', 128)))
+    except Exception:
+        return 128
+
+
+def _cache_seconds() -> int:
+    try:
+        return max(60, int(getattr(settings, 'AVATAR_URL_CACHE_SECONDS', 24 * 60 * 60)))
+    except Exception:
+        return 24 * 60 * 60
+
+
+def _key(user_id: int) -> str:
+    return f"avatar:url:{int(user_id)}"
+
+
+def static_natasha_url() -> str:
+    static_url = (getattr(settings, 'STATIC_URL', '/static/') or '/static/').strip()
+    if not static_url.endswith('/'):
+        static_url += '/'
+    return f"{static_url}natasha.jpeg"
+
+
+def sized_url(url: str) -> str:
+    """Ask Cloudinary for a small square rendition; other storages serve the original."""
+    if 'res.cloudinary.com' not in url or _CLOUDINARY_UPLOAD not in url:
+        return url
+    px = _thumb_px()
+    transform = f"c_fill,g_face,w_{px},h_{px},q_auto,f_auto/"
+    head, tail = url.split(_CLOUDINARY_UPLOAD, 1)
+    return f"{head}{_CLOUDINARY_UPLOAD}{transform}{tail}"
+
+
+def build_avatar_url(profile) -> str:
+    """The URL to store on the profile ('' means the default avatar)."""
+    try:
+        if getattr(getattr(profile, 'user', None), 'username', '') in NATASHA_USERNAMES:
+            return static_natasha_url()
+    except Exception:
+        pass
+    if profile.image:
+        try:
+            return sized_url(profile.image.url)[:500]
+        except Exception:
+            # Storage not configured or the file is missing: default avatar.
+            pass
+    return ''
+
+
+def forget(*user_ids: int) -> None:
+    try:
+        cache.delete_many([_key(uid) for uid in user_ids if uid])
+    except Exception:
+        pass
+
+
+def avatar_urls(user_ids) -> dict[int, str]:
+    """{user_id: avatar URL} for every id, in one cache round-trip plus one query for misses."""
+    from .models import DEFAULT_AVATAR_DATA_URI, Profile
+
+    ids = {int(uid) for uid in user_ids if uid}
+    if not ids:
+        return {}
+    try:
+        cached = cache.get_many([_key(uid) for uid in ids])
+    except Exception:
+        cached = {}
+    out = {uid: cached[_key(uid)] for uid in ids if _key(uid) in cached}
+
+    missing = ids - out.keys()
+    if missing:
+        fresh = {}
+        profiles = Profile.objects.filter(user_id__in=missing).select_related('user').only(
+            'user_id', 'image', 'avatar_url', 'user__username'
+        )
+        for profile in profiles:
+            fresh[profile.user_id] = profile.avatar
+        for uid in missing:
+            fresh.setdefault(uid, DEFAULT_AVATAR_DATA_URI)
+        try:
+            cache.set_many({_key(uid): url for uid, url in fresh.items()}, timeout=_cache_seconds())
+        except Exception:
+            pass
+        out.update(fresh)
+    return out
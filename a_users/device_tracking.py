@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+
+# Cache-gated, batched UserDevice tracking.
+#
+# A (user, UA hash) pair is admitted at most once per
+# USER_DEVICE_TRACKING_THROTTLE_MINUTES via cache.add, so almost every request costs
+# one cache round-trip and no query. Admitted sightings are queued in-process and a
+# ticker thread writes them every USER_DEVICE_TRACKING_FLUSH_SECONDS: one SELECT for
+# the whole batch, then one bulk update and one bulk insert.
+
+DEFAULT_EXCLUDE_PREFIXES = (
+    '/static/',
+    '/media/',
+    '/favicon.ico',
+    '/firebase-messaging-sw.js',
+    '/chat/poll/',
+    '/chat/admin/analytics/live/',
+    '/chat/admin/metrics/ws/',
+    '/api/site/maintenance/status/',
+    '/profile/notifications/dropdown/',
+)
+
+_lock = threading.Lock()
+# (user_id, ua_hash) -> {'user_agent', 'device_label', 'last_ip', 'last_seen'}
+_pending: dict[tuple[int, str], dict] = {}
+_ticker: threading.Thread | None = None
+
+
+def _throttle_seconds() -> int:
+    try:
+        minutes = int(getattr(settings, 'USER_DEVICE_TRACKING_THROTTLE_MINUTES', 10) or 10)
+    except Exception:
+        minutes = 10
+    return max(1, minutes) * 60
+
+
+def _flush_seconds() -> float:
+    try:
+        return max(1.0, float(getattr(settings, 'USER_DEVICE_TRACKING_FLUSH_SECONDS', 5)))
+    except Exception:
+        return 5.0
+
+
+def exclude_prefixes() -> tuple[str, ...]:
+    raw = getattr(settings, 'USER_DEVICE_TRACKING_EXCLUDE_PREFIXES', None)
+    if raw is None:
+        return DEFAULT_EXCLUDE_PREFIXES
+    return tuple(str(p) for p in raw if p)
+
+
+def is_excluded_path(path: str) -> bool:
+    return bool(path) and path.startswith(exclude_prefixes())
+
+
+def note_device(user_id: int, user_agent: str, *, label: str, ip: str | None) -> bool:
+    """Queue a device sighting unless this (user, UA) was seen within the throttle window.
+
+    Returns True when the sighting was queued.
+    """
+    from a_users.models import UserDevice
+
+    ua_hash = UserDevice.hash_user_agent(user_agent)
+    try:
+        if not cache.add(f"user_device:seen:{int(user_id)}:{ua_hash}", 1, timeout=_throttle_seconds()):
+            return False
+    except Exception:
+        return False
+
+    with _lock:
+        _pending[(int(user_id), ua_hash)] = {
+            'user_agent': user_agent,
+            'device_label': label,
+            'last_ip': ip,
+            'last_seen': timezone.now(),
+        }
+    return True
+
+
+def flush_devices() -> int:
+    """Write queued sightings to UserDevice. Returns the number of devices written."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+
+    try:
+        _write(batch)
+    except Exception:
+        # Put the batch back for the next tick, unless a newer sighting replaced it.
+        with _lock:
+            for pair, seen in batch.items():
+                current = _pending.get(pair)
+                if current is None or current['last_seen'] < seen['last_seen']:
+                    _pending[pair] = seen
+        return 0
+    return len(batch)
+
+
+def _write(batch: dict[tuple[int, str], dict]) -> None:
+    from a_users.models import UserDevice
+
+    user_ids = {u for u, _h in batch}
+    hashes = {h for _u, h in batch}
+    existing = {
+        (row.user_id, row.ua_hash): row
+        for row in UserDevice.objects.filter(user_id__in=user_ids, ua_hash__in=hashes).only('id', 'user_id', 'ua_hash')
+    }
+
+    to_update = []
+    to_create = []
+    for (user_id, ua_hash), seen in batch.items():
+        row = existing.get((user_id, ua_hash))
+        if row is None:
+            to_create.append(UserDevice(user_id=user_id, ua_hash=ua_hash, **seen))
+        else:
+            for field, value in seen.items():
+                setattr(row, field, value)
+            to_update.append(row)
+
+    if to_update:
+        UserDevice.objects.bulk_update(
+            to_update, ['user_agent', 'device_label', 'last_ip', 'last_seen'], batch_size=500
+        )
+    if to_create:
+        # A concurrent flush from another process may have inserted the same device.
+        UserDevice.objects.bulk_create(to_create, ignore_conflicts=True, batch_size=500)
+
+
+def _ticker_loop() -> None:
+    while True:
+        time.sleep(_flush_seconds())
+        try:
+            flush_devices()
+        except Exception:
+            pass
+        finally:
+            connection.close()
+
+
+def ensure_flusher() -> None:
+    """Start this process's flush thread (idempotent) and flush on interpreter exit."""
+    global _ticker
+    if _ticker is not None and _ticker.is_alive():
+        return
+    with _lock:
+        if _ticker is not None and _ticker.is_alive():
+            return
+        first_start = _ticker is None
+        _ticker = threading.Thread(target=_ticker_loop, name='device-flush', daemon=True)
+        _ticker.start()
+    if first_start:
+        atexit.register(flush_devices)
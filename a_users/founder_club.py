@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+
+# Founder Club daily-activity rule, evaluated in one batch (see the
+# enforce_founder_club command): after Founder Club is granted, the account must be
+# active at least FOUNDER_CLUB_MIN_ACTIVE_SECONDS_PER_DAY on every day. Missing any
+# completed day revokes it and starts a FOUNDER_CLUB_REAPPLY_COOLDOWN_DAYS cooldown.
+
+REVOKED_MESSAGE = 'Founder Club removed due to inactivity (min 1 hour/day).'
+
+
+def _notice_key(user_id: int) -> str:
+    return f"founder_club:revoked_notice:{int(user_id)}"
+
+
+def pop_revoked_notice(user_id: int) -> bool:
+    """True once after the user's Founder Club was revoked (for a one-time flash message)."""
+    key = _notice_key(user_id)
+    try:
+        if cache.get(key) is None:
+            return False
+        cache.delete(key)
+        return True
+    except Exception:
+        return False
+
+
+def _notify(user_ids: list[int]) -> None:
+    from a_rtchat.models import Notification
+    from a_rtchat.user_flags import notify_flags_changed
+
+    # Revocations are a queryset .update(), which the post_save receiver never sees.
+    notify_flags_changed(*user_ids)
+
+    url = '/profile/'
+    try:
+        Notification.objects.bulk_create(
+            [
+                Notification(user_id=uid, from_user=None, type='support', preview=f"From Vixogram Team: {REVOKED_MESSAGE}"[:180], url=url)
+                for uid in user_ids
+            ],
+            batch_size=500,
+        )
+    except Exception:
+        pass
+
+    try:
+        cache.set_many({_notice_key(uid): 1 for uid in user_ids}, timeout=30 * 24 * 60 * 60)
+    except Exception:
+        pass
+
+    # Realtime toast for anyone online (best-effort).
+    try:
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+    except Exception:
+        channel_layer = None
+    if channel_layer is None:
+        return
+    for uid in user_ids:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"notify_user_{uid}",
+                {
+                    'type': 'support_notify_handler',
+                    'preview': f"From Vixogram Team: {REVOKED_MESSAGE}"[:180],
+                    'url': url,
+                },
+            )
+        except Exception:
+            continue
+
+
+def _good_days_with_buffer(members, *, yesterday: datetime.date, min_seconds: int) -> dict[int, int]:
+    """{user_id: days that met the bar} counting DB totals plus unflushed cached seconds,
+    for the (user_id, last_checked) pairs given (only members about to be revoked)."""
+    from a_users.activity import buffered_seconds
+    from a_users.models import DailyUserActivity
+
+    if not members:
+        return {}
+    since = min(last_checked for _uid, last_checked in members)
+    stored = {
+        (uid, day): secs
+        for uid, day, secs in DailyUserActivity.objects.filter(
+            user_id__in=[uid for uid, _d in members], date__gt=since, date__lte=yesterday
+        ).values_list('user_id', 'date', 'active_seconds')
+    }
+    out = {}
+    for uid, last_checked in members:
+        good = 0
+        day = last_checked + datetime.timedelta(days=1)
+        while day <= yesterday:
+            if stored.get((uid, day), 0) + buffered_seconds(uid, day) >= min_seconds:
+                good += 1
+            day += datetime.timedelta(days=1)
+        out[uid] = good
+    return out
+
+
+def enforce_founder_club(*, today: datetime.date | None = None, dry_run: bool = False) -> dict:
+    """Check every Founder Club member in one pass. Returns counts and the revoked user ids."""
+    from a_users.activity import flush_activity
+    from a_users.models import Profile
+
+    today = today or timezone.localdate()
+    yesterday = today - datetime.timedelta(days=1)
+    min_seconds = int(getattr(settings, 'FOUNDER_CLUB_MIN_ACTIVE_SECONDS_PER_DAY', 3600) or 3600)
+    cooldown_days = int(getattr(settings, 'FOUNDER_CLUB_REAPPLY_COOLDOWN_DAYS', 20) or 20)
+
+    # Seconds still buffered in the cache count too. The flush is a no-op while another
+    # process holds the flush lock, so members who look short are re-checked below with
+    # their buffered seconds added.
+    if not dry_run:
+        try:
+            flush_activity()
+        except Exception:
+            pass
+
+    members = Profile.objects.filter(is_founder_club=True)
+
+    # New members start being checked from today; they can't have missed a day yet.
+    initialized = 0
+    if not dry_run:
+        initialized = members.filter(founder_club_last_checked__isnull=True).update(founder_club_last_checked=today)
+
+    # Completed days owed since each member's last check, against the days that met the bar.
+    due = list(
+        members.filter(founder_club_last_checked__lt=today)
+        .annotate(
+            good_days=Count(
+                'user__daily_activity',
+                filter=Q(
+                    user__daily_activity__date__gt=F('founder_club_last_checked'),
+                    user__daily_activity__date__lte=yesterday,
+                    user__daily_activity__active_seconds__gte=min_seconds,
+                ),
+            )
+        )
+        .values_list('id', 'user_id', 'founder_club_last_checked', 'good_days')
+    )
+
+    short = [
+        (user_id, last_checked)
+        for _pid, user_id, last_checked, good_days in due
+        if int(good_days or 0) < (yesterday - last_checked).days
+    ]
+    buffered_good_days = _good_days_with_buffer(short, yesterday=yesterday, min_seconds=min_seconds)
+
+    revoke_ids = []
+    revoke_user_ids = []
+    ok_ids = []
+    for profile_id, user_id, last_checked, good_days in due:
+        owed = (yesterday - last_checked).days
+        good_days = max(int(good_days or 0), buffered_good_days.get(user_id, 0))
+        if good_days < owed:
+            revoke_ids.append(profile_id)
+            revoke_user_ids.append(user_id)
+        else:
+            ok_ids.append(profile_id)
+
+    if not dry_run:
+        now = timezone.now()
+        if revoke_ids:
+            Profile.objects.filter(id__in=revoke_ids, is_founder_club=True).update(
+                is_founder_club=False,
+                founder_club_revoked_at=now,
+                founder_club_reapply_available_at=now + datetime.timedelta(days=cooldown_days),
+                founder_club_last_checked=today,
+            )
+            _notify(revoke_user_ids)
+        if ok_ids:
+            Profile.objects.filter(id__in=ok_ids).update(founder_club_last_checked=today)
+
+    return {
+        'checked': len(due),
+        'initialized': initialized,
+        'revoked': len(revoke_ids),
+        'revoked_user_ids': revoke_user_ids,
+    }
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from a_users.avatars import NATASHA_USERNAMES, build_avatar_url, forget
+from a_users.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Build Profile.avatar_url for profiles saved before it existed (or after "
+        "AVATAR_THUMB_PX / media storage changed, with --all)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild every profile, not just missing URLs.")
+        parser.add_argument("--batch", type=int, default=500, help="Profiles written per batch (default: 500)")
+
+    def handle(self, *args, **options):
+        batch_size = max(1, int(options.get("batch") or 1))
+        qs = Profile.objects.select_related('user').only('id', 'user_id', 'image', 'avatar_url', 'user__username')
+        if not options.get("all"):
+            qs = qs.filter(avatar_url='').filter(
+                (Q(image__isnull=False) & ~Q(image='')) | Q(user__username__in=NATASHA_USERNAMES)
+            )
+
+        updated = 0
+        pending = []
+        for profile in qs.order_by('id').iterator(chunk_size=batch_size):
+            url = build_avatar_url(profile)
+            if url == profile.avatar_url:
+                continue
+            profile.avatar_url = url
+            pending.append(profile)
+            if len(pending) >= batch_size:
+                updated += self._write(pending)
+                pending = []
+        if pending:
+            updated += self._write(pending)
+        self.stdout.write(f"backfill_avatar_urls: {updated} profiles")
+
+    def _write(self, profiles) -> int:
+        Profile.objects.bulk_update(profiles, ['avatar_url'])
+        forget(*(p.user_id for p in profiles))
+        return len(profiles)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_users.founder_club import enforce_founder_club
+
+
+class Command(BaseCommand):
+    help = (
+        "Revoke Founder Club for members who missed the daily activity minimum on any "
+        "completed day since their last check, and notify them. Safe to run hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report who would be revoked.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = bool(options.get("dry_run"))
+        result = enforce_founder_club(dry_run=dry_run)
+        prefix = "[dry-run] " if dry_run else ""
+        self.stdout.write(
+            f"{prefix}enforce_founder_club: checked={result['checked']} "
+            f"initialized={result['initialized']} revoked={result['revoked']}"
+        )
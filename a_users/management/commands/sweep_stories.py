@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from a_users.stories import sweep_expired_stories
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired stories in bulk, remove their image files from storage with "
+        "bounded parallelism, and rebuild the active-story index. Safe to run often."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=500,
+            help="Stories deleted per batch (default: 500)",
+        )
+
+    def handle(self, *args, **options):
+        batch = max(1, int(options.get("batch") or 1))
+        result = sweep_expired_stories(batch_size=batch)
+        self.stdout.write(
+            f"sweep_stories: deleted={result['deleted']} "
+            f"files_deleted={result['files_deleted']} files_failed={result['files_failed']}"
+        )
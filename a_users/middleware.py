@@ -3,10 +3,6 @@ from __future__ import annotations
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.shortcuts import redirect
-from django.utils import timezone
-from django.conf import settings
-import datetime
-from datetime import timedelta
 
 
 class ActiveUserRequiredMiddleware:
@@ -32,11 +28,11 @@ class ActiveUserRequiredMiddleware:
 
 
 class FounderClubEnforcementMiddleware:
-    """Enforce Founder Club daily activity requirement.
+    """Tell a user, once, that their Founder Club was revoked.
 
-    Rule: after Founder Club is granted, the account must be active at least
-    N seconds per day (default 1 hour). If they miss any day, revoke and set
-    a reapply cooldown.
+    The daily-activity rule itself is enforced in bulk by the
+    `enforce_founder_club` management command (a_users.founder_club); this only
+    reads a cache flag the batch leaves behind, so requests do no DB work here.
     """
 
     def __init__(self, get_response):
@@ -46,58 +42,10 @@ class FounderClubEnforcementMiddleware:
         user = getattr(request, 'user', None)
         if user is not None and getattr(user, 'is_authenticated', False):
             try:
-                profile = getattr(user, 'profile', None)
-                if profile and bool(getattr(profile, 'is_founder_club', False)):
-                    today = timezone.localdate()
-                    last_checked = getattr(profile, 'founder_club_last_checked', None)
-                    if last_checked is None:
-                        # Initialize and avoid revoking immediately.
-                        profile.founder_club_last_checked = today
-                        profile.save(update_fields=['founder_club_last_checked'])
-                    elif last_checked < today:
-                        from a_users.models import DailyUserActivity
-
-                        min_seconds = int(getattr(settings, 'FOUNDER_CLUB_MIN_ACTIVE_SECONDS_PER_DAY', 3600) or 3600)
-                        cooldown_days = int(getattr(settings, 'FOUNDER_CLUB_REAPPLY_COOLDOWN_DAYS', 20) or 20)
-
-                        # Check each missed day from (last_checked) up to yesterday.
-                        violated = False
-                        check_day = last_checked + datetime.timedelta(days=1)
-                        # Check completed days only (up to yesterday)
-                        yesterday = today - datetime.timedelta(days=1)
-                        while check_day <= yesterday:
-                            secs = 0
-                            try:
-                                row = DailyUserActivity.objects.filter(user=user, date=check_day).first()
-                                secs = int(getattr(row, 'active_seconds', 0) or 0)
-                            except Exception:
-                                secs = 0
-
-                            if secs < min_seconds:
-                                violated = True
-                                break
-
-                            check_day = check_day + datetime.timedelta(days=1)
-
-                        if violated:
-                            now = timezone.now()
-                            profile.is_founder_club = False
-                            profile.founder_club_revoked_at = now
-                            profile.founder_club_reapply_available_at = now + datetime.timedelta(days=cooldown_days)
-                            profile.founder_club_last_checked = today
-                            profile.save(update_fields=[
-                                'is_founder_club',
-                                'founder_club_revoked_at',
-                                'founder_club_reapply_available_at',
-                                'founder_club_last_checked',
-                            ])
-                            try:
-                                messages.error(request, 'Founder Club removed due to inactivity (min 1 hour/day).')
-                            except Exception:
-                                pass
-                        else:
-                            profile.founder_club_last_checked = today
-                            profile.save(update_fields=['founder_club_last_checked'])
+                from a_users.founder_club import REVOKED_MESSAGE, pop_revoked_notice
+
+                if pop_revoked_notice(user.id):
+                    messages.error(request, REVOKED_MESSAGE)
             except Exception:
                 pass
 
@@ -159,7 +107,9 @@ class UserDeviceTrackingMiddleware:
     """Record/update a user's device based on User-Agent.
 
     Runs after the response to keep request path fast.
-    Throttles writes per (user, UA) to avoid DB spam.
+    A cache gate admits each (user, UA) once per throttle window, and admitted
+    sightings are written in batches off the request path (a_users.device_tracking).
+    Paths under USER_DEVICE_TRACKING_EXCLUDE_PREFIXES (polls, static) are skipped.
     """
 
     def __init__(self, get_response):
@@ -173,45 +123,22 @@ class UserDeviceTrackingMiddleware:
             if user is None or not getattr(user, 'is_authenticated', False):
                 return response
 
-            ua = (request.META.get('HTTP_USER_AGENT') or '').strip()[:300]
-            if not ua:
-                return response
-
-            from a_users.models import UserDevice
+            from a_users import device_tracking
 
-            now = timezone.now()
-            throttle_minutes = int(getattr(settings, 'USER_DEVICE_TRACKING_THROTTLE_MINUTES', 10) or 10)
-            cutoff = now - timedelta(minutes=max(1, throttle_minutes))
-
-            ua_hash = UserDevice.hash_user_agent(ua)
-            row = (
-                UserDevice.objects
-                .filter(user_id=user.id, ua_hash=ua_hash)
-                .only('id', 'last_seen')
-                .first()
-            )
+            if device_tracking.is_excluded_path(getattr(request, 'path', '') or ''):
+                return response
 
-            if row is not None and getattr(row, 'last_seen', None) and row.last_seen >= cutoff:
+            ua = (request.META.get('HTTP_USER_AGENT') or '').strip()[:300]
+            if not ua:
                 return response
 
-            label = _describe_user_agent(ua)
-            ip = _get_client_ip_best_effort(request)
-
-            if row is None:
-                UserDevice.objects.create(
-                    user_id=user.id,
-                    ua_hash=ua_hash,
-                    user_agent=ua,
-                    device_label=label,
-                    last_ip=ip,
-                )
-            else:
-                UserDevice.objects.filter(pk=row.pk).update(
-                    user_agent=ua,
-                    device_label=label,
-                    last_ip=ip,
-                    last_seen=now,
-                )
+            if device_tracking.note_device(
+                user.id,
+                ua,
+                label=_describe_user_agent(ua),
+                ip=_get_client_ip_best_effort(request),
+            ):
+                device_tracking.ensure_flusher()
         except Exception:
             # Never break the request if tracking fails.
             return response
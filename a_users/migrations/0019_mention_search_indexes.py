@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# Case-insensitive prefix indexes for @mention autocomplete. Django compiles
+# `istartswith` on PostgreSQL to `UPPER(col::text) LIKE UPPER(%s)`, so the indexes are on
+# that exact expression; text_pattern_ops keeps LIKE 'prefix%' indexable under any
+# collation. Other backends are left alone.
+INDEXES = (
+    ('auth_user_username_upper_prefix', 'auth_user', 'username'),
+    ('a_users_profile_displayname_upper_prefix', 'a_users_profile', 'displayname'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" (UPPER("{column}"::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _table, _column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_users', '0018_profile_location'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, reverse_code=drop_indexes),
+    ]
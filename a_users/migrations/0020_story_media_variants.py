@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-19 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_users', '0019_mention_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='image_display',
+            field=models.ImageField(blank=True, null=True, upload_to='stories/variants/'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='image_mime',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='image_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='image_thumb',
+            field=models.ImageField(blank=True, null=True, upload_to='stories/variants/'),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
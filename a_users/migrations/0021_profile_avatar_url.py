@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_users', '0020_story_media_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
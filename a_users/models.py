@@ -1,17 +1,20 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models import Q
-from django.conf import settings
 from django.utils import timezone
 
 from datetime import timedelta
 
+from django_cleanup import cleanup
+
 import base64
 import hashlib
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    # Rebuilt from `image` on save (a_users.avatars); '' means the default avatar.
+    avatar_url = models.CharField(max_length=500, blank=True, default='')
     cover_image = models.ImageField(upload_to='profile_covers/', null=True, blank=True)
     displayname = models.CharField(max_length=20, null=True, blank=True)
     info = models.TextField(null=True, blank=True) 
@@ -50,23 +53,25 @@ class Profile(models.Model):
     # Iska gap (indent) ab sahi hai, ye 'name' ke barabar hona chahiye
     @property
     def avatar(self):
-        # Special-case: Natasha bot DP from static.
-        try:
-            if getattr(getattr(self, 'user', None), 'username', '') in {'natasha', 'natasha-bot'}:
-                static_url = (getattr(settings, 'STATIC_URL', '/static/') or '/static/').strip()
-                if not static_url.endswith('/'):
-                    static_url += '/'
-                return f"{static_url}natasha.jpeg"
-        except Exception:
-            pass
+        if self.avatar_url:
+            return self.avatar_url
+        # Not built yet (rows from before avatar_url; see backfill_avatar_urls).
+        from .avatars import build_avatar_url
 
-        if self.image:
-            try:
-                return self.image.url
-            except Exception:
-                # If storage isn't configured or the file is missing, fall back to default.
-                pass
-        return DEFAULT_AVATAR_DATA_URI
+        return build_avatar_url(self) or DEFAULT_AVATAR_DATA_URI
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The final storage name only exists once the file is committed by save().
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' not in update_fields:
+            return
+        from .avatars import build_avatar_url
+
+        url = build_avatar_url(self)
+        if url != self.avatar_url:
+            self.avatar_url = url
+            type(self).objects.filter(pk=self.pk).update(avatar_url=url)
 
     @property
     def cover_url(self) -> str | None:
@@ -78,6 +83,9 @@ class Profile(models.Model):
             return None
 
 
+# Story files are deleted by Story.delete(), in bulk by the expiry sweep, and by the
+# post_delete receiver in a_users.signals for any other delete - not by django-cleanup.
+@cleanup.ignore
 class Story(models.Model):
     """Image-only stories.
 
@@ -92,6 +100,13 @@ class Story(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stories')
     image = models.ImageField(upload_to='stories/', null=False, blank=False)
+    # Filled in off the request path by a_rtchat.media_pipeline.
+    image_display = models.ImageField(upload_to='stories/variants/', null=True, blank=True)
+    image_thumb = models.ImageField(upload_to='stories/variants/', null=True, blank=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_mime = models.CharField(max_length=100, blank=True, default='')
+    image_size = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
@@ -110,13 +125,21 @@ class Story(models.Model):
                 self.expires_at = None
         return super().save(*args, **kwargs)
 
+    @property
+    def display_url(self):
+        """Metadata-free, downscaled image when processed; the original otherwise."""
+        if self.image_display:
+            return self.image_display.url
+        return self.image.url if self.image else ''
+
     def delete(self, using=None, keep_parents=False):
-        # Ensure the underlying file is removed from storage when the DB row is deleted.
-        try:
-            if getattr(self, 'image', None):
-                self.image.delete(save=False)
-        except Exception:
-            pass
+        # Ensure the underlying files are removed from storage when the DB row is deleted.
+        for f in (self.image, self.image_display, self.image_thumb):
+            try:
+                if f:
+                    f.delete(save=False)
+            except Exception:
+                pass
         return super().delete(using=using, keep_parents=keep_parents)
 
     def __str__(self):
@@ -1,4 +1,4 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 try:
@@ -6,11 +6,15 @@ try:
 except Exception:  # pragma: no cover
     django_user_logged_in = None
 from django.conf import settings
+from django.db import transaction
 from django.db.models import F
 from django.utils import timezone
 import os
 from .models import Profile
 from .models import Referral
+from .models import Story
+from . import avatars
+from . import stories
 
 try:
     from django.core import signing
@@ -43,6 +47,58 @@ def ensure_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
+# Cached avatar URLs (a_users.avatars)
+@receiver(post_save, sender=Profile)
+def avatar_url_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: avatars.forget(user_id))
+
+
+# Open sockets keep a snapshot of the user's flags (a_rtchat.user_flags); push the new
+# values on any save that may have changed one, including admin and shell edits.
+@receiver(post_save, sender=Profile)
+def profile_flags_changed(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or created:
+        return
+    from a_rtchat.user_flags import FLAG_FIELDS, notify_flags_changed
+
+    if update_fields is not None and not set(update_fields) & set(FLAG_FIELDS):
+        return
+    notify_flags_changed(instance.user_id)
+
+
+# Active-story index (a_users.stories)
+@receiver(post_save, sender=Story)
+def story_index_added(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    user_id, created_at, expires_at = instance.user_id, instance.created_at, instance.expires_at
+    transaction.on_commit(lambda: stories.note_story_added(user_id, created_at, expires_at))
+
+
+@receiver(post_delete, sender=Story)
+def story_index_removed(sender, instance, **kwargs):
+    # The sweeper rebuilds the index once at the end instead.
+    if stories.is_sweeping():
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: stories.refresh_user(user_id))
+
+
+@receiver(post_delete, sender=Story)
+def story_files_removed(sender, instance, **kwargs):
+    # Story is excluded from django-cleanup. Story.delete() clears its own files (the
+    # names are empty by now) and the sweeper deletes each batch's files itself; this
+    # covers the rest: user cascades, admin bulk delete, queryset.delete().
+    if stories.is_sweeping():
+        return
+    names = [f.name for f in (instance.image, instance.image_display, instance.image_thumb) if f and f.name]
+    if names:
+        transaction.on_commit(lambda: stories.delete_story_files(names))
+
+
 if user_signed_up is not None:
     @receiver(user_signed_up)
     def queue_welcome_email(request, user, **kwargs):
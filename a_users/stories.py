@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+
+# Story expiry and the active-story index.
+#
+# Expired stories are removed by a scheduled sweep (the sweep_stories command), never
+# inside a user request: one bulk DELETE per batch, then the image files are deleted
+# from storage on a small thread pool, STORY_SWEEP_STORAGE_WORKERS at a time. Until the
+# sweep runs, readers simply filter expired stories out.
+#
+# The index maps user id -> [latest active story's created_at (ISO), timestamp its last
+# story expires]. It is one cache value, built from a single query on a miss and patched
+# under a short cache lock on add/delete, so the profile page and story ring need no
+# story queries. A patch that can't take the lock drops the index; the next reader
+# rebuilds it.
+
+INDEX_KEY = 'stories:active'
+_LOCK_KEY = 'stories:active:lock'
+
+_local = threading.local()
+
+
+def _index_ttl() -> int:
+    try:
+        return max(60, int(getattr(settings, 'STORY_INDEX_TTL_SECONDS', 6 * 60 * 60)))
+    except Exception:
+        return 6 * 60 * 60
+
+
+def _storage_workers() -> int:
+    try:
+        return max(1, int(getattr(settings, 'STORY_SWEEP_STORAGE_WORKERS', 4)))
+    except Exception:
+        return 4
+
+
+def _ttl() -> timedelta:
+    from .models import Story
+
+    return timedelta(hours=int(getattr(Story, 'TTL_HOURS', 24)))
+
+
+def active_q(now) -> Q:
+    """Stories still visible at `now` (a missing expires_at means created_at + TTL)."""
+    return Q(expires_at__gt=now) | Q(expires_at__isnull=True, created_at__gte=now - _ttl())
+
+
+def expired_q(now) -> Q:
+    return Q(expires_at__lte=now) | Q(expires_at__isnull=True, created_at__lt=now - _ttl())
+
+
+def _load(user_ids=None) -> dict:
+    from .models import Story
+
+    qs = Story.objects.filter(active_q(timezone.now()))
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+
+    latest = {}
+    until = {}
+    for user_id, created_at, expires_at in qs.values_list('user_id', 'created_at', 'expires_at'):
+        ends = expires_at or (created_at + _ttl())
+        if user_id not in latest or created_at > latest[user_id]:
+            latest[user_id] = created_at
+        until[user_id] = max(until.get(user_id, 0.0), ends.timestamp())
+    return {uid: [latest[uid].isoformat(), until[uid]] for uid in latest}
+
+
+def active_index() -> dict:
+    try:
+        index = cache.get(INDEX_KEY)
+    except Exception:
+        index = None
+    if index is None:
+        index = _load()
+        try:
+            cache.set(INDEX_KEY, index, timeout=_index_ttl())
+        except Exception:
+            pass
+    return index
+
+
+def active_story_version(user_id: int, *, now=None) -> str:
+    """Version string of the user's active stories ('' when there are none)."""
+    entry = active_index().get(int(user_id))
+    if not entry:
+        return ''
+    now = now or timezone.now()
+    return entry[0] if entry[1] > now.timestamp() else ''
+
+
+def _patch(fn) -> None:
+    try:
+        locked = cache.add(_LOCK_KEY, '1', timeout=5)
+    except Exception:
+        locked = False
+    if not locked:
+        try:
+            cache.delete(INDEX_KEY)
+        except Exception:
+            pass
+        return
+    try:
+        index = cache.get(INDEX_KEY)
+        # No index yet: the next reader builds a complete one.
+        if index is not None:
+            fn(index)
+            cache.set(INDEX_KEY, index, timeout=_index_ttl())
+    except Exception:
+        try:
+            cache.delete(INDEX_KEY)
+        except Exception:
+            pass
+    finally:
+        try:
+            cache.delete(_LOCK_KEY)
+        except Exception:
+            pass
+
+
+def note_story_added(user_id: int, created_at, expires_at) -> None:
+    uid = int(user_id)
+    ends = (expires_at or (created_at + _ttl())).timestamp()
+
+    def _apply(index):
+        current = index.get(uid)
+        index[uid] = [created_at.isoformat(), max(ends, current[1] if current else 0.0)]
+
+    _patch(_apply)
+
+
+def refresh_user(user_id: int) -> None:
+    """Re-read one user's active stories into the index (after a delete)."""
+    uid = int(user_id)
+    fresh = _load([uid]).get(uid)
+
+    def _apply(index):
+        if fresh:
+            index[uid] = fresh
+        else:
+            index.pop(uid, None)
+
+    _patch(_apply)
+
+
+def is_sweeping() -> bool:
+    """True while this thread runs a sweep (per-story index patches are skipped)."""
+    return bool(getattr(_local, 'sweeping', False))
+
+
+def _delete_files(storage, names: list[str]) -> int:
+    def _one(name):
+        try:
+            storage.delete(name)
+            return True
+        except Exception:
+            return False
+
+    if not names:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(_storage_workers(), len(names))) as pool:
+        return sum(pool.map(_one, names))
+
+
+def delete_story_files(names: list[str]) -> int:
+    """Remove a deleted story's image files (for deletes that bypass Story.delete())."""
+    from .models import Story
+
+    return _delete_files(Story._meta.get_field('image').storage, [n for n in names if n])
+
+
+def sweep_expired_stories(*, now=None, batch_size: int = 500) -> dict:
+    """Delete expired stories and their image files. Returns counts."""
+    from .models import Story
+
+    now = now or timezone.now()
+    batch_size = max(1, int(batch_size))
+    storage = Story._meta.get_field('image').storage
+
+    deleted = 0
+    files_deleted = 0
+    files_failed = 0
+    _local.sweeping = True
+    try:
+        while True:
+            rows = list(
+                Story.objects.filter(expired_q(now)).order_by('id').values_list('id', 'image', 'image_display', 'image_thumb')[:batch_size]
+            )
+            if not rows:
+                break
+            # Rows go first so nothing can still point at a file being deleted.
+            Story.objects.filter(id__in=[row[0] for row in rows]).delete()
+            deleted += len(rows)
+
+            names = [name for row in rows for name in row[1:] if name]
+            ok = _delete_files(storage, names)
+            files_deleted += ok
+            files_failed += len(names) - ok
+            if len(rows) < batch_size:
+                break
+    finally:
+        _local.sweeping = False
+
+    # One rebuild instead of a patch per expired story.
+    try:
+        cache.set(INDEX_KEY, _load(), timeout=_index_ttl())
+    except Exception:
+        pass
+
+    return {'deleted': deleted, 'files_deleted': files_deleted, 'files_failed': files_failed}
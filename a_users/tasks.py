@@ -79,3 +79,19 @@ def send_mention_push_task(
     except Exception:
         # Best-effort: never fail the task hard.
         return
+
+
+@shared_task(bind=True, ignore_result=True)
+def enforce_founder_club_task(self) -> None:
+    """Periodic Founder Club activity check (same pass as the enforce_founder_club command)."""
+    from a_users.founder_club import enforce_founder_club
+
+    enforce_founder_club()
+
+
+@shared_task(bind=True, ignore_result=True)
+def sweep_expired_stories_task(self) -> None:
+    """Periodic story expiry sweep (same pass as the sweep_stories command)."""
+    from a_users.stories import sweep_expired_stories
+
+    sweep_expired_stories()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from django import template
 
+from a_core.runtime_config import beta_feature
 from a_users.models import BetaFeature
 
 register = template.Library()
@@ -13,7 +14,8 @@ def beta_feature_enabled(slug: str) -> bool:
     slug = (slug or '').strip()
     if not slug:
         return False
-    return BetaFeature.objects.filter(slug=slug, is_enabled=True).exists()
+    row = beta_feature(slug)
+    return bool(row and row['is_enabled'])
 
 
 @register.simple_tag(takes_context=True)
@@ -23,11 +25,12 @@ def beta_feature_access(context, slug: str) -> bool:
     if not slug:
         return False
 
-    try:
-        feature = BetaFeature.objects.get(slug=slug)
-    except BetaFeature.DoesNotExist:
+    row = beta_feature(slug)
+    if row is None:
         return False
 
+    # Unsaved instance from the runtime-config snapshot, so the access rule stays on the model.
+    feature = BetaFeature(**row)
     user = context.get('user')
     return feature.is_accessible_by(user)
 
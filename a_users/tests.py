@@ -1,3 +1,264 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+
+from . import avatars, device_tracking, stories
+from .activity import add_active_seconds, buffered_seconds, flush_activity
+from .founder_club import enforce_founder_club, pop_revoked_notice
+from .middleware import FounderClubEnforcementMiddleware, UserDeviceTrackingMiddleware
+from .models import DEFAULT_AVATAR_DATA_URI, DailyUserActivity, Profile, Story, UserDevice
+from a_rtchat.models import Notification
+
+
+class ActivityBufferTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='active_user', password='pass12345')
+
+	def test_seconds_buffer_in_cache_and_flush_in_bulk(self):
+		today = timezone.localdate()
+		# Mid-day, so no session piece crosses midnight.
+		now = int(timezone.make_aware(timezone.datetime(today.year, today.month, today.day, 12)).timestamp())
+		with self.assertNumQueries(0):
+			add_active_seconds(self.user.id, now - 600, now - 300)
+			add_active_seconds(self.user.id, now - 200, now)
+		self.assertFalse(DailyUserActivity.objects.exists())
+		self.assertEqual(buffered_seconds(self.user.id, today), 500)
+
+		self.assertEqual(flush_activity(), 1)
+		self.assertEqual(DailyUserActivity.objects.get(user=self.user, date=today).active_seconds, 500)
+
+		add_active_seconds(self.user.id, now - 100, now)
+		flush_activity()
+		self.assertEqual(DailyUserActivity.objects.get(user=self.user, date=today).active_seconds, 600)
+		self.assertEqual(flush_activity(), 0)
+
+	def test_registration_is_lock_free_and_survives_a_failed_write(self):
+		today = timezone.localdate()
+		now = int(timezone.make_aware(timezone.datetime(today.year, today.month, today.day, 12)).timestamp())
+		other = User.objects.create_user(username='active_user_2', password='pass12345')
+		# A flush holding its lock elsewhere never delays a disconnect.
+		cache.add('activity:flush:lock', 1, timeout=60)
+		with mock.patch('a_users.activity.time.sleep', side_effect=AssertionError('waited')):
+			add_active_seconds(self.user.id, now - 60, now)
+			add_active_seconds(other.id, now - 30, now)
+			add_active_seconds(self.user.id, now - 120, now - 60)
+		self.assertEqual(flush_activity(), 0)
+		cache.delete('activity:flush:lock')
+
+		with mock.patch('a_users.activity._write', side_effect=DatabaseError('db down')):
+			self.assertEqual(flush_activity(), 0)
+		self.assertEqual(flush_activity(), 2)
+		self.assertEqual(DailyUserActivity.objects.get(user=self.user, date=today).active_seconds, 120)
+		self.assertEqual(DailyUserActivity.objects.get(user=other, date=today).active_seconds, 30)
+		self.assertEqual(flush_activity(), 0)
+
+
+
+class FounderClubBatchTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.today = timezone.localdate()
+		self.users = []
+		for name in ('fc_active', 'fc_idle', 'fc_new'):
+			user = User.objects.create_user(username=name, password='pass12345')
+			Profile.objects.get_or_create(user=user)
+			self.users.append(user)
+		active, idle, new = self.users
+		Profile.objects.filter(user__in=[active, idle]).update(
+			is_founder_club=True,
+			founder_club_last_checked=self.today - timedelta(days=3),
+		)
+		Profile.objects.filter(user=new).update(is_founder_club=True, founder_club_last_checked=None)
+		for offset in (1, 2):
+			DailyUserActivity.objects.create(user=active, date=self.today - timedelta(days=offset), active_seconds=4000)
+		DailyUserActivity.objects.create(user=idle, date=self.today - timedelta(days=1), active_seconds=4000)
+
+	def test_batch_revokes_and_notifies_in_one_pass(self):
+		active, idle, new = self.users
+		result = enforce_founder_club(today=self.today)
+		self.assertEqual(result['revoked_user_ids'], [idle.id])
+		self.assertEqual(result['initialized'], 1)
+
+		profiles = {p.user_id: p for p in Profile.objects.filter(user__in=self.users)}
+		self.assertTrue(profiles[active.id].is_founder_club)
+		self.assertFalse(profiles[idle.id].is_founder_club)
+		self.assertIsNotNone(profiles[idle.id].founder_club_reapply_available_at)
+		self.assertEqual(profiles[new.id].founder_club_last_checked, self.today)
+		self.assertTrue(Notification.objects.filter(user=idle, type='support').exists())
+
+		self.assertTrue(pop_revoked_notice(idle.id))
+
+	def test_buffered_seconds_count_when_another_process_is_flushing(self):
+		active, idle, new = self.users
+		yesterday = self.today - timedelta(days=1)
+		noon = int(timezone.make_aware(timezone.datetime(yesterday.year, yesterday.month, yesterday.day, 12)).timestamp())
+		Profile.objects.filter(user=idle).update(founder_club_last_checked=self.today - timedelta(days=2))
+		DailyUserActivity.objects.filter(user=idle).update(active_seconds=600)
+		add_active_seconds(idle.id, noon - 3000, noon)
+		cache.add('activity:flush:lock', 1, timeout=60)
+
+		result = enforce_founder_club(today=self.today)
+		self.assertEqual(result['revoked_user_ids'], [])
+		self.assertTrue(Profile.objects.get(user=idle).is_founder_club)
+		self.assertFalse(pop_revoked_notice(idle.id))
+		# Already checked today: a second run is a no-op.
+		self.assertEqual(enforce_founder_club(today=self.today)['checked'], 0)
+
+	def test_middleware_does_no_db_work(self):
+		active, idle, _new = self.users
+		enforce_founder_club(today=self.today)
+		middleware = FounderClubEnforcementMiddleware(lambda request: 'ok')
+
+		for user in (active, idle):
+			request = RequestFactory().get('/')
+			request.user = user
+			request.session = {}
+			request._messages = FallbackStorage(request)
+			with self.assertNumQueries(0):
+				self.assertEqual(middleware(request), 'ok')
+			self.assertEqual(len(request._messages), 1 if user == idle else 0)
+
+
+class DeviceTrackingTests(TestCase):
+	UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0 Safari/537.36'
+
+	def setUp(self):
+		cache.clear()
+		device_tracking._pending.clear()
+		self.user = User.objects.create_user(username='device_user', password='pass12345')
+
+	def test_sightings_are_throttled_in_cache_and_written_in_bulk(self):
+		with self.assertNumQueries(0):
+			self.assertTrue(device_tracking.note_device(self.user.id, self.UA, label='Chrome on Windows', ip='10.0.0.1'))
+			self.assertFalse(device_tracking.note_device(self.user.id, self.UA, label='Chrome on Windows', ip='10.0.0.2'))
+		self.assertFalse(UserDevice.objects.exists())
+
+		self.assertEqual(device_tracking.flush_devices(), 1)
+		device = UserDevice.objects.get(user=self.user)
+		self.assertEqual(device.device_label, 'Chrome on Windows')
+		self.assertEqual(device.last_ip, '10.0.0.1')
+
+		cache.clear()
+		device_tracking.note_device(self.user.id, self.UA, label='Chrome on Windows', ip='10.0.0.3')
+		device_tracking.flush_devices()
+		self.assertEqual(UserDevice.objects.get(user=self.user).last_ip, '10.0.0.3')
+
+	def test_failed_flush_keeps_the_batch_for_the_next_tick(self):
+		device_tracking.note_device(self.user.id, self.UA, label='Chrome on Windows', ip='10.0.0.1')
+		with mock.patch.object(UserDevice.objects, 'bulk_create', side_effect=DatabaseError('db down')):
+			self.assertEqual(device_tracking.flush_devices(), 0)
+		self.assertEqual(len(device_tracking._pending), 1)
+
+		self.assertEqual(device_tracking.flush_devices(), 1)
+		self.assertEqual(UserDevice.objects.get(user=self.user).last_ip, '10.0.0.1')
+
+	def test_middleware_skips_excluded_paths(self):
+		middleware = UserDeviceTrackingMiddleware(lambda request: 'ok')
+		for path, queued in (('/chat/poll/public-chat', False), ('/profile/', True)):
+			request = RequestFactory().get(path, HTTP_USER_AGENT=self.UA)
+			request.user = self.user
+			with mock.patch.object(device_tracking, 'ensure_flusher'), self.assertNumQueries(0):
+				middleware(request)
+			self.assertEqual(bool(device_tracking._pending), queued)
+
+
+class StorySweepTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.active = User.objects.create_user(username='story_active', password='pass12345')
+		self.stale = User.objects.create_user(username='story_stale', password='pass12345')
+		now = timezone.now()
+		with self.captureOnCommitCallbacks(execute=True):
+			self.story = Story.objects.create(user=self.active, image='stories/fresh.jpg')
+			for name in ('stories/old-1.jpg', 'stories/old-2.jpg'):
+				Story.objects.create(user=self.stale, image=name, expires_at=now - timedelta(minutes=5))
+
+	def test_index_answers_ring_checks_without_queries(self):
+		stories.active_index()
+		with self.assertNumQueries(0):
+			self.assertEqual(stories.active_story_version(self.active.id), self.story.created_at.isoformat())
+			self.assertEqual(stories.active_story_version(self.stale.id), '')
+
+		self.client.force_login(self.stale)
+		with CaptureQueriesContext(connection) as ctx:
+			resp = self.client.get(reverse('profile-user', args=[self.active.username]))
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.context['has_active_stories'])
+		self.assertFalse([q for q in ctx.captured_queries if 'a_users_story' in q['sql']])
+
+	def test_sweep_deletes_rows_then_files_and_rebuilds_index(self):
+		storage = Story._meta.get_field('image').storage
+		with mock.patch.object(storage, 'delete') as delete:
+			result = stories.sweep_expired_stories(batch_size=1)
+		self.assertEqual(result, {'deleted': 2, 'files_deleted': 2, 'files_failed': 0})
+		self.assertEqual(sorted(c.args[0] for c in delete.call_args_list), ['stories/old-1.jpg', 'stories/old-2.jpg'])
+		self.assertEqual(list(Story.objects.values_list('id', flat=True)), [self.story.id])
+		self.assertEqual(set(cache.get(stories.INDEX_KEY)), {self.active.id})
+
+		with mock.patch.object(storage, 'delete') as delete, self.captureOnCommitCallbacks(execute=True):
+			Story.objects.filter(pk=self.story.pk).delete()
+		self.assertEqual(stories.active_story_version(self.active.id), '')
+		delete.assert_called_once_with('stories/fresh.jpg')
+
+	def test_cascade_deletes_remove_story_files(self):
+		storage = Story._meta.get_field('image').storage
+		Story.objects.filter(user=self.stale).update(image_display='stories/variants/old.webp')
+		with mock.patch.object(storage, 'delete') as delete, self.captureOnCommitCallbacks(execute=True):
+			self.stale.delete()
+		self.assertEqual(
+			sorted(c.args[0] for c in delete.call_args_list),
+			['stories/old-1.jpg', 'stories/old-2.jpg', 'stories/variants/old.webp', 'stories/variants/old.webp'],
+		)
+
+
+class AvatarUrlTests(TestCase):
+	CLOUDINARY = 'https://res.cloudinary.com/demo/image/upload/v1/media/{}'
+
+	def setUp(self):
+		cache.clear()
+		self.storage = Profile._meta.get_field('image').storage
+		self.alice = User.objects.create_user(username='avatar_alice', password='pass12345')
+		self.bob = User.objects.create_user(username='avatar_bob', password='pass12345')
+
+	def _set_image(self, user, name):
+		profile = user.profile
+		profile.image = name
+		with mock.patch.object(self.storage, 'url', side_effect=self.CLOUDINARY.format), \
+			self.captureOnCommitCallbacks(execute=True):
+			profile.save()
+		return profile
+
+	def test_url_is_built_on_save_as_a_sized_rendition(self):
+		profile = self._set_image(self.alice, 'avatars/a.jpg')
+		expected = 'https://res.cloudinary.com/demo/image/upload/c_fill,g_face,w_128,h_128,q_auto,f_auto/v1/media/avatars/a.jpg'
+		self.assertEqual(profile.avatar_url, expected)
+		self.assertEqual(Profile.objects.get(pk=profile.pk).avatar_url, expected)
+
+		with mock.patch.object(self.storage, 'url', side_effect=AssertionError('storage url')):
+			self.assertEqual(Profile.objects.get(pk=profile.pk).avatar, expected)
+			self.assertEqual(self.bob.profile.avatar, DEFAULT_AVATAR_DATA_URI)
+
+		natasha = User.objects.create_user(username='natasha', password='pass12345')
+		self.assertEqual(natasha.profile.avatar_url, '/static/natasha.jpeg')
+
+	def test_bulk_lookup_is_cached_and_refreshed_on_change(self):
+		self._set_image(self.alice, 'avatars/a.jpg')
+		with self.assertNumQueries(1):
+			urls = avatars.avatar_urls([self.alice.id, self.bob.id, 999999])
+		self.assertIn('avatars/a.jpg', urls[self.alice.id])
+		self.assertEqual(urls[self.bob.id], DEFAULT_AVATAR_DATA_URI)
+		self.assertEqual(urls[999999], DEFAULT_AVATAR_DATA_URI)
+		with self.assertNumQueries(0):
+			self.assertEqual(avatars.avatar_urls([self.alice.id, self.bob.id]), {self.alice.id: urls[self.alice.id], self.bob.id: urls[self.bob.id]})
+
+		self._set_image(self.bob, 'avatars/b.png')
+		self.assertIn('avatars/b.png', avatars.avatar_urls([self.bob.id])[self.bob.id])
 
-# Create your tests here.
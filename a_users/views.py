@@ -2,7 +2,6 @@ import json
 import base64
 import re
 import uuid
-from datetime import timedelta
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
@@ -10,7 +9,6 @@ from django.contrib import messages
 from django.conf import settings
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from django.db.models import Q
 
 from .models import Profile, Story
 from .forms import ProfileForm
@@ -47,6 +45,8 @@ from a_users.models import UserReport
 from a_users.models import SupportEnquiry
 from a_users.models import Referral
 from a_users.badges import VERIFIED_FOLLOWERS_THRESHOLD, get_verified_user_ids
+from a_rtchat.media_pipeline import sanitize_upload, schedule as schedule_media
+from a_users.stories import active_q as story_active_q, active_story_version as active_story_version_for
 
 try:
     from a_rtchat.models import Notification
@@ -174,24 +174,8 @@ def profile_view(request, username=None):
     can_view_stories = bool((not is_private) or is_owner or is_following)
     if can_view_stories:
         try:
-            now = timezone.now()
-            legacy_cutoff = now - timedelta(hours=int(getattr(Story, 'TTL_HOURS', 24)))
-            active_qs = (
-                Story.objects
-                .filter(user=profile_user)
-                .filter(
-                    Q(expires_at__gt=now)
-                    | Q(expires_at__isnull=True, created_at__gte=legacy_cutoff)
-                )
-            )
-            has_active_stories = active_qs.exists()
-            if has_active_stories:
-                latest = active_qs.order_by('-created_at').values_list('created_at', flat=True).first()
-                if latest:
-                    try:
-                        active_story_version = latest.isoformat()
-                    except Exception:
-                        active_story_version = str(latest)
+            active_story_version = active_story_version_for(profile_user.id)
+            has_active_stories = bool(active_story_version)
         except Exception:
             has_active_stories = False
             active_story_version = ''
@@ -269,45 +253,21 @@ def user_stories_json_view(request, username: str):
 
     now = timezone.now()
 
-    def cleanup_expired_for(user_obj):
-        """Best-effort cleanup so expired stories don't linger."""
-        try:
-            cutoff = now - timedelta(hours=getattr(Story, 'TTL_HOURS', 24))
-            expired_qs = (
-                Story.objects
-                .filter(user=user_obj)
-                .filter(
-                    Q(expires_at__lte=now)
-                    | Q(expires_at__isnull=True, created_at__lt=cutoff)
-                )
-            )
-            for s in expired_qs[:200]:
-                try:
-                    s.delete()
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-    # Auto-delete expired stories (lazy cleanup).
-    cleanup_expired_for(profile_user)
-
-    # If expires_at is missing (legacy/edge), treat it as a 24h story.
-    legacy_cutoff = now - timedelta(hours=getattr(Story, 'TTL_HOURS', 24))
-    qs = (
-        Story.objects
-        .filter(user=profile_user)
-        .filter(
-            Q(expires_at__isnull=True, created_at__gte=legacy_cutoff)
-            | Q(expires_at__gt=now)
+    # Expired stories are deleted by the sweep_stories job; here they are only filtered
+    # out. The active-story index skips the query entirely for users with none.
+    qs = Story.objects.none()
+    if active_story_version_for(profile_user.id, now=now):
+        qs = (
+            Story.objects
+            .filter(user=profile_user)
+            .filter(story_active_q(now))
+            .order_by('created_at')
         )
-        .order_by('created_at')
-    )
 
     stories = []
     for s in qs[:40]:
         try:
-            url = s.image.url
+            url = s.display_url
         except Exception:
             url = ''
         if not url:
@@ -365,11 +325,13 @@ def story_delete_view(request, story_id: int):
     return res
 
 
+# 5MB of image, base64-encoded (4 chars per 3 bytes), plus padding slack.
+STORY_CROPPED_B64_MAX_CHARS = (5 * 1024 * 1024 * 4) // 3 + 16
+
+
 @login_required
 def story_add_view(request):
     """Create a new story for the current user (image-only)."""
-    now = timezone.now()
-
     is_htmx = (request.headers.get('HX-Request') == 'true') or (request.META.get('HTTP_HX_REQUEST') == 'true')
     is_modal = bool(request.GET.get('modal') == '1')
 
@@ -406,25 +368,6 @@ def story_add_view(request):
             pass
         return redirect('invite-friends')
 
-    # Opportunistic cleanup for the current user.
-    try:
-        cutoff = now - timedelta(hours=getattr(Story, 'TTL_HOURS', 24))
-        expired_qs = (
-            Story.objects
-            .filter(user=request.user)
-            .filter(
-                Q(expires_at__lte=now)
-                | Q(expires_at__isnull=True, created_at__lt=cutoff)
-            )
-        )
-        for s in expired_qs[:200]:
-            try:
-                s.delete()
-            except Exception:
-                pass
-    except Exception:
-        pass
-
     if request.method == 'POST':
         files = request.FILES
         # If client provided a cropped data URL, prefer it over the raw file.
@@ -435,6 +378,9 @@ def story_add_view(request):
                 if m:
                     mime = (m.group(1) or '').lower()
                     b64 = (m.group(2) or '').strip()
+                    # Refuse to decode anything that can't fit StoryForm's 5MB limit.
+                    if len(b64) > STORY_CROPPED_B64_MAX_CHARS:
+                        raise ValueError('cropped image too large')
                     raw = base64.b64decode(b64)
                     ext = {
                         'image/jpeg': 'jpg',
@@ -452,7 +398,9 @@ def story_add_view(request):
         if form.is_valid():
             story = form.save(commit=False)
             story.user = request.user
+            story.image = sanitize_upload(form.cleaned_data['image'])
             story.save()
+            schedule_media('story', story.id)
             messages.success(request, 'Story added. It will auto-expire in 24 hours.')
             if is_htmx and is_modal:
                 # Close modal + show toast without page navigation.
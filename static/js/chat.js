@@ -388,8 +388,7 @@
         if (!btn || !panel) return;
 
         const gifsAllowed = !!cfg.gifsAllowed;
-        const apiKey = String(cfg.giphyApiKey || '').trim();
-        const limit = parseInt(cfg.giphyLimit || '30', 10) || 30;
+        const gifSearchUrl = String(cfg.gifSearchUrl || '').trim();
 
         const closeBtn = document.getElementById('gif_close');
         const searchInput = document.getElementById('gif_search');
@@ -404,7 +403,7 @@
             return;
         }
 
-        // Mark initialized even if apiKey is missing (we still want a friendly response).
+        // Mark initialized even if GIF search is unavailable (we still want a friendly response).
         window.__vixoGifPickerInitDone = true;
 
         let open = false;
@@ -510,9 +509,8 @@
             }
             const frag = document.createDocumentFragment();
             for (const it of items) {
-                const images = it && it.images ? it.images : null;
-                const url = images && images.fixed_width && images.fixed_width.url ? String(images.fixed_width.url) : '';
-                const thumb = images && images.fixed_width_small && images.fixed_width_small.url ? String(images.fixed_width_small.url) : url;
+                const url = it && it.url ? String(it.url) : '';
+                const thumb = it && it.thumb ? String(it.thumb) : url;
                 if (!url) continue;
                 const b = document.createElement('button');
                 b.type = 'button';
@@ -526,15 +524,15 @@
         }
 
         async function loadTrending() {
-            if (!apiKey) return;
+            if (!gifSearchUrl) return;
             const reqId = ++activeReq;
             renderStatus('Loading trending...');
             try {
-                const url = `https://api.giphy.com/v1/gifs/trending?api_key=${encodeURIComponent(apiKey)}&limit=${encodeURIComponent(String(limit))}`;
-                const resp = await fetch(url, { method: 'GET' });
+                const url = gifSearchUrl;
+                const resp = await fetch(url, { method: 'GET', credentials: 'same-origin' });
                 const data = await resp.json().catch(() => null);
                 if (reqId !== activeReq) return;
-                const items = data && Array.isArray(data.data) ? data.data : [];
+                const items = data && Array.isArray(data.results) ? data.results : [];
                 hasLoadedInitial = true;
                 renderStatus(items.length ? 'Trending GIFs' : 'No trending GIFs');
                 renderResults(items);
@@ -547,7 +545,7 @@
 
         async function search(q) {
             const query = String(q || '').trim();
-            if (!apiKey) return;
+            if (!gifSearchUrl) return;
             if (!query) {
                 renderStatus('Trending GIFs');
                 if (!hasLoadedInitial) await loadTrending();
@@ -557,11 +555,11 @@
             const reqId = ++activeReq;
             renderStatus('Searching...');
             try {
-                const url = `https://api.giphy.com/v1/gifs/search?q=${encodeURIComponent(query)}&api_key=${encodeURIComponent(apiKey)}&limit=${encodeURIComponent(String(limit))}`;
-                const resp = await fetch(url, { method: 'GET' });
+                const url = `${gifSearchUrl}?q=${encodeURIComponent(query)}`;
+                const resp = await fetch(url, { method: 'GET', credentials: 'same-origin' });
                 const data = await resp.json().catch(() => null);
                 if (reqId !== activeReq) return;
-                const items = data && Array.isArray(data.data) ? data.data : [];
+                const items = data && Array.isArray(data.results) ? data.results : [];
                 renderStatus(items.length ? `Results: ${items.length}` : 'No results');
                 renderResults(items);
             } catch {
@@ -577,10 +575,10 @@
             setPanelOpen(next);
             if (!next) return;
 
-            if (!apiKey) {
+            if (!gifSearchUrl) {
                 renderStatus('GIFs are not configured.');
-                renderResultsHtml('<div class="col-span-2 text-xs text-amber-200">Missing Giphy API key.</div>');
-                try { __popup('GIFs not configured', 'Giphy API key is missing in chat config.'); } catch {}
+                renderResultsHtml('<div class="col-span-2 text-xs text-amber-200">GIF search is unavailable.</div>');
+                try { __popup('GIFs not configured', 'GIF search URL is missing in chat config.'); } catch {}
                 return;
             }
 
@@ -609,7 +607,7 @@
 
         if (searchInput) {
             searchInput.addEventListener('input', () => {
-                if (!apiKey) return;
+                if (!gifSearchUrl) return;
                 if (debounceId) window.clearTimeout(debounceId);
                 debounceId = window.setTimeout(() => search(searchInput.value), 250);
             });
@@ -642,8 +640,8 @@
             });
         }
 
-        renderStatus(apiKey ? 'Trending GIFs' : 'GIFs');
-        if (resultsEl && apiKey) {
+        renderStatus(gifSearchUrl ? 'Trending GIFs' : 'GIFs');
+        if (resultsEl && gifSearchUrl) {
             resultsEl.innerHTML = '<div class="col-span-2 text-xs text-gray-400">Opening…</div>';
         }
     })();
@@ -1762,7 +1760,7 @@
                 try { abortController.abort(); } catch (e) {}
             }
             abortController = new AbortController();
-            const resp = await fetch(`${url}?q=${encodeURIComponent(q)}`, {
+            const resp = await fetch(`${url}?q=${encodeURIComponent(q)}&room=${encodeURIComponent(chatroomName)}`, {
                 credentials: 'same-origin',
                 signal: abortController.signal,
                 headers: { 'Accept': 'application/json' },
@@ -3665,7 +3663,13 @@
             if (payload.type === 'reactions' && payload.message_id && payload.html) {
                 const el = document.getElementById(`reactions-${payload.message_id}`);
                 if (el) {
+                    // Only the actor's "reacted" state comes from the server; keep ours otherwise.
+                    const mine = el.querySelector('[data-reacted]');
+                    const myEmoji = mine ? mine.dataset.emoji : '';
                     el.outerHTML = payload.html;
+                    if (myEmoji && parseInt(payload.actor_id || 0, 10) !== currentUserId) {
+                        markOwnReaction(payload.message_id, myEmoji);
+                    }
                 }
                 return;
             }
@@ -3915,6 +3919,17 @@
         });
     }
 
+    function markOwnReaction(messageId, emoji) {
+        const bar = document.getElementById(`reactions-${messageId}`);
+        if (!bar) return;
+        bar.querySelectorAll('[data-react-emoji]').forEach((btn) => {
+            if (btn.dataset.emoji !== emoji) return;
+            btn.dataset.reacted = '1';
+            btn.classList.remove('bg-gray-900/60', 'text-gray-300', 'hover:bg-gray-800/60');
+            btn.classList.add('bg-emerald-500/20', 'text-emerald-300');
+        });
+    }
+
     document.addEventListener('click', function (e) {
         const toggleBtn = e.target.closest('[data-reaction-toggle]');
         const emojiBtn = e.target.closest('[data-react-emoji]');
@@ -5002,7 +5017,7 @@
         document.addEventListener('click', function (e) {
             const el = e.target && e.target.closest ? e.target.closest('img[data-image-viewer]') : null;
             if (!el) return;
-            const src = el.getAttribute('src') || '';
+            const src = el.getAttribute('data-full-src') || el.getAttribute('src') || '';
             if (!src) return;
             e.preventDefault();
             e.stopPropagation();
@@ -5150,10 +5165,9 @@
     (function initGifPicker() {
         if (window.__vixoGifPickerInitDone) return;
         const gifsAllowed = !!cfg.gifsAllowed;
-        const apiKey = String(cfg.giphyApiKey || '').trim();
-        const limit = parseInt(cfg.giphyLimit || '30', 10) || 30;
+        const gifSearchUrl = String(cfg.gifSearchUrl || '').trim();
 
-        if (!gifsAllowed || !apiKey) return;
+        if (!gifsAllowed || !gifSearchUrl) return;
 
         const btn = document.getElementById('gif_btn');
         const panel = document.getElementById('gif_panel');
@@ -5277,9 +5291,8 @@
             }
             const frag = document.createDocumentFragment();
             for (const it of items) {
-                const images = it && it.images ? it.images : null;
-                const url = images && images.fixed_width && images.fixed_width.url ? String(images.fixed_width.url) : '';
-                const thumb = images && images.fixed_width_small && images.fixed_width_small.url ? String(images.fixed_width_small.url) : url;
+                const url = it && it.url ? String(it.url) : '';
+                const thumb = it && it.thumb ? String(it.thumb) : url;
                 if (!url) continue;
                 const b = document.createElement('button');
                 b.type = 'button';
@@ -5314,11 +5327,11 @@
             const reqId = ++activeReq;
             renderStatus('Searching...');
             try {
-                const url = `https://api.giphy.com/v1/gifs/search?q=${encodeURIComponent(query)}&api_key=${encodeURIComponent(apiKey)}&limit=${encodeURIComponent(String(limit))}`;
-                const resp = await fetch(url, { method: 'GET' });
+                const url = `${gifSearchUrl}?q=${encodeURIComponent(query)}`;
+                const resp = await fetch(url, { method: 'GET', credentials: 'same-origin' });
                 const data = await resp.json().catch(() => null);
                 if (reqId !== activeReq) return;
-                const items = data && Array.isArray(data.data) ? data.data : [];
+                const items = data && Array.isArray(data.results) ? data.results : [];
                 renderStatus(items.length ? `Results: ${items.length}` : 'No results');
                 renderResults(items);
             } catch {
@@ -5332,11 +5345,11 @@
             const reqId = ++activeReq;
             renderStatus('Loading trending...');
             try {
-                const url = `https://api.giphy.com/v1/gifs/trending?api_key=${encodeURIComponent(apiKey)}&limit=${encodeURIComponent(String(limit))}`;
-                const resp = await fetch(url, { method: 'GET' });
+                const url = gifSearchUrl;
+                const resp = await fetch(url, { method: 'GET', credentials: 'same-origin' });
                 const data = await resp.json().catch(() => null);
                 if (reqId !== activeReq) return;
-                const items = data && Array.isArray(data.data) ? data.data : [];
+                const items = data && Array.isArray(data.results) ? data.results : [];
                 hasLoadedInitial = true;
                 renderStatus(items.length ? 'Trending GIFs' : 'No trending GIFs');
                 renderResults(items);
@@ -873,7 +873,7 @@
       const clickable = t.closest('img[data-image-viewer]');
       if (clickable && clickable instanceof HTMLImageElement) {
         e.preventDefault();
-        open(clickable.currentSrc || clickable.src, clickable.alt || 'Image');
+        open(clickable.dataset.fullSrc || clickable.currentSrc || clickable.src, clickable.alt || 'Image');
         return;
       }
 